@@ -9,7 +9,7 @@ class Task(db.Model):
     __tablename__ = 'tasks'
     
     id = db.Column(db.Integer, primary_key=True)
-    task_type = db.Column(db.String(20), nullable=False)  # 'training' or 'prediction'
+    task_type = db.Column(db.String(20), nullable=False)  # 'training', 'tuning' or 'prediction'
     data_type = db.Column(db.String(20), nullable=False)  # 'weather', 'electricity', 'traffic'
     model_type = db.Column(db.String(20), nullable=False)  # 'qwen', 'lstm'
     
@@ -80,6 +80,12 @@ class Model(db.Model):
     validation_mae = db.Column(db.Float)
     validation_rmse = db.Column(db.Float)
     
+    # int8量化副本及其验证集指标
+    quantized_path = db.Column(db.String(255))
+    quantized_mse = db.Column(db.Float)
+    quantized_mae = db.Column(db.Float)
+    quantized_rmse = db.Column(db.Float)
+    
     # 时间戳
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -100,6 +106,10 @@ class Model(db.Model):
             'validation_mse': self.validation_mse,
             'validation_mae': self.validation_mae,
             'validation_rmse': self.validation_rmse,
+            'quantized_path': self.quantized_path,
+            'quantized_mse': self.quantized_mse,
+            'quantized_mae': self.quantized_mae,
+            'quantized_rmse': self.quantized_rmse,
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'updated_at': self.updated_at.isoformat() if self.updated_at else None,
             'is_active': self.is_active
@@ -116,6 +126,8 @@ class Dataset(db.Model):
     # 文件信息
     file_path = db.Column(db.String(255), nullable=False)
     file_size = db.Column(db.Integer)  # bytes
+    content_hash = db.Column(db.String(64), index=True)  # sha256, 用于上传去重
+    cache_path = db.Column(db.String(255))  # 列式缓存目录
     
     # 数据统计
     num_samples = db.Column(db.Integer)
@@ -125,6 +137,7 @@ class Dataset(db.Model):
     
     # 预处理信息
     preprocessing_config = db.Column(db.Text)  # JSON string
+    profile = db.Column(db.Text)  # JSON string, 导入时计算的数据集画像
     
     # 时间戳
     uploaded_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -136,10 +149,24 @@ class Dataset(db.Model):
             'data_type': self.data_type,
             'file_path': self.file_path,
             'file_size': self.file_size,
+            'cache_path': self.cache_path,
+            'content_hash': self.content_hash,
             'num_samples': self.num_samples,
             'num_features': self.num_features,
             'time_range_start': self.time_range_start.isoformat() if self.time_range_start else None,
             'time_range_end': self.time_range_end.isoformat() if self.time_range_end else None,
             'preprocessing_config': json.loads(self.preprocessing_config) if self.preprocessing_config else {},
+            'has_profile': bool(self.profile),
             'uploaded_at': self.uploaded_at.isoformat() if self.uploaded_at else None
         }
+    
+    def get_profile(self):
+        return json.loads(self.profile) if self.profile else None
+    
+    def set_profile(self, profile):
+        """保存画像并同步时间范围字段"""
+        self.profile = json.dumps(profile, ensure_ascii=False, default=str)
+        time_range = profile.get('time_range')
+        if time_range:
+            self.time_range_start = datetime.fromisoformat(time_range['start'])
+            self.time_range_end = datetime.fromisoformat(time_range['end'])
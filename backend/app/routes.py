@@ -2,23 +2,60 @@ from flask import Blueprint, request, jsonify, send_file
 from flask_cors import cross_origin
 import os
 import json
+import uuid
+import hashlib
 from datetime import datetime
 from werkzeug.utils import secure_filename
 from loguru import logger
 
 from app.models import db, Task, Model, Dataset
-from app.tasks import training_task, prediction_task, model_comparison_task
+from app.tasks import training_task, tuning_task, prediction_task, model_comparison_task
 from utils.data_processor import TimeSeriesProcessor, DataValidator
+from utils.series_pyramid import SeriesPyramid, rows_for_time_range
+from utils.columnar_cache import KIND_FLOAT, KIND_DATETIME
+from utils.stream_sessions import StreamSessionManager
 from config.config import Config
 
 # 创建蓝图
 api = Blueprint('api', __name__, url_prefix='/api')
 
+# 流式推理会话（进程内存中保存，随进程重启失效）
+stream_sessions = StreamSessionManager(
+    ttl_seconds=Config.STREAM_SESSION_TTL,
+    max_sessions=Config.STREAM_MAX_SESSIONS,
+    max_models=Config.STREAM_MODEL_CACHE_SIZE,
+    rewarm_steps=Config.STREAM_REWARM_STEPS
+)
+
 def allowed_file(filename):
     """检查文件扩展名是否允许"""
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in Config.ALLOWED_EXTENSIONS
 
+def save_upload(file, file_path, chunk_size=None):
+    """分块保存上传文件，同时计算内容的SHA-256"""
+    chunk_size = chunk_size or Config.UPLOAD_CHUNK_SIZE
+    digest = hashlib.sha256()
+    
+    with open(file_path, 'wb') as f:
+        while True:
+            chunk = file.stream.read(chunk_size)
+            if not chunk:
+                break
+            digest.update(chunk)
+            f.write(chunk)
+    
+    return digest.hexdigest()
+
+def find_duplicate_dataset(content_hash):
+    """查找内容相同且文件仍存在的数据集"""
+    candidates = Dataset.query.filter(Dataset.content_hash == content_hash)\
+        .order_by(Dataset.uploaded_at.asc()).all()
+    for candidate in candidates:
+        if os.path.exists(candidate.file_path):
+            return candidate
+    return None
+
 @api.route('/health', methods=['GET'])
 @cross_origin()
 def health_check():
@@ -51,61 +88,128 @@ def upload_file():
         upload_dir = Config.UPLOAD_FOLDER
         os.makedirs(upload_dir, exist_ok=True)
         
-        # 保存文件
+        # 分块保存文件并计算内容哈希；未成功登记为数据集的文件在 finally 中删除
         filename = secure_filename(file.filename)
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        new_filename = f"{timestamp}_{filename}"
-        file_path = os.path.join(upload_dir, new_filename)
-        file.save(file_path)
-        
-        # 分析数据
-        processor = TimeSeriesProcessor()
-        df = processor.load_data(file_path)
-        analysis = processor.analyze_data(df)
-        
-        # 数据验证
-        validator = DataValidator()
-        numeric_columns = analysis['numeric_columns']
-        
-        if not numeric_columns:
-            return jsonify({'error': '文件中没有数值列'}), 400
-        
-        # 默认使用第一个数值列作为目标列
-        target_column = numeric_columns[0]
-        validation_results = validator.validate_time_series(df, target_column)
-        
-        # 创建数据集记录
-        dataset = Dataset(
-            name=dataset_name or filename,
-            data_type=data_type,
-            file_path=file_path,
-            file_size=os.path.getsize(file_path),
-            num_samples=analysis['shape'][0],
-            num_features=analysis['shape'][1],
-            preprocessing_config=json.dumps({
-                'target_column': target_column,
-                'numeric_columns': numeric_columns
+        incoming_path = os.path.join(upload_dir, f".incoming_{uuid.uuid4().hex}")
+        pending_path = incoming_path
+        try:
+            content_hash = save_upload(file, incoming_path)
+            
+            # 内容已存在时复用已有文件、缓存和画像
+            existing = find_duplicate_dataset(content_hash)
+            if existing is not None:
+                return _register_duplicate_upload(existing, dataset_name or filename, data_type)
+            
+            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+            new_filename = f"{timestamp}_{filename}"
+            file_path = os.path.join(upload_dir, new_filename)
+            os.replace(incoming_path, file_path)
+            pending_path = file_path
+            
+            # 单遍流式导入：写入列式缓存并同时计算统计信息
+            processor = TimeSeriesProcessor()
+            ingest_result = processor.ingest(file_path, chunksize=Config.CACHE_CHUNK_SIZE)
+            cache_path = ingest_result['cache_path']
+            analysis = ingest_result['analysis']
+            
+            # 数据验证
+            validator = DataValidator()
+            numeric_columns = analysis['numeric_columns']
+            
+            if not numeric_columns:
+                return jsonify({'error': '文件中没有数值列'}), 400
+            
+            # 默认使用第一个数值列作为目标列
+            target_column = numeric_columns[0]
+            validation_results = validator.validate_from_profile(ingest_result['profile'], target_column)
+            
+            # 创建数据集记录
+            dataset = Dataset(
+                name=dataset_name or filename,
+                data_type=data_type,
+                file_path=file_path,
+                file_size=os.path.getsize(file_path),
+                cache_path=cache_path,
+                content_hash=content_hash,
+                num_samples=analysis['shape'][0],
+                num_features=analysis['shape'][1],
+                preprocessing_config=json.dumps({
+                    'target_column': target_column,
+                    'numeric_columns': numeric_columns
+                })
+            )
+            dataset.set_profile(ingest_result['profile'])
+            
+            db.session.add(dataset)
+            db.session.commit()
+            pending_path = None
+            
+            logger.info(f"文件上传成功: {file_path}, 数据集ID: {dataset.id}")
+            
+            return jsonify({
+                'message': '文件上传成功',
+                'dataset_id': dataset.id,
+                'file_path': file_path,
+                'analysis': analysis,
+                'validation': validation_results,
+                'target_column': target_column
             })
-        )
-        
-        db.session.add(dataset)
-        db.session.commit()
-        
-        logger.info(f"文件上传成功: {file_path}, 数据集ID: {dataset.id}")
-        
-        return jsonify({
-            'message': '文件上传成功',
-            'dataset_id': dataset.id,
-            'file_path': file_path,
-            'analysis': analysis,
-            'validation': validation_results,
-            'target_column': target_column
-        })
+        finally:
+            if pending_path is not None and os.path.exists(pending_path):
+                os.remove(pending_path)
         
     except Exception as e:
         logger.error(f"文件上传失败: {e}")
         return jsonify({'error': str(e)}), 500
 
+def _register_duplicate_upload(existing, name, data_type):
+    """为重复内容的上传创建新的数据集记录，指向已有的文件、缓存和画像"""
+    processor = TimeSeriesProcessor()
+    profile = existing.get_profile()
+    if profile is None:
+        profile = processor.profile_dataset(existing.file_path, chunksize=Config.CACHE_CHUNK_SIZE)
+        existing.set_profile(profile)
+    
+    analysis = processor.analysis_from_profile(profile)
+    numeric_columns = analysis['numeric_columns']
+    if not numeric_columns:
+        return jsonify({'error': '文件中没有数值列'}), 400
+    
+    preprocessing_config = json.loads(existing.preprocessing_config) if existing.preprocessing_config else {}
+    target_column = preprocessing_config.get('target_column', numeric_columns[0])
+    validation_results = DataValidator.validate_from_profile(profile, target_column)
+    
+    dataset = Dataset(
+        name=name,
+        data_type=data_type,
+        file_path=existing.file_path,
+        file_size=existing.file_size,
+        cache_path=existing.cache_path,
+        content_hash=existing.content_hash,
+        num_samples=existing.num_samples,
+        num_features=existing.num_features,
+        preprocessing_config=json.dumps({
+            'target_column': target_column,
+            'numeric_columns': numeric_columns
+        })
+    )
+    dataset.set_profile(profile)
+    
+    db.session.add(dataset)
+    db.session.commit()
+    
+    logger.info(f"上传内容与数据集 {existing.id} 相同，复用已有文件: {existing.file_path}, 数据集ID: {dataset.id}")
+    
+    return jsonify({
+        'message': '文件上传成功',
+        'dataset_id': dataset.id,
+        'file_path': existing.file_path,
+        'analysis': analysis,
+        'validation': validation_results,
+        'target_column': target_column,
+        'deduplicated_from': existing.id
+    })
+
 @api.route('/datasets', methods=['GET'])
 @cross_origin()
 def get_datasets():
@@ -122,25 +226,137 @@ def get_datasets():
 @api.route('/datasets/<int:dataset_id>', methods=['GET'])
 @cross_origin()
 def get_dataset(dataset_id):
-    """获取数据集详情"""
+    """获取数据集详情，支持 offset/limit 分页和 columns 列投影"""
     try:
         dataset = Dataset.query.get_or_404(dataset_id)
         
-        # 读取数据前几行作为预览
+        offset = max(0, request.args.get('offset', 0, type=int))
+        limit = request.args.get('limit', Config.PREVIEW_DEFAULT_ROWS, type=int)
+        limit = min(max(0, limit), Config.PREVIEW_MAX_ROWS)
+        
+        # 从列式缓存按行范围读取，不解析整个文件
         processor = TimeSeriesProcessor()
-        df = processor.load_data(dataset.file_path)
-        preview_data = df.head(10).to_dict('records')
+        cache = processor.open_cache(dataset.file_path, chunksize=Config.CACHE_CHUNK_SIZE)
+        
+        if dataset.cache_path != cache.cache_dir:
+            dataset.cache_path = cache.cache_dir
+            db.session.commit()
+        
+        columns = request.args.get('columns')
+        if columns:
+            columns = [col for col in columns.split(',') if col]
+            unknown = [col for col in columns if col not in cache.columns]
+            if unknown:
+                return jsonify({'error': f'列不存在: {unknown}'}), 400
+        
+        preview_data = cache.read_records(columns or None, offset=offset, limit=limit)
         
         return jsonify({
             'dataset': dataset.to_dict(),
             'preview': preview_data,
-            'columns': list(df.columns),
-            'shape': df.shape
+            'columns': cache.columns,
+            'shape': cache.shape,
+            'offset': offset,
+            'limit': limit
         })
     except Exception as e:
         logger.error(f"获取数据集详情失败: {e}")
         return jsonify({'error': str(e)}), 500
 
+@api.route('/datasets/<int:dataset_id>/profile', methods=['GET'])
+@cross_origin()
+def get_dataset_profile(dataset_id):
+    """获取数据集画像，画像在导入时计算并保存，不读取原始文件"""
+    try:
+        dataset = Dataset.query.get_or_404(dataset_id)
+        
+        profile = dataset.get_profile()
+        if profile is None:
+            # 早期上传的数据集没有画像，基于列式缓存补算一次
+            processor = TimeSeriesProcessor()
+            profile = processor.profile_dataset(dataset.file_path, chunksize=Config.CACHE_CHUNK_SIZE)
+            dataset.set_profile(profile)
+            db.session.commit()
+        
+        return jsonify({
+            'dataset_id': dataset.id,
+            'profile': profile
+        })
+    except Exception as e:
+        logger.error(f"获取数据集画像失败: {e}")
+        return jsonify({'error': str(e)}), 500
+
+def _parse_row_bound(value, name):
+    """解析行号范围参数，不是非负整数时抛出 ValueError"""
+    try:
+        row = int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f'{name} 必须是整数行号: {value}')
+    if row < 0:
+        raise ValueError(f'{name} 不能为负数: {value}')
+    return row
+
+@api.route('/datasets/<int:dataset_id>/series', methods=['GET'])
+@cross_origin()
+def get_dataset_series(dataset_id):
+    """获取降采样后的序列数据，用于大数据集图表展示
+    
+    参数: column（数值列名）, start/end（有时间列时为毫秒时间戳或ISO时间，否则为行号）, max_points（返回点数上限）
+    """
+    try:
+        dataset = Dataset.query.get_or_404(dataset_id)
+        
+        column = request.args.get('column')
+        max_points = request.args.get('max_points', Config.SERIES_DEFAULT_POINTS, type=int)
+        max_points = min(max(2, max_points), Config.SERIES_MAX_POINTS)
+        
+        processor = TimeSeriesProcessor()
+        cache = processor.open_cache(dataset.file_path, chunksize=Config.CACHE_CHUNK_SIZE)
+        kinds = cache.kinds
+        
+        if column is None:
+            column = next((name for name, kind in kinds.items() if kind == KIND_FLOAT), None)
+        if column not in kinds or kinds[column] != KIND_FLOAT:
+            return jsonify({'error': f'数值列不存在: {column}'}), 400
+        
+        # 有时间列时按时间范围查询，x轴为毫秒时间戳
+        time_column = next((name for name, kind in kinds.items() if kind == KIND_DATETIME), None)
+        start, end = request.args.get('start'), request.args.get('end')
+        try:
+            if time_column:
+                row_start, row_stop = rows_for_time_range(cache, time_column, start, end)
+            else:
+                row_start = _parse_row_bound(start, 'start') if start is not None else 0
+                row_stop = _parse_row_bound(end, 'end') + 1 if end is not None else cache.num_rows
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        if row_start > row_stop:
+            return jsonify({'error': 'start 不能大于 end'}), 400
+        
+        pyramid = SeriesPyramid(cache, column)
+        if not pyramid.levels:
+            pyramid = SeriesPyramid.build(cache, column, chunksize=Config.CACHE_CHUNK_SIZE)
+        result = pyramid.query(row_start, row_stop, max_points)
+        
+        rows = result['rows']
+        if time_column and len(rows):
+            times = cache.column(time_column).view('int64')
+            x = (times[rows] // 1_000_000).tolist()
+        else:
+            x = rows.tolist()
+        
+        return jsonify({
+            'column': column,
+            'time_column': time_column,
+            'points': [[xi, float(yi)] for xi, yi in zip(x, result['values'])],
+            'level': result['level'],
+            'bucket_size': pyramid.bucket_size(result['level']) if result['level'] is not None else 1,
+            'row_range': [row_start, row_stop]
+        })
+    except Exception as e:
+        logger.error(f"获取序列数据失败: {e}")
+        return jsonify({'error': str(e)}), 500
+
 @api.route('/train', methods=['POST'])
 @cross_origin()
 def start_training():
@@ -192,7 +408,8 @@ def start_training():
             data_path=dataset.file_path,
             model_config=model_config,
             data_type=data_type,
-            model_type=model_type
+            model_type=model_type,
+            dataset_id=dataset.id
         )
         
         logger.info(f"训练任务已启动: {task.id}")
@@ -207,6 +424,89 @@ def start_training():
         logger.error(f"启动训练任务失败: {e}")
         return jsonify({'error': str(e)}), 500
 
+@api.route('/tune', methods=['POST'])
+@cross_origin()
+def start_tuning():
+    """开始LSTM超参数搜索任务"""
+    try:
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            return jsonify({'error': '请求体必须是JSON对象'}), 400
+        
+        # 验证请求参数
+        required_fields = ['dataset_id', 'data_type']
+        for field in required_fields:
+            if field not in data:
+                return jsonify({'error': f'缺少必需字段: {field}'}), 400
+        
+        dataset_id = data['dataset_id']
+        data_type = data['data_type']
+        tune_config = data.get('tune_config') or {}
+        
+        if data_type not in Config.SUPPORTED_TASKS:
+            return jsonify({'error': f'不支持的任务类型: {data_type}'}), 400
+        if not isinstance(tune_config, dict):
+            return jsonify({'error': 'tune_config 必须是JSON对象'}), 400
+        
+        # 验证搜索空间和试验数量
+        search_space = tune_config.get('search_space') or {}
+        if not isinstance(search_space, dict):
+            return jsonify({'error': 'search_space 必须是JSON对象'}), 400
+        unknown = set(search_space) - set(Config.TUNING_SEARCH_SPACE)
+        if unknown:
+            return jsonify({'error': f'不支持的超参数: {sorted(unknown)}'}), 400
+        if any(not isinstance(v, list) or len(v) == 0 for v in search_space.values()):
+            return jsonify({'error': '搜索空间的每个超参数必须是非空列表'}), 400
+        for key in ('n_trials', 'max_workers'):
+            value = tune_config.get(key)
+            if value is not None and (isinstance(value, bool) or not isinstance(value, int) or value < 1):
+                return jsonify({'error': f'{key} 必须是正整数'}), 400
+        
+        # 限制试验数量和并行度
+        tune_config['n_trials'] = min(tune_config.get('n_trials') or Config.TUNING_MAX_TRIALS, Config.TUNING_MAX_TRIALS)
+        tune_config['max_workers'] = min(tune_config.get('max_workers') or Config.TUNING_MAX_WORKERS, Config.TUNING_MAX_WORKERS)
+        
+        # 获取数据集
+        dataset = Dataset.query.get(dataset_id)
+        if not dataset:
+            return jsonify({'error': f'数据集 {dataset_id} 不存在'}), 404
+        
+        # 创建任务记录
+        task = Task(
+            task_type='tuning',
+            data_type=data_type,
+            model_type='lstm',
+            parameters=json.dumps({
+                'dataset_id': dataset_id,
+                'tune_config': tune_config
+            }),
+            data_file_path=dataset.file_path
+        )
+        
+        db.session.add(task)
+        db.session.commit()
+        
+        # 启动异步搜索任务
+        tuning_task.delay(
+            task_id=task.id,
+            data_path=dataset.file_path,
+            tune_config=tune_config,
+            data_type=data_type,
+            dataset_id=dataset.id
+        )
+        
+        logger.info(f"超参数搜索任务已启动: {task.id}")
+        
+        return jsonify({
+            'message': '超参数搜索任务已启动',
+            'task_id': task.id,
+            'status': task.status
+        })
+        
+    except Exception as e:
+        logger.error(f"启动超参数搜索任务失败: {e}")
+        return jsonify({'error': str(e)}), 500
+
 @api.route('/predict', methods=['POST'])
 @cross_origin()
 def start_prediction():
@@ -232,6 +532,27 @@ def start_prediction():
         if not isinstance(input_sequence, list) or len(input_sequence) == 0:
             return jsonify({'error': '输入序列必须是非空列表'}), 400
         
+        # 二维列表表示多个序列一起预测
+        multi_series = all(isinstance(seq, list) for seq in input_sequence)
+        if multi_series and (len({len(seq) for seq in input_sequence}) != 1 or len(input_sequence[0]) == 0):
+            return jsonify({'error': '多个输入序列必须是等长的非空列表'}), 400
+        if not multi_series and any(isinstance(seq, list) for seq in input_sequence):
+            return jsonify({'error': '输入序列必须是数值列表或数值列表的列表'}), 400
+        
+        # 全局多序列模型：series_id（单个序列）或 series_ids（与多个输入序列一一对应）
+        series_id = data.get('series_id')
+        series_ids = data.get('series_ids')
+        if multi_series and series_ids is None and series_id is not None:
+            series_ids = [series_id] * len(input_sequence)
+        if series_ids is not None and (not multi_series or len(series_ids) != len(input_sequence)):
+            return jsonify({'error': 'series_ids 必须与多个输入序列一一对应'}), 400
+        
+        # 验证预测步数
+        horizon = data.get('horizon', 1)
+        # bool 是 int 的子类，需要单独排除
+        if isinstance(horizon, bool) or not isinstance(horizon, int) or not 1 <= horizon <= Config.MAX_PREDICTION_HORIZON:
+            return jsonify({'error': f'horizon 必须是 1 到 {Config.MAX_PREDICTION_HORIZON} 之间的整数'}), 400
+        
         # 创建任务记录
         task = Task(
             task_type='prediction',
@@ -239,7 +560,10 @@ def start_prediction():
             model_type=model.model_type,
             parameters=json.dumps({
                 'model_id': model_id,
-                'input_sequence': input_sequence
+                'input_sequence': input_sequence,
+                'horizon': horizon,
+                'series_id': series_id,
+                'series_ids': series_ids
             })
         )
         
@@ -250,7 +574,13 @@ def start_prediction():
         prediction_task.delay(
             task_id=task.id,
             model_id=model_id,
-            input_data={'sequence': input_sequence}
+            input_data={
+                'sequence': input_sequence,
+                'horizon': horizon,
+                'multi_series': multi_series,
+                'series_id': series_id,
+                'series_ids': series_ids
+            }
         )
         
         logger.info(f"预测任务已启动: {task.id}")
@@ -265,6 +595,74 @@ def start_prediction():
         logger.error(f"启动预测任务失败: {e}")
         return jsonify({'error': str(e)}), 500
 
+@api.route('/stream/sessions', methods=['POST'])
+@cross_origin()
+def open_stream_session():
+    """创建流式推理会话：用一个完整窗口预热LSTM隐藏状态（同步返回，不经过Celery）"""
+    try:
+        data = request.get_json()
+        
+        required_fields = ['model_id', 'series_id', 'input_sequence']
+        for field in required_fields:
+            if field not in data:
+                return jsonify({'error': f'缺少必需字段: {field}'}), 400
+        
+        model = Model.query.get(data['model_id'])
+        if not model:
+            return jsonify({'error': f"模型 {data['model_id']} 不存在"}), 404
+        if model.model_type != 'lstm':
+            return jsonify({'error': '流式推理只支持LSTM模型'}), 400
+        
+        input_sequence = data['input_sequence']
+        if not isinstance(input_sequence, list) or len(input_sequence) == 0:
+            return jsonify({'error': '输入序列必须是非空列表'}), 400
+        
+        session = stream_sessions.open(str(data['series_id']), model.id, model.model_path, input_sequence,
+                                       model_series=data.get('model_series'))
+        return jsonify(session)
+        
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"创建流式推理会话失败: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@api.route('/stream/sessions/<series_id>/observe', methods=['POST'])
+@cross_origin()
+def observe_stream_session(series_id):
+    """向会话追加观测值并返回下一步预测，每个观测值只做一次LSTM单步计算"""
+    try:
+        data = request.get_json()
+        
+        values = data.get('values', [data['value']] if 'value' in data else None)
+        if not isinstance(values, list) or len(values) == 0:
+            return jsonify({'error': '缺少必需字段: value 或 values'}), 400
+        
+        session = stream_sessions.get(series_id)
+        if session is None:
+            return jsonify({'error': f'会话 {series_id} 不存在或已过期'}), 404
+        
+        model = Model.query.get(session.model_id)
+        if not model:
+            stream_sessions.close(series_id)
+            return jsonify({'error': f'模型 {session.model_id} 不存在'}), 404
+        
+        return jsonify(stream_sessions.observe(series_id, values, model.model_path))
+        
+    except KeyError as e:
+        return jsonify({'error': str(e)}), 404
+    except Exception as e:
+        logger.error(f"流式推理失败: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@api.route('/stream/sessions/<series_id>', methods=['DELETE'])
+@cross_origin()
+def close_stream_session(series_id):
+    """关闭流式推理会话"""
+    if not stream_sessions.close(series_id):
+        return jsonify({'error': f'会话 {series_id} 不存在'}), 404
+    return jsonify({'message': '会话已关闭'})
+
 @api.route('/tasks', methods=['GET'])
 @cross_origin()
 def get_tasks():
@@ -384,6 +782,9 @@ def delete_model(model_id):
         model.is_active = False
         db.session.commit()
         
+        # 释放流式推理缓存的模型
+        stream_sessions.models.discard(model_id)
+        
         return jsonify({'message': '模型已删除'})
         
     except Exception as e:
@@ -477,6 +878,7 @@ def generate_sample_data():
             num_samples=num_samples,
             save_path=file_path
         )
+        ingest_result = processor.ingest(file_path, chunksize=Config.CACHE_CHUNK_SIZE)
         
         # 创建数据集记录
         dataset = Dataset(
@@ -484,9 +886,11 @@ def generate_sample_data():
             data_type=data_type,
             file_path=file_path,
             file_size=os.path.getsize(file_path),
+            cache_path=ingest_result['cache_path'],
             num_samples=len(df),
             num_features=len(df.columns)
         )
+        dataset.set_profile(ingest_result['profile'])
         
         db.session.add(dataset)
         db.session.commit()
@@ -5,9 +5,10 @@ import json
 from typing import Dict, Optional
 from loguru import logger
 
-from app.models import db, Task, Model as ModelRecord
-from utils.model_trainer import ModelTrainer, ModelPredictor
+from app.models import db, Task, Model as ModelRecord, Dataset
+from utils.model_predictor import ModelPredictor
 from utils.data_processor import TimeSeriesProcessor
+from utils.metrics import StreamingMetrics
 from config.config import Config
 
 # 创建Celery实例
@@ -26,7 +27,7 @@ celery.conf.update(
 
 @celery.task(bind=True)
 def training_task(self, task_id: int, data_path: str, model_config: Dict, 
-                 data_type: str, model_type: str):
+                 data_type: str, model_type: str, dataset_id: Optional[int] = None):
     """训练模型的Celery任务"""
     
     try:
@@ -42,7 +43,9 @@ def training_task(self, task_id: int, data_path: str, model_config: Dict,
         task_record.progress = 0.1
         db.session.commit()
         
-        # 初始化训练器
+        # 初始化训练器（训练依赖 torch/transformers，只在训练任务中导入）
+        from utils.model_trainer import ModelTrainer
+        
         trainer = ModelTrainer(working_dir=f"./workspace/task_{task_id}")
         
         # 准备数据
@@ -50,16 +53,25 @@ def training_task(self, task_id: int, data_path: str, model_config: Dict,
         task_record.progress = 0.2
         db.session.commit()
         
+        # 复用上传时保存的数据集画像
+        dataset = Dataset.query.get(dataset_id) if dataset_id else None
+        profile = dataset.get_profile() if dataset else None
+        
         # 确定目标列
         processor = TimeSeriesProcessor()
         df = processor.load_data(data_path)
-        target_column = df.select_dtypes(include=['number']).columns[0]  # 使用第一个数值列
+        if profile and profile['numeric_columns']:
+            target_column = profile['numeric_columns'][0]  # 使用第一个数值列
+        else:
+            target_column = df.select_dtypes(include=['number']).columns[0]  # 使用第一个数值列
         
         data_info = trainer.prepare_data(
             data_path=data_path,
             data_type=data_type,
             target_column=target_column,
-            sequence_length=model_config.get('sequence_length', 10)
+            sequence_length=model_config.get('sequence_length', 10),
+            df=df,
+            profile=profile
         )
         
         # 训练模型
@@ -101,6 +113,14 @@ def training_task(self, task_id: int, data_path: str, model_config: Dict,
             validation_rmse=results['metrics']['rmse']
         )
         
+        # 记录量化副本的验证集指标
+        quantized = results.get('quantized')
+        if quantized and quantized.get('metrics'):
+            model_record.quantized_path = os.path.join(results['model_path'], quantized['file'])
+            model_record.quantized_mse = quantized['metrics']['mse']
+            model_record.quantized_mae = quantized['metrics']['mae']
+            model_record.quantized_rmse = quantized['metrics']['rmse']
+        
         db.session.add(model_record)
         
         # 更新任务状态
@@ -148,6 +168,127 @@ def training_task(self, task_id: int, data_path: str, model_config: Dict,
         
         raise
 
+@celery.task(bind=True)
+def tuning_task(self, task_id: int, data_path: str, tune_config: Dict,
+                data_type: str, dataset_id: Optional[int] = None):
+    """LSTM超参数搜索任务，完成后把最佳配置注册为模型记录"""
+    
+    try:
+        logger.info(f"开始执行超参数搜索任务: {task_id}, 数据类型: {data_type}")
+        
+        # 更新任务状态
+        task_record = Task.query.get(task_id)
+        if not task_record:
+            raise ValueError(f"任务 {task_id} 不存在")
+        
+        task_record.status = 'running'
+        task_record.started_at = datetime.utcnow()
+        task_record.progress = 0.1
+        db.session.commit()
+        
+        from utils.model_trainer import ModelTrainer
+        
+        trainer = ModelTrainer(working_dir=f"./workspace/task_{task_id}")
+        
+        # 确定目标列
+        self.update_state(state='PROGRESS', meta={'progress': 10, 'status': '准备数据中...'})
+        dataset = Dataset.query.get(dataset_id) if dataset_id else None
+        profile = dataset.get_profile() if dataset else None
+        
+        processor = TimeSeriesProcessor()
+        df = processor.load_data(data_path)
+        if profile and profile['numeric_columns']:
+            target_column = profile['numeric_columns'][0]  # 使用第一个数值列
+        else:
+            target_column = df.select_dtypes(include=['number']).columns[0]  # 使用第一个数值列
+        
+        def report_progress(rung: int, total: int):
+            progress = 0.1 + 0.8 * rung / total
+            task_record.progress = progress
+            db.session.commit()
+            self.update_state(state='PROGRESS', meta={
+                'progress': int(progress * 100),
+                'status': f'逐次减半第 {rung}/{total} 轮完成'
+            })
+        
+        results = trainer.tune_lstm_model(
+            df=df,
+            target_column=target_column,
+            tune_config=tune_config,
+            data_type=data_type,
+            task_id=str(task_id),
+            progress_callback=report_progress,
+            profile=profile
+        )
+        
+        # 保存最佳配置的模型记录
+        self.update_state(state='PROGRESS', meta={'progress': 90, 'status': '保存模型信息...'})
+        
+        model_record = ModelRecord(
+            name=f"lstm_{data_type}_{task_id}_tuned",
+            model_type='lstm',
+            data_type=data_type,
+            model_path=results['model_path'],
+            training_task_id=task_id,
+            training_parameters=json.dumps(results['best_config']),
+            validation_mse=results['metrics']['mse'],
+            validation_mae=results['metrics']['mae'],
+            validation_rmse=results['metrics']['rmse']
+        )
+        
+        quantized = results.get('quantized')
+        if quantized and quantized.get('metrics'):
+            model_record.quantized_path = os.path.join(results['model_path'], quantized['file'])
+            model_record.quantized_mse = quantized['metrics']['mse']
+            model_record.quantized_mae = quantized['metrics']['mae']
+            model_record.quantized_rmse = quantized['metrics']['rmse']
+        
+        db.session.add(model_record)
+        
+        # 更新任务状态
+        task_record.status = 'completed'
+        task_record.completed_at = datetime.utcnow()
+        task_record.progress = 1.0
+        task_record.model_file_path = results['model_path']
+        task_record.mse = results['metrics']['mse']
+        task_record.mae = results['metrics']['mae']
+        task_record.rmse = results['metrics']['rmse']
+        task_record.result_file_path = os.path.join(
+            trainer.working_dir, "results", f"lstm_tuning_{data_type}_{task_id}_results.json"
+        )
+        
+        db.session.commit()
+        
+        logger.info(f"超参数搜索任务 {task_id} 完成成功，最佳配置: {results['best_config']}")
+        
+        return {
+            'status': 'completed',
+            'best_config': results['best_config'],
+            'metrics': results['metrics'],
+            'model_id': model_record.id
+        }
+        
+    except Exception as e:
+        logger.error(f"超参数搜索任务 {task_id} 失败: {e}")
+        
+        # 更新任务状态为失败
+        task_record = Task.query.get(task_id)
+        if task_record:
+            task_record.status = 'failed'
+            task_record.error_message = str(e)
+            task_record.completed_at = datetime.utcnow()
+            db.session.commit()
+        
+        self.update_state(
+            state='FAILURE',
+            meta={
+                'error': str(e),
+                'task_id': task_id
+            }
+        )
+        
+        raise
+
 @celery.task(bind=True)
 def prediction_task(self, task_id: int, model_id: int, input_data: Dict):
     """预测任务"""
@@ -171,7 +312,11 @@ def prediction_task(self, task_id: int, model_id: int, input_data: Dict):
             raise ValueError(f"模型 {model_id} 不存在")
         
         # 初始化预测器
-        predictor = ModelPredictor()
+        predictor = ModelPredictor(
+            lstm_backend=Config.LSTM_INFERENCE_BACKEND,
+            quantized_tolerance=Config.LSTM_QUANTIZED_TOLERANCE,
+            qwen_batch_size=Config.QWEN_GENERATION_BATCH_SIZE
+        )
         
         # 加载模型
         self.update_state(state='PROGRESS', meta={'progress': 30, 'status': '加载模型...'})
@@ -191,11 +336,26 @@ def prediction_task(self, task_id: int, model_id: int, input_data: Dict):
         db.session.commit()
         
         input_sequence = input_data['sequence']
-        prediction = predictor.predict(
-            model_type=model_record.model_type,
-            input_sequence=input_sequence,
-            data_type=model_record.data_type
-        )
+        horizon = input_data.get('horizon', 1)
+        
+        if input_data.get('multi_series'):
+            # 多个序列一起递推预测
+            prediction = predictor.predict_horizon(
+                model_type=model_record.model_type,
+                input_sequences=input_sequence,
+                horizon=horizon,
+                data_type=model_record.data_type,
+                batch_size=Config.PREDICTION_BATCH_SIZE,
+                series_ids=input_data.get('series_ids')
+            )
+        else:
+            prediction = predictor.predict(
+                model_type=model_record.model_type,
+                input_sequence=input_sequence,
+                data_type=model_record.data_type,
+                horizon=horizon,
+                series_id=input_data.get('series_id')
+            )
         
         # 保存预测结果
         self.update_state(state='PROGRESS', meta={'progress': 90, 'status': '保存结果...'})
@@ -205,6 +365,7 @@ def prediction_task(self, task_id: int, model_id: int, input_data: Dict):
         results = {
             'input_sequence': input_sequence,
             'prediction': prediction,
+            'horizon': horizon,
             'model_type': model_record.model_type,
             'data_type': model_record.data_type,
             'model_id': model_id,
@@ -227,7 +388,7 @@ def prediction_task(self, task_id: int, model_id: int, input_data: Dict):
         
         db.session.commit()
         
-        logger.info(f"预测任务 {task_id} 完成成功，预测结果: {prediction}")
+        logger.info(f"预测任务 {task_id} 完成成功，预测步数: {horizon}")
         
         return {
             'status': 'completed',
@@ -282,7 +443,11 @@ def model_comparison_task(self, task_id: int, qwen_model_id: int, lstm_model_id:
             raise ValueError("模型不存在")
         
         # 初始化预测器
-        predictor = ModelPredictor()
+        predictor = ModelPredictor(
+            lstm_backend=Config.LSTM_INFERENCE_BACKEND,
+            quantized_tolerance=Config.LSTM_QUANTIZED_TOLERANCE,
+            qwen_batch_size=Config.QWEN_GENERATION_BATCH_SIZE
+        )
         
         # 加载模型
         self.update_state(state='PROGRESS', meta={'progress': 20, 'status': '加载模型...'})
@@ -296,9 +461,10 @@ def model_comparison_task(self, task_id: int, qwen_model_id: int, lstm_model_id:
         processor = TimeSeriesProcessor()
         test_df = processor.load_data(test_data_path)
         
-        # 创建测试序列
+        # 创建测试序列（滑动窗口视图，不复制数据）
         target_column = test_df.select_dtypes(include=['number']).columns[0]
-        X_test, y_test = processor.create_sequences(test_df, target_column, sequence_length=10)
+        windows = processor.create_windows(test_df, target_column, sequence_length=10)
+        X_test, y_test = windows.X, windows.y
         
         task_record.progress = 0.5
         db.session.commit()
@@ -306,45 +472,26 @@ def model_comparison_task(self, task_id: int, qwen_model_id: int, lstm_model_id:
         # 执行预测
         self.update_state(state='PROGRESS', meta={'progress': 60, 'status': '执行预测...'})
         
-        qwen_predictions = []
-        lstm_predictions = []
+        # LSTM：整个测试集一次向量化批量预测
+        lstm_predictions = predictor.batch_predict('lstm', X_test, batch_size=Config.PREDICTION_BATCH_SIZE)
+        lstm_metrics = StreamingMetrics().update(lstm_predictions, y_test)
         
-        for i, seq in enumerate(X_test):
-            if i % 10 == 0:  # 更新进度
-                progress = 0.6 + 0.25 * (i / len(X_test))
-                task_record.progress = progress
-                db.session.commit()
-            
-            qwen_pred = predictor.predict('qwen', seq.tolist(), qwen_model.data_type)
-            lstm_pred = predictor.predict('lstm', seq.tolist())
+        # Qwen：按块批量生成，每块更新一次进度
+        qwen_metrics = StreamingMetrics()
+        qwen_predictions = []
+        chunk_size = Config.QWEN_GENERATION_BATCH_SIZE * 4
+        for start in range(0, len(X_test), chunk_size):
+            task_record.progress = 0.6 + 0.25 * (start / len(X_test))
+            db.session.commit()
             
-            qwen_predictions.append(qwen_pred)
-            lstm_predictions.append(lstm_pred)
-        
-        # 计算比较指标
-        from sklearn.metrics import mean_squared_error, mean_absolute_error
-        import numpy as np
-        
-        qwen_mse = mean_squared_error(y_test, qwen_predictions)
-        qwen_mae = mean_absolute_error(y_test, qwen_predictions)
-        qwen_rmse = np.sqrt(qwen_mse)
-        
-        lstm_mse = mean_squared_error(y_test, lstm_predictions)
-        lstm_mae = mean_absolute_error(y_test, lstm_predictions)
-        lstm_rmse = np.sqrt(lstm_mse)
+            chunk = predictor.batch_predict('qwen', X_test[start:start + chunk_size], qwen_model.data_type)
+            qwen_metrics.update(chunk, y_test[start:start + chunk_size])
+            qwen_predictions.extend(chunk)
         
         # 生成比较结果
         comparison_results = {
-            'qwen_metrics': {
-                'mse': float(qwen_mse),
-                'mae': float(qwen_mae),
-                'rmse': float(qwen_rmse)
-            },
-            'lstm_metrics': {
-                'mse': float(lstm_mse),
-                'mae': float(lstm_mae),
-                'rmse': float(lstm_rmse)
-            },
+            'qwen_metrics': qwen_metrics.compute(),
+            'lstm_metrics': lstm_metrics.compute(),
             'predictions': {
                 'qwen': qwen_predictions,
                 'lstm': lstm_predictions,
@@ -16,6 +16,7 @@ class Config:
     MAX_SEQUENCE_LENGTH = 512
     QWEN_MODEL_NAME = "Qwen/Qwen2.5-7B-Instruct"
     QWEN_LOCAL_PATH = "./models/qwen"
+    QWEN_GENERATION_BATCH_SIZE = 16  # prompts per generate() call, halved on CUDA OOM
     
     # Training configurations
     BATCH_SIZE = 8
@@ -23,14 +24,42 @@ class Config:
     NUM_EPOCHS = 10
     GRADIENT_ACCUMULATION_STEPS = 4
     
+    # Hyperparameter search
+    TUNING_MAX_TRIALS = 64
+    TUNING_MAX_WORKERS = 4  # processes per tuning task
+    TUNING_SEARCH_SPACE = {  # searchable LSTM hyperparameters; the first value is the default
+        'hidden_size': [32, 64, 128],
+        'num_layers': [1, 2],
+        'sequence_length': [10, 24],
+        'learning_rate': [1e-3, 5e-4]
+    }
+    
     # File upload configurations
     UPLOAD_FOLDER = 'uploads'
     MAX_CONTENT_LENGTH = 100 * 1024 * 1024  # 100MB max file size
     ALLOWED_EXTENSIONS = {'csv', 'xlsx', 'json'}
     
+    # Columnar cache configurations
+    CACHE_CHUNK_SIZE = 100000  # rows per chunk when converting uploads
+    UPLOAD_CHUNK_SIZE = 1024 * 1024  # bytes per read when saving/hashing uploads
+    PREVIEW_DEFAULT_ROWS = 10
+    PREVIEW_MAX_ROWS = 1000
+    SERIES_DEFAULT_POINTS = 2000
+    SERIES_MAX_POINTS = 20000
+    
     # Prediction tasks
     SUPPORTED_TASKS = ['weather', 'electricity', 'traffic']
     SUPPORTED_MODELS = ['qwen', 'lstm']
+    PREDICTION_BATCH_SIZE = 1024  # windows per forward pass in batched inference
+    MAX_PREDICTION_HORIZON = 1000
+    LSTM_INFERENCE_BACKEND = 'auto'  # torch, quantized, torchscript, onnx or auto (int8 within tolerance, then onnx, torchscript, torch)
+    LSTM_QUANTIZED_TOLERANCE = 0.02  # max relative validation MSE increase to serve the int8 model (None: never)
+    
+    # Streaming inference sessions
+    STREAM_SESSION_TTL = 3600  # seconds of inactivity before a session is evicted
+    STREAM_MAX_SESSIONS = 10000
+    STREAM_MODEL_CACHE_SIZE = 4  # loaded models kept in memory for streaming
+    STREAM_REWARM_STEPS = None  # re-warm from the latest window every N steps (None: sequence_length, 0: never)
 
 class DevelopmentConfig(Config):
     DEBUG = True
@@ -4,28 +4,92 @@ import torch.optim as optim
 from torch.utils.data import Dataset, DataLoader
 import numpy as np
 import pandas as pd
-from sklearn.preprocessing import MinMaxScaler
-from sklearn.metrics import mean_squared_error, mean_absolute_error
 import os
-import pickle
-import json
+import copy
 from typing import Tuple, List, Optional
 from loguru import logger
 
+from utils.sliding_window import SlidingWindowView
+from utils.metrics import StreamingMetrics
+from models.lstm_runtime import (
+    TORCHSCRIPT_FILE, ONNX_FILE, QUANTIZED_FILE, ArrayMinMaxScaler, resolve_series_index
+)
+from models.model_bundle import (
+    BUNDLE_FILE, bundle_path, has_bundle, load_model_config, model_dir, read_bundle, write_bundle
+)
+
+CHECKPOINT_FILE = 'checkpoint.pt'
+
 class TimeSeriesDataset(Dataset):
-    """时间序列数据集"""
+    """时间序列数据集，基于零拷贝滑动窗口视图"""
     
-    def __init__(self, data: np.ndarray, sequence_length: int):
+    def __init__(self, data: np.ndarray, sequence_length: int, horizon: int = 1):
         self.data = data
         self.sequence_length = sequence_length
+        self.windows = SlidingWindowView(data, sequence_length, horizon=horizon)
     
     def __len__(self):
-        return len(self.data) - self.sequence_length
+        return len(self.windows)
     
     def __getitem__(self, idx):
-        x = self.data[idx:idx + self.sequence_length]
-        y = self.data[idx + self.sequence_length]
-        return torch.FloatTensor(x), torch.FloatTensor([y])
+        x, y = self.windows[idx]
+        return torch.as_tensor(x, dtype=torch.float32), torch.as_tensor(np.atleast_1d(y), dtype=torch.float32)
+
+class TimeSeriesBatchLoader:
+    """常驻设备的批次加载器
+
+    整个归一化序列保存为一个张量（放在训练设备上），每个批次用窗口起点下标
+    一次向量化索引 series[starts[:, None] + arange(L)] 得到，不做逐样本的
+    张量构造和拼接。迭代输出与 DataLoader(TimeSeriesDataset) 相同：
+    batch_x 形状 (B, sequence_length)，batch_y 形状 (B, horizon)。
+
+    data 为 (时间步, 序列数) 的二维数组时，窗口从所有序列中抽取并在同一批次中
+    混合，全局窗口下标 k 对应第 k // 每列窗口数 个序列。
+    """
+    
+    def __init__(self, data: np.ndarray, sequence_length: int, batch_size: int = 32,
+                 shuffle: bool = False, horizon: int = 1, device=None, seed: Optional[int] = None):
+        self.sequence_length = sequence_length
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.horizon = horizon
+        self.device = device or torch.device('cpu')
+        
+        data = np.asarray(data, dtype=np.float32)
+        if data.ndim == 1 or (data.ndim == 2 and data.shape[1] == 1):
+            data = data.reshape(-1, 1)
+        self.series = torch.as_tensor(data).to(self.device)
+        self.num_series = self.series.shape[1]
+        self.windows_per_series = max(0, self.series.shape[0] - sequence_length - horizon + 1)
+        self.num_windows = self.windows_per_series * self.num_series
+        
+        self.window_offsets = torch.arange(sequence_length, device=self.device)
+        self.target_offsets = torch.arange(sequence_length, sequence_length + horizon, device=self.device)
+        self.generator = torch.Generator(device='cpu')
+        if seed is not None:
+            self.generator.manual_seed(seed)
+    
+    def __len__(self):
+        return (self.num_windows + self.batch_size - 1) // self.batch_size
+    
+    def __iter__(self):
+        for batch_x, batch_y, _ in self.iter_batches():
+            yield batch_x, batch_y
+    
+    def iter_batches(self):
+        """生成 (batch_x, batch_y, 序列下标)"""
+        if self.shuffle:
+            order = torch.randperm(self.num_windows, generator=self.generator).to(self.device)
+        else:
+            order = torch.arange(self.num_windows, device=self.device)
+        
+        for begin in range(0, self.num_windows, self.batch_size):
+            idx = order[begin:begin + self.batch_size]
+            series_idx = (idx // self.windows_per_series).unsqueeze(1)
+            starts = (idx % self.windows_per_series).unsqueeze(1)
+            yield (self.series[starts + self.window_offsets, series_idx],
+                   self.series[starts + self.target_offsets, series_idx],
+                   series_idx.squeeze(1))
 
 class LSTMTimeSeriesModel(nn.Module):
     """LSTM时间序列预测模型"""
@@ -74,9 +138,39 @@ class LSTMTimeSeriesModel(nn.Module):
         output = self.fc(last_output)
         
         return output
+    
+    def forward_with_state(self, x, hidden=None):
+        """带隐藏状态的前向传播，返回 (输出, (h, c))，用于多步递推预测
+
+        hidden 为 None 时从零状态开始；传入上一步返回的状态即可只输入新的时间步。
+        """
+        lstm_out, hidden = self.lstm(x, hidden)
+        output = self.fc(self.dropout(lstm_out[:, -1, :]))
+        return output, hidden
+
+class LSTMStepGraph(nn.Module):
+    """导出用的带状态计算图：输入 (x, h, c)，返回 (输出, h, c)
+
+    与 forward_with_state 相同，但隐藏状态显式作为输入输出，导出后的推理后端
+    可以和即时执行一样先用完整窗口预热，再逐步沿用隐藏状态递推。
+    """
+    
+    def __init__(self, model: LSTMTimeSeriesModel):
+        super(LSTMStepGraph, self).__init__()
+        self.lstm = model.lstm
+        self.fc = model.fc
+        self.dropout = model.dropout
+    
+    def forward(self, x, h, c):
+        lstm_out, (h, c) = self.lstm(x, (h, c))
+        return self.fc(self.dropout(lstm_out[:, -1, :])), h, c
 
 class LSTMPredictor:
-    """LSTM预测器封装类"""
+    """LSTM预测器封装类
+
+    series_names 不为空时为全局多序列模式：一个模型在多列（多个序列）上训练，
+    每个序列单独做MinMax归一化，预测时通过 series_id（序列名或下标）选择归一化参数。
+    """
     
     def __init__(self, sequence_length: int = 10, hidden_size: int = 64, 
                  num_layers: int = 2, dropout: float = 0.2):
@@ -84,37 +178,70 @@ class LSTMPredictor:
         self.hidden_size = hidden_size
         self.num_layers = num_layers
         self.dropout = dropout
+        self.series_names = None
         
         self.model = None
-        self.scaler = MinMaxScaler()
+        # 训练时由 fit_scaler 拟合，加载模型包时为只依赖numpy的 ArrayMinMaxScaler
+        self.scaler = None
         self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
         self.is_trained = False
         
         logger.info(f"初始化LSTM预测器，设备: {self.device}")
     
-    def prepare_data(self, data: pd.DataFrame, train_ratio: float = 0.8) -> Tuple[DataLoader, DataLoader, np.ndarray]:
-        """准备训练和测试数据"""
-        
-        # 提取数值列（假设第一列是目标变量）
-        values = data.iloc[:, 0].values.reshape(-1, 1)
+    def fit_scaler(self, values: np.ndarray) -> np.ndarray:
+        """按列拟合新的MinMax归一化器并返回归一化后的数据（只在训练时导入 sklearn）"""
+        from sklearn.preprocessing import MinMaxScaler
         
-        # 数据归一化
-        scaled_data = self.scaler.fit_transform(values)
+        self.scaler = MinMaxScaler()
+        return self.scaler.fit_transform(values)
+    
+    def prepare_data(self, data: pd.DataFrame, train_ratio: float = 0.8, batch_size: int = 32,
+                     use_batch_loader: bool = True,
+                     columns: Optional[List[str]] = None) -> Tuple[TimeSeriesBatchLoader, TimeSeriesBatchLoader, np.ndarray]:
+        """准备训练和测试数据
+
+        默认返回常驻设备的 TimeSeriesBatchLoader；use_batch_loader=False 时
+        返回基于 TimeSeriesDataset 的 DataLoader。传入 columns 时进入全局多序列
+        模式：每列单独归一化，训练批次中混合来自所有列的窗口。
+        """
+        
+        if columns:
+            # 全局多序列模式：(时间步, 序列数) 矩阵，MinMaxScaler 按列分别归一化
+            self.series_names = [str(col) for col in columns]
+            values = data[columns].apply(pd.to_numeric, errors='coerce').ffill().bfill().to_numpy(dtype=np.float64)
+            if not use_batch_loader:
+                raise ValueError("全局多序列模式需要使用 TimeSeriesBatchLoader")
+        else:
+            # 提取数值列（假设第一列是目标变量）
+            self.series_names = None
+            values = data.iloc[:, 0].values.reshape(-1, 1)
+        
+        # 数据归一化（重新拟合；从模型包加载的归一化器只保存了参数）
+        scaled_data = self.fit_scaler(values)
         
         # 划分训练和测试集
         train_size = int(len(scaled_data) * train_ratio)
         train_data = scaled_data[:train_size]
         test_data = scaled_data[train_size:]
         
-        # 创建数据集
-        train_dataset = TimeSeriesDataset(train_data.flatten(), self.sequence_length)
-        test_dataset = TimeSeriesDataset(test_data.flatten(), self.sequence_length)
-        
-        # 创建数据加载器
-        train_loader = DataLoader(train_dataset, batch_size=32, shuffle=True)
-        test_loader = DataLoader(test_dataset, batch_size=32, shuffle=False)
+        if use_batch_loader:
+            # 整个序列一次放到训练设备上，按批向量化索引
+            train_loader = TimeSeriesBatchLoader(train_data, self.sequence_length, batch_size=batch_size,
+                                                 shuffle=True, device=self.device)
+            test_loader = TimeSeriesBatchLoader(test_data, self.sequence_length, batch_size=batch_size,
+                                                shuffle=False, device=self.device)
+            train_samples, test_samples = train_loader.num_windows, test_loader.num_windows
+        else:
+            # 创建数据集
+            train_dataset = TimeSeriesDataset(train_data.ravel(), self.sequence_length)
+            test_dataset = TimeSeriesDataset(test_data.ravel(), self.sequence_length)
+            
+            # 创建数据加载器
+            train_loader = DataLoader(train_dataset, batch_size=batch_size, shuffle=True)
+            test_loader = DataLoader(test_dataset, batch_size=batch_size, shuffle=False)
+            train_samples, test_samples = len(train_dataset), len(test_dataset)
         
-        logger.info(f"数据准备完成 - 训练样本: {len(train_dataset)}, 测试样本: {len(test_dataset)}")
+        logger.info(f"数据准备完成 - 序列数: {scaled_data.shape[1]}, 训练样本: {train_samples}, 测试样本: {test_samples}")
         
         return train_loader, test_loader, scaled_data
     
@@ -130,10 +257,15 @@ class LSTMPredictor:
         
         logger.info(f"模型构建完成: {sum(p.numel() for p in self.model.parameters())} 参数")
     
-    def train(self, train_loader: DataLoader, val_loader: DataLoader, 
+    def train(self, train_loader, val_loader, 
               num_epochs: int = 100, learning_rate: float = 0.001,
-              patience: int = 10) -> dict:
-        """训练模型"""
+              patience: int = 10, checkpoint_dir: Optional[str] = None,
+              checkpoint_interval: int = 1) -> dict:
+        """训练模型，数据加载器可以是 TimeSeriesBatchLoader 或 DataLoader
+
+        指定 checkpoint_dir 时每 checkpoint_interval 轮保存一次模型、优化器、
+        学习率调度器、早停计数和损失历史；目录中已有检查点时从中断处继续训练。
+        """
         
         if self.model is None:
             self.build_model()
@@ -144,69 +276,57 @@ class LSTMPredictor:
         scheduler = optim.lr_scheduler.ReduceLROnPlateau(optimizer, patience=5, factor=0.5)
         
         # 训练历史
-        train_losses = []
-        val_losses = []
-        best_val_loss = float('inf')
-        patience_counter = 0
+        state = {
+            'epoch': -1,
+            'train_losses': [],
+            'val_losses': [],
+            'best_val_loss': float('inf'),
+            'patience_counter': 0,
+            'stopped': False
+        }
+        
+        checkpoint_path = os.path.join(checkpoint_dir, CHECKPOINT_FILE) if checkpoint_dir else None
+        if checkpoint_path and os.path.exists(checkpoint_path):
+            state = self._load_checkpoint(checkpoint_path, optimizer, scheduler, train_loader)
+            logger.info(f"从检查点恢复训练: 已完成 {state['epoch'] + 1} 轮")
         
         logger.info("开始训练...")
         
-        for epoch in range(num_epochs):
-            # 训练阶段
-            self.model.train()
-            train_loss = 0.0
+        epoch = state['epoch']
+        for epoch in range(state['epoch'] + 1, num_epochs):
+            if state['stopped']:
+                break
             
-            for batch_x, batch_y in train_loader:
-                batch_x, batch_y = batch_x.to(self.device), batch_y.to(self.device)
-                
-                # 添加特征维度
-                batch_x = batch_x.unsqueeze(-1)
-                
-                optimizer.zero_grad()
-                outputs = self.model(batch_x)
-                loss = criterion(outputs, batch_y)
-                loss.backward()
-                
-                # 梯度裁剪
-                torch.nn.utils.clip_grad_norm_(self.model.parameters(), max_norm=1.0)
-                
-                optimizer.step()
-                train_loss += loss.item()
+            # 训练阶段
+            avg_train_loss = self.train_epoch(train_loader, optimizer, criterion)
             
             # 验证阶段
-            self.model.eval()
-            val_loss = 0.0
+            avg_val_loss = self.validation_loss(val_loader, criterion)
             
-            with torch.no_grad():
-                for batch_x, batch_y in val_loader:
-                    batch_x, batch_y = batch_x.to(self.device), batch_y.to(self.device)
-                    batch_x = batch_x.unsqueeze(-1)
-                    
-                    outputs = self.model(batch_x)
-                    loss = criterion(outputs, batch_y)
-                    val_loss += loss.item()
-            
-            # 计算平均损失
-            avg_train_loss = train_loss / len(train_loader)
-            avg_val_loss = val_loss / len(val_loader)
-            
-            train_losses.append(avg_train_loss)
-            val_losses.append(avg_val_loss)
+            state['train_losses'].append(avg_train_loss)
+            state['val_losses'].append(avg_val_loss)
             
             # 学习率调度
             scheduler.step(avg_val_loss)
             
             # 早停检查
-            if avg_val_loss < best_val_loss:
-                best_val_loss = avg_val_loss
-                patience_counter = 0
+            if avg_val_loss < state['best_val_loss']:
+                state['best_val_loss'] = avg_val_loss
+                state['patience_counter'] = 0
             else:
-                patience_counter += 1
+                state['patience_counter'] += 1
             
             if epoch % 10 == 0:
                 logger.info(f"Epoch {epoch}/{num_epochs}, Train Loss: {avg_train_loss:.6f}, Val Loss: {avg_val_loss:.6f}")
             
-            if patience_counter >= patience:
+            state['epoch'] = epoch
+            state['stopped'] = state['patience_counter'] >= patience
+            
+            # 定期保存检查点；早停时也保存，重新执行时不再继续训练
+            if checkpoint_path and ((epoch + 1) % checkpoint_interval == 0 or state['stopped']):
+                self._save_checkpoint(checkpoint_path, optimizer, scheduler, state, train_loader)
+            
+            if state['stopped']:
                 logger.info(f"早停触发，在第 {epoch} 轮停止训练")
                 break
         
@@ -214,142 +334,468 @@ class LSTMPredictor:
         logger.info("训练完成")
         
         return {
-            'train_losses': train_losses,
-            'val_losses': val_losses,
-            'best_val_loss': best_val_loss,
+            'train_losses': state['train_losses'],
+            'val_losses': state['val_losses'],
+            'best_val_loss': state['best_val_loss'],
             'final_epoch': epoch
         }
     
-    def predict_single(self, input_sequence: List[float]) -> float:
+    def _save_checkpoint(self, path: str, optimizer, scheduler, state: dict, train_loader=None):
+        """原子写入训练检查点（先写临时文件再替换），避免中断时留下损坏的文件"""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + '.tmp'
+        torch.save({
+            'model': self.model.state_dict(),
+            'optimizer': optimizer.state_dict(),
+            'scheduler': scheduler.state_dict(),
+            'state': state,
+            'rng': torch.get_rng_state(),
+            # 批次加载器的打乱顺序也从中断处继续
+            'loader_rng': train_loader.generator.get_state()
+                          if isinstance(train_loader, TimeSeriesBatchLoader) else None
+        }, tmp_path)
+        os.replace(tmp_path, path)
+    
+    def _load_checkpoint(self, path: str, optimizer, scheduler, train_loader=None) -> dict:
+        checkpoint = torch.load(path, map_location=self.device)
+        self.model.load_state_dict(checkpoint['model'])
+        optimizer.load_state_dict(checkpoint['optimizer'])
+        scheduler.load_state_dict(checkpoint['scheduler'])
+        torch.set_rng_state(checkpoint['rng'].cpu())
+        if checkpoint.get('loader_rng') is not None and isinstance(train_loader, TimeSeriesBatchLoader):
+            train_loader.generator.set_state(checkpoint['loader_rng'].cpu())
+        return checkpoint['state']
+    
+    def train_epoch(self, train_loader, optimizer, criterion) -> float:
+        """训练一轮，返回平均批次损失"""
+        self.model.train()
+        train_loss = 0.0
+        
+        for batch_x, batch_y in train_loader:
+            batch_x, batch_y = batch_x.to(self.device), batch_y.to(self.device)
+            
+            # 添加特征维度
+            batch_x = batch_x.unsqueeze(-1)
+            
+            optimizer.zero_grad()
+            outputs = self.model(batch_x)
+            loss = criterion(outputs, batch_y)
+            loss.backward()
+            
+            # 梯度裁剪
+            torch.nn.utils.clip_grad_norm_(self.model.parameters(), max_norm=1.0)
+            
+            optimizer.step()
+            train_loss += loss.item()
+        
+        return train_loss / len(train_loader)
+    
+    def validation_loss(self, val_loader, criterion) -> float:
+        """计算验证集平均批次损失"""
+        self.model.eval()
+        val_loss = 0.0
+        
+        with torch.no_grad():
+            for batch_x, batch_y in val_loader:
+                batch_x, batch_y = batch_x.to(self.device), batch_y.to(self.device)
+                batch_x = batch_x.unsqueeze(-1)
+                
+                outputs = self.model(batch_x)
+                loss = criterion(outputs, batch_y)
+                val_loss += loss.item()
+        
+        return val_loss / len(val_loader)
+    
+    def series_index(self, series_ids=None, count: int = 1) -> np.ndarray:
+        """把序列名或下标转换为归一化参数的列下标；单序列模型始终为0"""
+        return resolve_series_index(self.series_names, series_ids, count)
+    
+    def _scale_params(self, series_index: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """按样本取出归一化参数，形状 (样本数, 1)，用于向量化的归一化和反归一化"""
+        return self.scaler.scale_[series_index][:, None], self.scaler.min_[series_index][:, None]
+    
+    def predict_single(self, input_sequence: List[float], series_id=None) -> float:
         """单次预测"""
+        return self.predict_batch([input_sequence], series_ids=None if series_id is None else [series_id])[0]
+    
+    def predict_horizon(self, sequences, horizon: int = 1, batch_size: int = 1024,
+                        series_ids=None) -> np.ndarray:
+        """多步递推预测，返回形状 (序列数, horizon) 的数组
+
+        先用完整窗口预热得到第一步预测和LSTM隐藏状态，之后每一步只把上一步的
+        预测值作为新的时间步输入并沿用隐藏状态，不再重复计算整个窗口。
+        多个序列按 batch_size 分块同时递推。
+        """
         if self.model is None or not self.is_trained:
             raise ValueError("模型未训练")
+        if horizon < 1:
+            raise ValueError("horizon 必须为正整数")
         
-        self.model.eval()
+        inputs = np.asarray(sequences, dtype=np.float64)
+        if inputs.ndim != 2:
+            raise ValueError("批量预测的输入序列长度必须一致")
+        if len(inputs) == 0:
+            return np.empty((0, horizon))
         
-        # 数据预处理
-        input_array = np.array(input_sequence).reshape(-1, 1)
-        scaled_input = self.scaler.transform(input_array)
+        self.model.eval()
         
-        # 转换为张量
-        input_tensor = torch.FloatTensor(scaled_input.flatten()).unsqueeze(0).unsqueeze(-1).to(self.device)
+        scale, offset = self._scale_params(self.series_index(series_ids, len(inputs)))
+        input_tensor = torch.as_tensor(inputs * scale + offset, dtype=torch.float32).unsqueeze(-1)
         
-        # 预测
+        outputs = []
         with torch.no_grad():
-            prediction = self.model(input_tensor)
+            for start in range(0, len(input_tensor), batch_size):
+                batch = input_tensor[start:start + batch_size].to(self.device)
+                
+                # 预热：完整窗口一次前向传播
+                step_output, hidden = self.model.forward_with_state(batch)
+                steps = [step_output]
+                
+                # 递推：每步只输入上一步的预测值
+                for _ in range(horizon - 1):
+                    step_output, hidden = self.model.forward_with_state(step_output.unsqueeze(1), hidden)
+                    steps.append(step_output)
+                
+                outputs.append(torch.cat(steps, dim=1).cpu())
         
         # 反归一化
-        prediction_scaled = prediction.cpu().numpy().reshape(-1, 1)
-        prediction_original = self.scaler.inverse_transform(prediction_scaled)
+        return (torch.cat(outputs).numpy() - offset) / scale
+    
+    def predict_batch(self, sequences, batch_size: int = 1024, series_ids=None) -> List[float]:
+        """批量预测
+
+        所有序列堆叠为 (样本数, 序列长度) 的数组后一次完成归一化，
+        按 batch_size 分块前向传播，最后统一反归一化。
+        """
+        if self.model is None or not self.is_trained:
+            raise ValueError("模型未训练")
+        
+        inputs = np.asarray(sequences, dtype=np.float64)
+        if inputs.ndim != 2:
+            raise ValueError("批量预测的输入序列长度必须一致")
+        if len(inputs) == 0:
+            return []
+        
+        self.model.eval()
+        
+        # 按样本广播归一化参数，一次变换所有数值
+        scale, offset = self._scale_params(self.series_index(series_ids, len(inputs)))
+        input_tensor = torch.as_tensor(inputs * scale + offset, dtype=torch.float32).unsqueeze(-1)
         
-        return float(prediction_original[0, 0])
+        outputs = []
+        with torch.no_grad():
+            for start in range(0, len(input_tensor), batch_size):
+                batch = input_tensor[start:start + batch_size].to(self.device)
+                outputs.append(self.model(batch).cpu())
+        
+        # 反归一化
+        prediction_scaled = torch.cat(outputs).numpy()
+        return ((prediction_scaled - offset) / scale).ravel().tolist()
     
-    def predict_batch(self, sequences: List[List[float]]) -> List[float]:
-        """批量预测"""
-        predictions = []
-        for seq in sequences:
-            pred = self.predict_single(seq)
-            predictions.append(pred)
-        return predictions
+    def start_stream(self, input_sequence: List[float], series_id=None):
+        """用完整窗口初始化流式推理状态，返回 (下一步预测值, 隐藏状态)"""
+        if self.model is None or not self.is_trained:
+            raise ValueError("模型未训练")
+        
+        self.model.eval()
+        scale, offset = self._scale_params(self.series_index(series_id))
+        scaled = np.asarray(input_sequence, dtype=np.float64) * scale[0] + offset[0]
+        input_tensor = torch.as_tensor(scaled, dtype=torch.float32).reshape(1, -1, 1).to(self.device)
+        
+        with torch.no_grad():
+            output, hidden = self.model.forward_with_state(input_tensor)
+        
+        return float((output.item() - offset[0, 0]) / scale[0, 0]), hidden
     
-    def evaluate(self, test_loader: DataLoader) -> dict:
-        """评估模型"""
+    def stream_step(self, value: float, hidden, series_id=None):
+        """追加一个观测值，只做一次LSTM单步计算，返回 (下一步预测值, 新的隐藏状态)"""
         if self.model is None or not self.is_trained:
             raise ValueError("模型未训练")
         
         self.model.eval()
+        scale, offset = self._scale_params(self.series_index(series_id))
+        scaled = value * scale[0, 0] + offset[0, 0]
+        input_tensor = torch.tensor([[[scaled]]], dtype=torch.float32).to(self.device)
         
+        with torch.no_grad():
+            output, hidden = self.model.forward_with_state(input_tensor, hidden)
+        
+        return float((output.item() - offset[0, 0]) / scale[0, 0]), hidden
+    
+    def evaluate(self, test_loader, keep_predictions: bool = True) -> dict:
+        """评估模型，test_loader 可以是 TimeSeriesBatchLoader 或 DataLoader
+
+        指标按批次流式累计，内存占用与测试集大小无关；keep_predictions 为 False 时
+        不返回逐样本的预测值和实际值。
+        """
+        if self.model is None or not self.is_trained:
+            raise ValueError("模型未训练")
+        
+        results = self._evaluate_module(self.model, test_loader, self.device, keep_predictions)
+        
+        logger.info(f"评估结果 - MSE: {results['mse']:.6f}, MAE: {results['mae']:.6f}, RMSE: {results['rmse']:.6f}")
+        
+        return results
+    
+    def _evaluate_module(self, module: nn.Module, test_loader, device,
+                         keep_predictions: bool = False) -> dict:
+        module.eval()
+        
+        metrics = StreamingMetrics()
         predictions = []
         actuals = []
         
+        # 归一化参数常驻设备，反归一化和指标累计都在设备上完成
+        scale = torch.as_tensor(np.asarray(self.scaler.scale_), dtype=torch.float64, device=device)
+        offset = torch.as_tensor(np.asarray(self.scaler.min_), dtype=torch.float64, device=device)
+        
+        # TimeSeriesBatchLoader 同时给出每个窗口所属的序列，用于按序列反归一化
+        if isinstance(test_loader, TimeSeriesBatchLoader):
+            batches = test_loader.iter_batches()
+        else:
+            batches = ((batch_x, batch_y, None) for batch_x, batch_y in test_loader)
+        
         with torch.no_grad():
-            for batch_x, batch_y in test_loader:
-                batch_x, batch_y = batch_x.to(self.device), batch_y.to(self.device)
+            for batch_x, batch_y, series_idx in batches:
+                batch_x, batch_y = batch_x.to(device), batch_y.to(device)
                 batch_x = batch_x.unsqueeze(-1)
                 
-                outputs = self.model(batch_x)
+                outputs = module(batch_x)
                 
                 # 反归一化
-                pred_scaled = outputs.cpu().numpy()
-                actual_scaled = batch_y.cpu().numpy()
+                if series_idx is None:
+                    batch_scale, batch_offset = scale[0], offset[0]
+                else:
+                    series_idx = series_idx.to(device)
+                    batch_scale, batch_offset = scale[series_idx][:, None], offset[series_idx][:, None]
                 
-                pred_original = self.scaler.inverse_transform(pred_scaled)
-                actual_original = self.scaler.inverse_transform(actual_scaled)
+                pred_original = (outputs.double() - batch_offset) / batch_scale
+                actual_original = (batch_y.double() - batch_offset) / batch_scale
                 
-                predictions.extend(pred_original.flatten())
-                actuals.extend(actual_original.flatten())
+                metrics.update(pred_original, actual_original)
+                if keep_predictions:
+                    predictions.append(pred_original.reshape(-1).cpu().numpy())
+                    actuals.append(actual_original.reshape(-1).cpu().numpy())
         
-        # 计算指标
-        mse = mean_squared_error(actuals, predictions)
-        mae = mean_absolute_error(actuals, predictions)
-        rmse = np.sqrt(mse)
+        results = metrics.compute()
+        if keep_predictions:
+            results['predictions'] = np.concatenate(predictions).tolist() if predictions else []
+            results['actuals'] = np.concatenate(actuals).tolist() if actuals else []
         
-        logger.info(f"评估结果 - MSE: {mse:.6f}, MAE: {mae:.6f}, RMSE: {rmse:.6f}")
+        return results
+    
+    @staticmethod
+    def quantize_module(module: nn.Module) -> nn.Module:
+        """对LSTM层和全连接层做int8动态量化（只支持CPU推理）"""
+        return torch.ao.quantization.quantize_dynamic(
+            copy.deepcopy(module).cpu().eval(), {nn.LSTM, nn.Linear}, dtype=torch.qint8
+        )
+    
+    @staticmethod
+    def load_quantized_state(path: str) -> dict:
+        """读取int8量化副本的 state_dict
+        
+        动态量化LSTM的权重以打包对象保存，torch>=2.6 默认的 weights_only=True 会拒绝加载；
+        该文件由 save_quantized 写入，属于可信文件，因此明确关闭 weights_only。
+        """
+        return torch.load(path, map_location='cpu', weights_only=False)
+    
+    def _build_quantized_module(self, quantized_file: Optional[str], model_dir_path: str) -> nn.Module:
+        """构建fp32结构并量化，再加载int8权重（量化算子只支持CPU）"""
+        if not quantized_file:
+            raise ValueError("模型中没有int8量化副本")
+        
+        self.build_model()
+        module = self.quantize_module(self.model)
+        module.load_state_dict(self.load_quantized_state(os.path.join(model_dir_path, quantized_file)))
+        return module.eval()
+    
+    def save_quantized(self, save_path: str, validation_loader=None) -> dict:
+        """保存int8动态量化副本，提供验证集时同时比较量化前后的误差
         
-        return {
-            'mse': mse,
-            'mae': mae,
-            'rmse': rmse,
-            'predictions': predictions,
-            'actuals': actuals
+        保存后按加载路径重新读取一次并比较输出，读取失败或结果不一致时删除副本并抛出异常，
+        避免推理时选中无法加载的量化模型。
+        """
+        quantized = self.quantize_module(self.model)
+        quantized_path = os.path.join(save_path, QUANTIZED_FILE)
+        torch.save(quantized.state_dict(), quantized_path)
+        
+        try:
+            restored = self.quantize_module(self.model)
+            restored.load_state_dict(self.load_quantized_state(quantized_path))
+            example = torch.linspace(0, 1, 4 * self.sequence_length).reshape(4, self.sequence_length, 1)
+            with torch.no_grad():
+                if not torch.allclose(quantized(example), restored.eval()(example)):
+                    raise ValueError("量化副本重新加载后的输出与保存前不一致")
+        except Exception:
+            os.remove(quantized_path)
+            raise
+        
+        info = {
+            'file': QUANTIZED_FILE,
+            'size_bytes': os.path.getsize(os.path.join(save_path, QUANTIZED_FILE))
         }
+        
+        if validation_loader is not None:
+            fp32 = self._evaluate_module(self.model, validation_loader, self.device)
+            int8 = self._evaluate_module(quantized, validation_loader, torch.device('cpu'))
+            
+            info['fp32_metrics'] = {key: float(fp32[key]) for key in ('mse', 'mae', 'rmse')}
+            info['metrics'] = {key: float(int8[key]) for key in ('mse', 'mae', 'rmse')}
+            info['relative_mse_delta'] = (
+                (info['metrics']['mse'] - info['fp32_metrics']['mse']) / info['fp32_metrics']['mse']
+                if info['fp32_metrics']['mse'] > 0 else 0.0
+            )
+            
+            logger.info(f"量化模型验证 - MSE: {info['metrics']['mse']:.6f} "
+                        f"(fp32: {info['fp32_metrics']['mse']:.6f}, 相对变化: {info['relative_mse_delta']:.2%})")
+        
+        return info
     
-    def save_model(self, save_path: str):
-        """保存模型"""
+    def save_model(self, save_path: str, quantize: bool = False, validation_loader=None):
+        """保存模型，返回写入模型包的配置
+
+        权重、归一化参数和配置只保存在单文件模型包中。quantize 为 True 时同时保存int8
+        动态量化副本，并在 validation_loader 上记录量化前后的误差，供加载时判断是否使用量化模型。
+        """
         if self.model is None:
             raise ValueError("没有可保存的模型")
         
         os.makedirs(save_path, exist_ok=True)
         
-        # 保存模型状态字典
-        model_path = os.path.join(save_path, 'lstm_model.pth')
-        torch.save(self.model.state_dict(), model_path)
+        # 导出计算图格式，供不依赖PyTorch即时执行的推理后端使用
+        exports = self.export_graphs(save_path)
         
-        # 保存归一化器
-        scaler_path = os.path.join(save_path, 'scaler.pkl')
-        with open(scaler_path, 'wb') as f:
-            pickle.dump(self.scaler, f)
+        # int8动态量化副本
+        quantized = None
+        if quantize:
+            try:
+                quantized = self.save_quantized(save_path, validation_loader)
+            except Exception as e:
+                logger.warning(f"量化模型保存失败: {e}")
         
-        # 保存配置
+        # 配置
         config = {
             'sequence_length': self.sequence_length,
             'hidden_size': self.hidden_size,
             'num_layers': self.num_layers,
             'dropout': self.dropout,
-            'is_trained': self.is_trained
+            'is_trained': self.is_trained,
+            'series_names': self.series_names,
+            'scaler': {
+                'scale': self.scaler.scale_.tolist(),
+                'min': self.scaler.min_.tolist()
+            } if hasattr(self.scaler, 'scale_') else None,
+            'exports': exports,
+            'quantized': quantized
         }
         
-        config_path = os.path.join(save_path, 'model_config.json')
-        with open(config_path, 'w') as f:
-            json.dump(config, f, indent=2)
+        # 单文件模型包：权重、归一化参数和配置，加载时内存映射，不需要 pickle 和 sklearn
+        write_bundle(os.path.join(save_path, BUNDLE_FILE), self.bundle_tensors(), config)
         
         logger.info(f"模型已保存至: {save_path}")
+        return config
+    
+    def bundle_tensors(self) -> dict:
+        """模型包中的张量：fp32权重（CPU副本）和按序列排列的归一化参数"""
+        tensors = {f"model.{name}": value.detach().cpu().numpy()
+                   for name, value in self.model.state_dict().items()}
+        if hasattr(self.scaler, 'scale_'):
+            tensors['scaler.scale'] = np.asarray(self.scaler.scale_, dtype=np.float64)
+            tensors['scaler.min'] = np.asarray(self.scaler.min_, dtype=np.float64)
+        return tensors
     
-    def load_model(self, model_path: str):
-        """加载模型"""
+    def export_graphs(self, save_path: str) -> dict:
+        """导出带状态的 TorchScript 和 ONNX 计算图（LSTMStepGraph），返回 格式 -> 文件名 的映射
+
+        导出使用CPU上的模型副本；ONNX 使用基于 TorchScript 的导出器（dynamo=False），
+        不需要 onnxscript。某种格式导出失败时记录错误，推理时该后端回退到 torch 即时执行。
+        """
+        exports = {}
+        export_model = LSTMStepGraph(copy.deepcopy(self.model).cpu()).eval()
+        state = torch.zeros(self.num_layers, 1, self.hidden_size)
+        example = (torch.zeros(1, self.sequence_length, 1), state, state.clone())
+        
         try:
-            # 加载配置
-            config_path = os.path.join(model_path, 'model_config.json')
-            with open(config_path, 'r') as f:
-                config = json.load(f)
+            scripted = torch.jit.script(export_model)
+            scripted.save(os.path.join(save_path, TORCHSCRIPT_FILE))
+            exports['torchscript'] = TORCHSCRIPT_FILE
+        except Exception as e:
+            logger.error(f"TorchScript导出失败，torchscript 后端将回退到 torch 即时执行: {e}")
+        
+        try:
+            torch.onnx.export(
+                export_model, example, os.path.join(save_path, ONNX_FILE),
+                input_names=['input', 'h', 'c'], output_names=['output', 'h_out', 'c_out'],
+                dynamic_axes={
+                    'input': {0: 'batch', 1: 'sequence'}, 'h': {1: 'batch'}, 'c': {1: 'batch'},
+                    'output': {0: 'batch'}, 'h_out': {1: 'batch'}, 'c_out': {1: 'batch'}
+                },
+                opset_version=17,
+                dynamo=False
+            )
+            exports['onnx'] = ONNX_FILE
+        except Exception as e:
+            logger.error(f"ONNX导出失败，onnx 后端将回退到 torch 即时执行: {e}")
+        
+        return exports
+    
+    def load_model(self, model_path: str, quantized: bool = False):
+        """加载模型，quantized 为 True 时加载int8动态量化副本（在CPU上推理），不可用时回退到fp32权重
+
+        model_path 为模型目录或模型包文件；存在模型包时从中内存映射读取权重、
+        归一化参数和配置，否则按旧格式读取 lstm_model.pth、scaler.pkl 和 model_config.json。
+        """
+        try:
+            tensors = None
+            if has_bundle(model_path):
+                tensors, config = read_bundle(bundle_path(model_path))
+                model_path = model_dir(model_path)
+            else:
+                config = load_model_config(model_path)
             
             self.sequence_length = config['sequence_length']
             self.hidden_size = config['hidden_size']
             self.num_layers = config['num_layers']
             self.dropout = config['dropout']
             self.is_trained = config['is_trained']
+            self.series_names = config.get('series_names')
             
-            # 构建模型
-            self.build_model()
+            loaded_quantized = False
+            if quantized:
+                # 量化副本缺失或无法加载时回退到fp32权重，而不是让预测失败
+                try:
+                    self.device = torch.device('cpu')
+                    self.model = self._build_quantized_module((config.get('quantized') or {}).get('file'),
+                                                              model_path)
+                    loaded_quantized = True
+                except Exception as e:
+                    logger.warning(f"int8量化模型加载失败，改用fp32权重: {e}")
+                    self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
             
-            # 加载模型权重
-            model_state_path = os.path.join(model_path, 'lstm_model.pth')
-            self.model.load_state_dict(torch.load(model_state_path, map_location=self.device))
+            if not loaded_quantized:
+                # 构建模型并加载fp32权重
+                self.build_model()
+                if tensors is not None:
+                    state_dict = {name[len('model.'):]: torch.from_numpy(value)
+                                  for name, value in tensors.items() if name.startswith('model.')}
+                else:
+                    state_dict = torch.load(os.path.join(model_path, 'lstm_model.pth'), map_location=self.device)
+                self.model.load_state_dict(state_dict)
+            self.model.eval()
             
             # 加载归一化器
-            scaler_path = os.path.join(model_path, 'scaler.pkl')
-            with open(scaler_path, 'rb') as f:
-                self.scaler = pickle.load(f)
+            if tensors is not None:
+                if 'scaler.scale' not in tensors:
+                    raise ValueError("模型包中缺少归一化参数")
+                self.scaler = ArrayMinMaxScaler(tensors['scaler.scale'], tensors['scaler.min'])
+            else:
+                # 旧格式的 sklearn 归一化器，只有加载旧模型时才需要 pickle 和 sklearn
+                import pickle
+                
+                scaler_path = os.path.join(model_path, 'scaler.pkl')
+                with open(scaler_path, 'rb') as f:
+                    self.scaler = pickle.load(f)
             
             logger.info(f"模型加载成功: {model_path}")
             
@@ -0,0 +1,271 @@
+import os
+import numpy as np
+from abc import ABC, abstractmethod
+from typing import List, Optional, Tuple
+from loguru import logger
+
+from models.model_bundle import load_model_config
+
+# 与 lstm_model 中的导出文件名保持一致；本模块不导入 torch，供只做CPU推理的进程使用
+# 导出的是带隐藏状态输入输出的计算图（LSTMStepGraph）
+TORCHSCRIPT_FILE = 'lstm_step.ts'
+ONNX_FILE = 'lstm_step.onnx'
+QUANTIZED_FILE = 'lstm_model_int8.pth'
+
+def resolve_series_index(series_names: Optional[List[str]], series_ids=None, count: int = 1) -> np.ndarray:
+    """把序列名或下标转换为归一化参数的列下标；单序列模型（series_names 为空）始终为0
+
+    先按序列名匹配，匹配不到时把整数当作下标。
+    """
+    if not series_names:
+        return np.zeros(count, dtype=np.int64)
+
+    if series_ids is None:
+        raise ValueError("全局多序列模型预测时必须指定 series_id")
+    if np.isscalar(series_ids):
+        series_ids = [series_ids] * count
+    if len(series_ids) != count:
+        raise ValueError("series_id 数量与输入序列数量不一致")
+
+    positions = {name: i for i, name in enumerate(series_names)}
+    index = []
+    for series_id in series_ids:
+        if str(series_id) in positions:
+            index.append(positions[str(series_id)])
+        elif isinstance(series_id, (int, np.integer)) and 0 <= series_id < len(series_names):
+            index.append(int(series_id))
+        else:
+            raise ValueError(f"模型中不存在序列: {series_id}")
+    return np.asarray(index, dtype=np.int64)
+
+class ArrayMinMaxScaler:
+    """只依赖numpy的MinMax归一化，参数来自模型包（或旧格式的 model_config.json）中保存的 scale/min"""
+
+    def __init__(self, scale, min_):
+        self.scale = np.asarray(scale, dtype=np.float64)
+        self.min = np.asarray(min_, dtype=np.float64)
+
+    # 与 sklearn MinMaxScaler 的属性名一致，LSTMPredictor 可以直接使用
+    @property
+    def scale_(self) -> np.ndarray:
+        return self.scale
+
+    @property
+    def min_(self) -> np.ndarray:
+        return self.min
+
+    def transform(self, values: np.ndarray) -> np.ndarray:
+        return values * self.scale + self.min
+
+    def inverse_transform(self, values: np.ndarray) -> np.ndarray:
+        return (values - self.min) / self.scale
+
+class GraphLSTMPredictor(ABC):
+    """基于导出计算图的LSTM预测器基类
+
+    归一化和批处理逻辑与 LSTMPredictor 相同，子类只实现 is_available 和 _forward：
+    输入 (B, L, 1) float32 数组和 (num_layers, B, hidden_size) 的隐藏状态 h、c，
+    返回 (输出 (B, 1), h, c)。多步预测与即时执行相同：完整窗口预热后沿用隐藏状态逐步递推。
+    """
+
+    backend = None
+
+    def __init__(self, model_path: str):
+        self.config = load_model_config(model_path)
+
+        if not self.config.get('scaler'):
+            raise ValueError("模型配置中缺少归一化参数，请重新保存模型")
+
+        self.model_path = model_path
+        self.sequence_length = self.config['sequence_length']
+        self.hidden_size = self.config['hidden_size']
+        self.num_layers = self.config['num_layers']
+        self.scaler = ArrayMinMaxScaler(self.config['scaler']['scale'], self.config['scaler']['min'])
+        self.series_names = self.config.get('series_names')
+        self.is_trained = self.config.get('is_trained', True)
+
+    @classmethod
+    @abstractmethod
+    def is_available(cls, model_path: str) -> bool:
+        """模型目录中是否存在该后端的导出文件"""
+
+    @abstractmethod
+    def _forward(self, batch: np.ndarray, h: np.ndarray,
+                 c: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """一次前向传播，返回 (输出, h, c)"""
+
+    def _zero_state(self, batch_size: int) -> np.ndarray:
+        return np.zeros((self.num_layers, batch_size, self.hidden_size), dtype=np.float32)
+
+    def _predict_scaled(self, scaled: np.ndarray, batch_size: int, horizon: int = 1) -> np.ndarray:
+        """对归一化后的窗口递推 horizon 步，返回形状 (序列数, horizon) 的归一化预测"""
+        outputs = []
+        for start in range(0, len(scaled), batch_size):
+            batch = scaled[start:start + batch_size, :, None].astype(np.float32)
+            state = self._zero_state(len(batch))
+
+            # 预热：完整窗口一次前向传播
+            step_output, h, c = self._forward(batch, state, state)
+            steps = [np.asarray(step_output).reshape(-1, 1)]
+
+            # 递推：每步只输入上一步的预测值
+            for _ in range(horizon - 1):
+                step_output, h, c = self._forward(steps[-1][:, :, None].astype(np.float32), h, c)
+                steps.append(np.asarray(step_output).reshape(-1, 1))
+
+            outputs.append(np.concatenate(steps, axis=1))
+        return np.concatenate(outputs)
+
+    def _scale_params(self, series_ids, count: int):
+        index = resolve_series_index(self.series_names, series_ids, count)
+        return self.scaler.scale[index][:, None], self.scaler.min[index][:, None]
+
+    def predict_single(self, input_sequence: List[float], series_id=None) -> float:
+        """单次预测"""
+        return self.predict_batch([input_sequence], series_ids=None if series_id is None else [series_id])[0]
+
+    def predict_batch(self, sequences, batch_size: int = 1024, series_ids=None) -> List[float]:
+        """批量预测"""
+        inputs = np.asarray(sequences, dtype=np.float64)
+        if inputs.ndim != 2:
+            raise ValueError("批量预测的输入序列长度必须一致")
+        if len(inputs) == 0:
+            return []
+
+        scale, offset = self._scale_params(series_ids, len(inputs))
+        outputs = self._predict_scaled(inputs * scale + offset, batch_size)[:, 0]
+        return ((outputs - offset[:, 0]) / scale[:, 0]).tolist()
+
+    def predict_horizon(self, sequences, horizon: int = 1, batch_size: int = 1024,
+                        series_ids=None) -> np.ndarray:
+        """多步递推预测，返回形状 (序列数, horizon) 的数组"""
+        if horizon < 1:
+            raise ValueError("horizon 必须为正整数")
+
+        inputs = np.asarray(sequences, dtype=np.float64)
+        if inputs.ndim != 2:
+            raise ValueError("批量预测的输入序列长度必须一致")
+        if len(inputs) == 0:
+            return np.empty((0, horizon))
+
+        scale, offset = self._scale_params(series_ids, len(inputs))
+        steps = self._predict_scaled(inputs * scale + offset, batch_size, horizon)
+        return (steps - offset) / scale
+
+class OnnxLSTMPredictor(GraphLSTMPredictor):
+    """ONNX Runtime CPU推理后端，不需要导入torch"""
+
+    backend = 'onnx'
+
+    def __init__(self, model_path: str, num_threads: int = 0):
+        super().__init__(model_path)
+
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self.session = ort.InferenceSession(
+            os.path.join(model_path, ONNX_FILE), options, providers=['CPUExecutionProvider']
+        )
+
+        logger.info(f"ONNX Runtime模型加载成功: {model_path}")
+
+    @classmethod
+    def is_available(cls, model_path: str) -> bool:
+        if not os.path.exists(os.path.join(model_path, ONNX_FILE)):
+            return False
+        try:
+            import onnxruntime  # noqa: F401
+        except ImportError:
+            return False
+        return True
+
+    def _forward(self, batch, h, c):
+        return self.session.run(None, {'input': batch, 'h': h, 'c': c})
+
+class TorchScriptLSTMPredictor(GraphLSTMPredictor):
+    """TorchScript推理后端，不依赖模型类定义和sklearn"""
+
+    backend = 'torchscript'
+
+    def __init__(self, model_path: str):
+        super().__init__(model_path)
+
+        import torch
+
+        self.torch = torch
+        self.module = torch.jit.load(os.path.join(model_path, TORCHSCRIPT_FILE), map_location='cpu')
+        self.module.eval()
+
+        logger.info(f"TorchScript模型加载成功: {model_path}")
+
+    @classmethod
+    def is_available(cls, model_path: str) -> bool:
+        return os.path.exists(os.path.join(model_path, TORCHSCRIPT_FILE))
+
+    def _forward(self, batch, h, c):
+        with self.torch.inference_mode():
+            outputs = self.module(*(self.torch.from_numpy(array) for array in (batch, h, c)))
+            return tuple(output.numpy() for output in outputs)
+
+GRAPH_BACKENDS = {
+    'onnx': OnnxLSTMPredictor,
+    'torchscript': TorchScriptLSTMPredictor
+}
+
+def quantized_within_tolerance(model_path: str, tolerance: Optional[float]) -> bool:
+    """量化副本是否存在且验证集MSE的相对增幅不超过 tolerance（None 表示不使用量化模型）"""
+    if tolerance is None:
+        return False
+
+    try:
+        quantized = load_model_config(model_path).get('quantized')
+    except (OSError, ValueError, KeyError):
+        return False
+
+    if not quantized or 'relative_mse_delta' not in quantized:
+        return False
+    if not os.path.exists(os.path.join(model_path, quantized['file'])):
+        return False
+
+    return quantized['relative_mse_delta'] <= tolerance
+
+def resolve_backend(model_path: str, backend: str = 'auto',
+                    quantized_tolerance: Optional[float] = None) -> str:
+    """选择推理后端
+
+    只有 auto 会自动选择：优先使用误差在容差内的int8量化模型，其次依次尝试 onnx、
+    torchscript，都不可用时使用 torch 即时执行。明确指定的后端按指定使用，
+    对应文件不存在时回退到 torch。
+    """
+    if backend == 'auto' and quantized_within_tolerance(model_path, quantized_tolerance):
+        return 'quantized'
+
+    if backend == 'auto':
+        for name in ('onnx', 'torchscript'):
+            if GRAPH_BACKENDS[name].is_available(model_path):
+                return name
+        return 'torch'
+
+    if backend == 'torch':
+        return backend
+
+    if backend == 'quantized':
+        # 明确指定量化模型时不检查容差，只要求量化副本存在
+        if quantized_within_tolerance(model_path, float('inf')):
+            return backend
+        logger.warning(f"模型 {model_path} 没有可用的量化副本，改用 torch 即时执行")
+        return 'torch'
+
+    if backend not in GRAPH_BACKENDS:
+        raise ValueError(f"不支持的推理后端: {backend}")
+
+    if not GRAPH_BACKENDS[backend].is_available(model_path):
+        logger.warning(f"模型 {model_path} 没有可用的 {backend} 导出，改用 torch 即时执行")
+        return 'torch'
+
+    return backend
+
+def load_graph_predictor(model_path: str, backend: str) -> GraphLSTMPredictor:
+    return GRAPH_BACKENDS[backend](model_path)
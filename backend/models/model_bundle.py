@@ -0,0 +1,114 @@
+import os
+import json
+import struct
+import numpy as np
+from typing import Dict, Tuple
+
+# 单文件模型包：与 safetensors 相同的布局
+#   8字节小端 uint64 头部长度 | JSON头部（空格补齐到8字节对齐） | 连续的张量数据
+# 头部记录每个张量的 dtype、shape 和 data_offsets（相对数据区起点），
+# 模型配置以JSON字符串保存在 __metadata__ 中。加载时整个文件做内存映射，
+# 张量直接是映射上的视图，不经过 pickle，也不需要 sklearn。
+BUNDLE_FILE = 'lstm_model.safetensors'
+BUNDLE_FORMAT = 'timevis-lstm'
+# 模型包之前的旧格式中单独保存的配置文件
+LEGACY_CONFIG_FILE = 'model_config.json'
+
+_DTYPES = {
+    'F64': np.float64,
+    'F32': np.float32,
+    'F16': np.float16,
+    'I64': np.int64,
+    'I32': np.int32,
+    'I16': np.int16,
+    'I8': np.int8,
+    'U8': np.uint8,
+    'BOOL': np.bool_
+}
+_DTYPE_NAMES = {np.dtype(dtype): name for name, dtype in _DTYPES.items()}
+
+def bundle_path(model_path: str) -> str:
+    """model_path 可以是模型目录或模型包文件本身"""
+    if os.path.isdir(model_path):
+        return os.path.join(model_path, BUNDLE_FILE)
+    return model_path
+
+def has_bundle(model_path: str) -> bool:
+    return os.path.isfile(bundle_path(model_path))
+
+def model_dir(model_path: str) -> str:
+    """模型包所在目录（导出的计算图、量化副本等与模型包放在同一目录）"""
+    return model_path if os.path.isdir(model_path) else os.path.dirname(model_path)
+
+def write_bundle(path: str, tensors: Dict[str, np.ndarray], config: dict):
+    """把张量和配置写入单个模型包文件（先写临时文件再原子替换）"""
+    arrays = {name: np.ascontiguousarray(array) for name, array in tensors.items()}
+    for name, array in arrays.items():
+        if array.dtype not in _DTYPE_NAMES:
+            raise ValueError(f"模型包不支持的数据类型: {name} {array.dtype}")
+
+    # 按元素字节数从大到小排列，头部8字节对齐后每个张量都按自身元素大小对齐
+    order = sorted(arrays, key=lambda name: (-arrays[name].dtype.itemsize, name))
+
+    header = {'__metadata__': {'format': BUNDLE_FORMAT, 'config': json.dumps(config)}}
+    offset = 0
+    for name in order:
+        array = arrays[name]
+        header[name] = {
+            'dtype': _DTYPE_NAMES[array.dtype],
+            'shape': list(array.shape),
+            'data_offsets': [offset, offset + array.nbytes]
+        }
+        offset += array.nbytes
+
+    header_bytes = json.dumps(header, separators=(',', ':')).encode('utf-8')
+    header_bytes += b' ' * (-len(header_bytes) % 8)
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(struct.pack('<Q', len(header_bytes)))
+        f.write(header_bytes)
+        for name in order:
+            f.write(arrays[name].astype(arrays[name].dtype.newbyteorder('<'), copy=False).tobytes())
+    os.replace(tmp_path, path)
+
+def _read_header(path: str) -> Tuple[int, dict, dict]:
+    """读取模型包头部，返回 (头部长度, 张量信息, 元数据)"""
+    with open(path, 'rb') as f:
+        (header_size,) = struct.unpack('<Q', f.read(8))
+        header = json.loads(f.read(header_size))
+
+    metadata = header.pop('__metadata__', {})
+    if metadata.get('format') != BUNDLE_FORMAT:
+        raise ValueError(f"不是有效的模型包文件: {path}")
+    return header_size, header, metadata
+
+def read_bundle_config(path: str) -> dict:
+    """只读取模型包头部中的模型配置，不映射张量数据"""
+    _, _, metadata = _read_header(path)
+    return json.loads(metadata['config'])
+
+def load_model_config(model_path: str) -> dict:
+    """读取模型配置：优先使用模型包，没有模型包的旧模型读取 model_config.json"""
+    if has_bundle(model_path):
+        return read_bundle_config(bundle_path(model_path))
+    with open(os.path.join(model_dir(model_path), LEGACY_CONFIG_FILE), 'r') as f:
+        return json.load(f)
+
+def read_bundle(path: str) -> Tuple[Dict[str, np.ndarray], dict]:
+    """内存映射读取模型包，返回 (张量名 -> 数组视图, 模型配置)
+
+    映射使用写时复制模式，返回的数组可以直接交给 torch.from_numpy，
+    修改不会写回文件。
+    """
+    header_size, header, metadata = _read_header(path)
+
+    tensors = {}
+    if header:
+        buffer = np.memmap(path, dtype=np.uint8, mode='c', offset=8 + header_size)
+        for name, info in header.items():
+            start, end = info['data_offsets']
+            dtype = np.dtype(_DTYPES[info['dtype']]).newbyteorder('<')
+            tensors[name] = buffer[start:end].view(dtype).reshape(info['shape'])
+
+    return tensors, json.loads(metadata['config'])
@@ -0,0 +1,149 @@
+import re
+import torch
+from typing import Dict, List, Optional, Tuple
+from transformers import LogitsProcessor
+
+# 数值token只能由这些字符组成
+NUMBER_CHARS = frozenset('0123456789-. ')
+
+class NumberGrammar:
+    """单个数值的格式约束：可选负号、整数部分、可选小数点和小数部分
+
+    allow_spaces 为 True 时字符之间可以有单个空格（按位分解的格式，如 "1 2 . 3 4"）。
+    """
+
+    def __init__(self, max_integer_digits: int = 10, max_decimals: int = 4,
+                 allow_spaces: bool = True):
+        self.max_integer_digits = max_integer_digits
+        self.max_decimals = max_decimals
+        self.allow_spaces = allow_spaces
+        self._prefix = re.compile(r'-?(\d+(\.\d*)?)?' if max_decimals > 0 else r'-?\d*')
+        self._complete = re.compile(r'-?\d+(\.\d+)?' if max_decimals > 0 else r'-?\d+')
+
+    def is_prefix(self, core: str) -> bool:
+        """core（去掉空格的已生成字符）是否可能继续生成为合法数值"""
+        if not self._prefix.fullmatch(core):
+            return False
+        integer, _, decimals = core.lstrip('-').partition('.')
+        return len(integer) <= self.max_integer_digits and len(decimals) <= self.max_decimals
+
+    def is_complete(self, core: str) -> bool:
+        """core 是否是位数不超过限制的完整数值"""
+        return bool(self._complete.fullmatch(core)) and self.is_prefix(core)
+
+    def is_exhausted(self, core: str) -> bool:
+        """数值已达到最大位数，只能结束"""
+        integer, dot, decimals = core.lstrip('-').partition('.')
+        if self.max_decimals > 0:
+            return bool(dot) and len(decimals) >= self.max_decimals
+        return len(integer) >= self.max_integer_digits
+
+    def max_new_tokens(self) -> int:
+        """生成一个数值最多需要的token数（每个字符一个token，字符之间各一个空格，再加结束符）"""
+        chars = 1 + self.max_integer_digits + (1 + self.max_decimals if self.max_decimals > 0 else 0)
+        return (2 * chars if self.allow_spaces else chars) + 1
+
+    def parse(self, text: str) -> float:
+        """严格解析生成的数值，格式不合法时抛出 ValueError"""
+        core = text.replace(' ', '') if self.allow_spaces else text.strip()
+        if not self.is_complete(core.rstrip('.')):
+            raise ValueError(f"无法解析预测结果: {text!r}")
+        return float(core)
+
+class NumericVocabulary:
+    """词表中可以出现在数值里的token
+
+    按 (去掉空格后的字符, 是否包含空格, 是否以空格开头, 是否以空格结尾) 分组，
+    约束解码时按组判断是否允许，不需要逐个token检查。
+    """
+
+    def __init__(self, tokenizer):
+        texts = tokenizer.batch_decode([[token_id] for token_id in range(len(tokenizer))])
+
+        self.token_text: Dict[int, str] = {}
+        groups: Dict[Tuple[str, bool, bool, bool], List[int]] = {}
+        for token_id, text in enumerate(texts):
+            if not text or not set(text) <= NUMBER_CHARS or '  ' in text:
+                continue
+            self.token_text[token_id] = text
+            key = (text.replace(' ', ''), ' ' in text, text.startswith(' '), text.endswith(' '))
+            groups.setdefault(key, []).append(token_id)
+
+        self.groups = groups
+        self.token_ids = list(self.token_text)
+
+    def state(self, token_ids: List[int]) -> Tuple[str, bool]:
+        """已生成token对应的 (去掉空格的字符, 是否以空格结尾)"""
+        text = ''.join(self.token_text.get(token_id, '') for token_id in token_ids)
+        return text.replace(' ', ''), text.endswith(' ')
+
+class NumericLogitsProcessor(LogitsProcessor):
+    """只允许生成一个数值的 LogitsProcessor
+
+    每一步只保留能使已生成字符仍是合法数值前缀的token；数值已完整时允许结束符，
+    其分数取结束符与所有非数值token（模型想输出分隔符等）中的最大值；
+    数值达到最大位数时强制结束。prompt_length 为输入部分的长度。
+    """
+
+    def __init__(self, vocabulary: NumericVocabulary, grammar: NumberGrammar,
+                 prompt_length: int, eos_token_id: int):
+        self.vocabulary = vocabulary
+        self.grammar = grammar
+        self.prompt_length = prompt_length
+        self.eos_token_id = eos_token_id
+        self._allowed: Dict[Tuple[str, bool], Tuple[Optional[torch.Tensor], bool, bool]] = {}
+        self._number_mask = None
+
+    def _allowed_tokens(self, core: str, ends_with_space: bool, device):
+        key = (core, ends_with_space)
+        if key not in self._allowed:
+            allowed = []
+            for (chars, has_space, starts_with_space, _), token_ids in self.vocabulary.groups.items():
+                if has_space and not self.grammar.allow_spaces:
+                    continue
+                # 不允许连续空格，也不允许以空格开头
+                if starts_with_space and (ends_with_space or not core):
+                    continue
+                if chars and self.grammar.is_prefix(core + chars):
+                    allowed.extend(token_ids)
+                elif not chars and not self.grammar.is_exhausted(core):
+                    allowed.extend(token_ids)
+
+            self._allowed[key] = (
+                torch.tensor(allowed, dtype=torch.long, device=device) if allowed else None,
+                self.grammar.is_complete(core),
+                self.grammar.is_exhausted(core)
+            )
+        return self._allowed[key]
+
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor) -> torch.FloatTensor:
+        if self._number_mask is None:
+            self._number_mask = torch.zeros(scores.shape[-1], dtype=torch.bool, device=scores.device)
+            self._number_mask[[i for i in self.vocabulary.token_ids if i < scores.shape[-1]]] = True
+
+        # 模型不继续写数值（想输出分隔符、换行等）的分数
+        end_scores = scores.masked_fill(self._number_mask, float('-inf')).max(dim=-1).values
+        constrained = torch.full_like(scores, float('-inf'))
+
+        for row, generated in enumerate(input_ids[:, self.prompt_length:].tolist()):
+            if self.eos_token_id in generated:
+                constrained[row, self.eos_token_id] = 0.0
+                continue
+
+            core, ends_with_space = self.vocabulary.state(generated)
+            allowed, complete, exhausted = self._allowed_tokens(core, ends_with_space, scores.device)
+
+            if exhausted:
+                constrained[row, self.eos_token_id] = 0.0
+                continue
+            if allowed is not None:
+                constrained[row, allowed] = scores[row, allowed]
+            if complete:
+                constrained[row, self.eos_token_id] = torch.maximum(
+                    scores[row, self.eos_token_id], end_scores[row]
+                )
+            elif allowed is None:
+                # 没有可继续的token（不应出现），直接结束避免生成无意义内容
+                constrained[row, self.eos_token_id] = 0.0
+
+        return constrained
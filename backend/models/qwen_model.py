@@ -5,22 +5,89 @@ from transformers import (
     TrainingArguments, Trainer, 
     DataCollatorForLanguageModeling
 )
+from transformers import LogitsProcessorList
+from transformers.trainer_utils import get_last_checkpoint
 from peft import LoraConfig, get_peft_model, TaskType
 import numpy as np
 import pandas as pd
-from typing import List, Dict, Tuple, Optional
+from numpy.lib.stride_tricks import sliding_window_view
+from typing import List, Dict, Tuple, Optional, Union
+import copy
 import json
 import os
 import re
 from loguru import logger
 
+from models.numeric_decoding import NumericVocabulary, NumericLogitsProcessor
+from models.series_encoding import DEFAULT_ENCODING, TokenBudgetPlanner, get_encoding
+from utils.sliding_window import SlidingWindowView
+
+try:
+    from transformers import DynamicCache
+except ImportError:
+    DynamicCache = None
+
+# 复用前缀KV缓存需要 DynamicCache.batch_repeat_interleave（较新的transformers版本）
+PREFIX_CACHE_SUPPORTED = DynamicCache is not None and hasattr(DynamicCache, 'batch_repeat_interleave')
+
+# 任务类型 -> (数据名称, 预测目标名称)
+TASK_DESCRIPTIONS = {
+    'weather': ('天气数据', '数值'),
+    'electricity': ('电力负荷数据', '用电量'),
+    'traffic': ('交通流量数据', '流量')
+}
+DEFAULT_TASK_DESCRIPTION = ('数据', '数值')
+
+# 提示词格式版本：1 为说明在数值之后的旧格式，2 为说明在前、可复用前缀KV缓存的格式。
+# 新训练的模型使用最新版本；没有记录版本的已训练模型按版本1处理。
+PROMPT_VERSION = 2
+
+# 训练样本数达到该值时默认多进程分词
+PARALLEL_TOKENIZE_MIN_EXAMPLES = 10000
+
+def _training_examples(series: np.ndarray, sequence_length: int, start: int, stop: int,
+                       encoding: Dict, prefix: str, suffix: str, points: int, chunk_size: int):
+    """逐块生成训练样本：窗口 series[i:i+sequence_length] 预测 series[i+sequence_length]
+
+    作为 Dataset.from_generator 的生成函数，参数需可序列化（用于缓存指纹），
+    因此定义在模块级、编码以配置字典传入。
+    """
+    encoding = get_encoding(encoding)
+    for chunk_start in range(start, stop, chunk_size):
+        chunk_stop = min(chunk_start + chunk_size, stop)
+        contexts = encoding.encode_series_windows(series, sequence_length, chunk_start, chunk_stop, points)
+        windows = sliding_window_view(series[chunk_start:chunk_stop + sequence_length - 1], sequence_length)
+        targets = encoding.encode_targets(series[chunk_start + sequence_length:chunk_stop + sequence_length],
+                                          windows)
+        for context, target in zip(contexts, targets):
+            prompt = prefix + context + suffix
+            yield {'input_text': prompt, 'target_text': target, 'full_text': prompt + target}
+
+def _tokenize_texts(examples: Dict, tokenizer, max_length: int) -> Dict:
+    """批量分词（datasets 多进程 map 使用，定义在模块级以便序列化）"""
+    return tokenizer(examples['full_text'], truncation=True, max_length=max_length)
+
 class QwenTimeSeriesModel:
     """基于Qwen的时间序列预测模型"""
     
     def __init__(self, model_name: str = "Qwen/Qwen2.5-7B-Instruct", 
-                 max_length: int = 512, device: str = "auto"):
+                 max_length: int = 512, device: str = "auto",
+                 generation_batch_size: int = 16, max_new_tokens: int = 50,
+                 use_prefix_cache: bool = True, constrained_decoding: bool = True,
+                 encoding: Union[str, Dict] = DEFAULT_ENCODING):
         self.model_name = model_name
         self.max_length = max_length
+        # 批量生成的微批大小，显存不足时自动减半并在之后的调用中沿用
+        self.generation_batch_size = max(1, generation_batch_size)
+        self.max_new_tokens = max_new_tokens
+        self.prompt_version = PROMPT_VERSION
+        self.use_prefix_cache = use_prefix_cache
+        # 约束解码：只允许生成一个符合序列编码格式的数值，数值完整后立即结束
+        self.constrained_decoding = constrained_decoding
+        self._numeric_vocabulary = None
+        self.set_encoding(encoding)
+        # 前缀字符串 -> (前缀token, 前缀KV缓存)，模型变化时清空
+        self._prefix_cache = {}
         self.device = torch.device("cuda" if torch.cuda.is_available() and device == "auto" else device)
         
         self.tokenizer = None
@@ -56,6 +123,8 @@ class QwenTimeSeriesModel:
                 low_cpu_mem_usage=True
             )
             
+            self._prefix_cache.clear()
+            self._numeric_vocabulary = None
             logger.info("模型加载成功")
             
         except Exception as e:
@@ -79,35 +148,75 @@ class QwenTimeSeriesModel:
         
         # 应用LoRA
         self.model = get_peft_model(self.model, lora_config)
+        self._prefix_cache.clear()
         self.model.print_trainable_parameters()
         
         logger.info("LoRA模型准备完成")
     
-    def format_time_series_prompt(self, series: List[float], task_type: str = "weather") -> str:
-        """将时间序列数据格式化为自然语言提示"""
-        
-        # 将数值转换为字符串，按位分解
-        formatted_values = []
-        for val in series:
-            # 将数字按位分解，例如 12.34 -> "1 2 . 3 4"
-            val_str = f"{val:.4f}".rstrip('0').rstrip('.')
-            formatted_val = ' '.join(list(val_str))
-            formatted_values.append(formatted_val)
-        
-        # 根据任务类型生成提示词
-        if task_type == "weather":
-            prompt = f"根据过去{len(series)}个时间点的天气数据：{', '.join(formatted_values)}，请预测下一个时间点的数值。只输出数字，格式与输入相同："
-        elif task_type == "electricity":
-            prompt = f"根据过去{len(series)}个时间点的电力负荷数据：{', '.join(formatted_values)}，请预测下一个时间点的用电量。只输出数字，格式与输入相同："
-        elif task_type == "traffic":
-            prompt = f"根据过去{len(series)}个时间点的交通流量数据：{', '.join(formatted_values)}，请预测下一个时间点的流量。只输出数字，格式与输入相同："
-        else:
-            prompt = f"根据过去{len(series)}个时间点的数据：{', '.join(formatted_values)}，请预测下一个时间点的数值。只输出数字，格式与输入相同："
+    def set_encoding(self, encoding: Union[str, Dict]):
+        """设置序列编码（spaced_digits/digits/scaled_int/paa），训练和推理必须使用同一编码"""
+        self.encoding = get_encoding(encoding)
+        self.number_grammar = self.encoding.grammar()
+    
+    def prompt_prefix(self, length: int, task_type: str = "weather") -> str:
+        """提示词中数值之前的固定部分，同一任务类型和序列长度的所有提示词共享"""
+        data_name, target_name = TASK_DESCRIPTIONS.get(task_type, DEFAULT_TASK_DESCRIPTION)
+        
+        if self.prompt_version == 1:
+            return f"根据过去{length}个时间点的{data_name}："
+        
+        # 说明放在数值之前，使可复用的前缀尽量长；以换行结尾，保证分词边界不受数值影响
+        return (f"请根据{data_name}预测下一个时间点的{target_name}。只输出数字，格式与输入相同。\n"
+                f"过去{length}个时间点：\n")
+    
+    def prompt_suffix(self, task_type: str = "weather") -> str:
+        """提示词中数值之后的部分"""
+        if self.prompt_version == 1:
+            _, target_name = TASK_DESCRIPTIONS.get(task_type, DEFAULT_TASK_DESCRIPTION)
+            return f"，请预测下一个时间点的{target_name}。只输出数字，格式与输入相同："
+        return "\n预测："
+    
+    def format_time_series_prompt(self, series: List[float], task_type: str = "weather",
+                                  points: Optional[int] = None) -> str:
+        """将时间序列数据格式化为自然语言提示，points 为上下文编码后的点数（默认全部）"""
+        points = self.encoding.context_points(len(series)) if points is None else points
+        return (self.prompt_prefix(points, task_type) + self.encoding.encode_context(series, points)
+                + self.prompt_suffix(task_type))
+    
+    def _fit_context_points(self, window, points: int, task_type: str = "weather") -> int:
+        """按token预算为编码后最长的窗口规划上下文点数（预留一个数值的输出token）"""
+        if self.tokenizer is None:
+            return points
+        
+        planner = TokenBudgetPlanner(self.tokenizer, self.max_length)
+        fitted = planner.fit(lambda k: self.format_time_series_prompt(window, task_type, k),
+                             points, reserve=self.number_grammar.max_new_tokens())
+        if fitted < points:
+            logger.warning(f"提示词超出 max_length={self.max_length}，上下文点数由 {points} 减为 {fitted}")
+        return fitted
+    
+    def build_prompts(self, windows: List, task_type: str = "weather") -> Tuple[List[str], str]:
+        """为一组等长窗口构造提示词，返回 (提示词列表, 共同前缀)
+        
+        按token预算规划上下文点数：编码后最长的窗口连同预留的输出token放不进 max_length 时，
+        所有窗口一起减少上下文点数（保留最近的值，PAA减少分段数），而不是由分词器截断。
+        """
+        windows = np.asarray(windows, dtype=np.float64)
+        points = self.encoding.context_points(windows.shape[1])
+        contexts = self.encoding.encode_contexts(windows, points)
         
-        return prompt
+        longest = max(range(len(contexts)), key=lambda i: len(contexts[i]))
+        fitted = self._fit_context_points(windows[longest], points, task_type)
+        if fitted < points:
+            points = fitted
+            contexts = self.encoding.encode_contexts(windows, points)
+        
+        prefix = self.prompt_prefix(points, task_type)
+        suffix = self.prompt_suffix(task_type)
+        return [prefix + context + suffix for context in contexts], prefix
     
-    def parse_prediction(self, generated_text: str) -> float:
-        """解析模型生成的预测结果"""
+    def parse_prediction(self, generated_text: str, window: Optional[List[float]] = None) -> float:
+        """解析模型生成的预测结果（非约束解码时使用），传入输入窗口时按序列编码解码"""
         try:
             # 提取生成文本中的数字部分
             # 找到最后一个冒号后的内容
@@ -124,6 +233,8 @@ class QwenTimeSeriesModel:
             # 使用正则表达式提取数字
             numbers = re.findall(r'-?\d+\.?\d*', cleaned)
             if numbers:
+                if window is not None:
+                    return self.encoding.decode_number(float(numbers[0]), window)
                 return float(numbers[0])
             else:
                 logger.warning(f"无法解析预测结果: {generated_text}")
@@ -133,62 +244,103 @@ class QwenTimeSeriesModel:
             logger.error(f"解析预测结果失败: {e}, 原文: {generated_text}")
             return 0.0
     
-    def create_training_data(self, data: pd.DataFrame, sequence_length: int = 10, 
-                           task_type: str = "weather") -> List[Dict]:
-        """创建训练数据"""
-        training_data = []
+    def _training_layout(self, series: np.ndarray, sequence_length: int, start: int, stop: int,
+                         task_type: str, chunk_size: int) -> Dict:
+        """训练样本生成参数：逐块找出编码后最长的窗口，统一规划上下文点数和提示词前后缀"""
+        points = self.encoding.context_points(sequence_length)
+        longest, longest_length = start, -1
+        for chunk_start in range(start, stop, chunk_size):
+            chunk_stop = min(chunk_start + chunk_size, stop)
+            lengths = [len(context) for context in self.encoding.encode_series_windows(
+                series, sequence_length, chunk_start, chunk_stop, points)]
+            i = int(np.argmax(lengths))
+            if lengths[i] > longest_length:
+                longest, longest_length = chunk_start + i, lengths[i]
         
+        points = self._fit_context_points(series[longest:longest + sequence_length], points, task_type)
+        return {
+            'series': series,
+            'sequence_length': sequence_length,
+            'start': start,
+            'stop': stop,
+            'encoding': self.encoding.config(),
+            'prefix': self.prompt_prefix(points, task_type),
+            'suffix': self.prompt_suffix(task_type),
+            'points': points,
+            'chunk_size': chunk_size
+        }
+    
+    def create_training_data(self, data: pd.DataFrame, sequence_length: int = 10, 
+                           task_type: str = "weather", chunk_size: int = 10000) -> List[Dict]:
+        """创建训练数据，提示词和目标值使用与推理相同的序列编码和token预算"""
         # 假设数据的第一列是时间序列值
-        values = data.iloc[:, 0].values
+        values = np.asarray(data.iloc[:, 0].values, dtype=np.float64)
         
-        for i in range(len(values) - sequence_length):
-            input_sequence = values[i:i+sequence_length].tolist()
-            target_value = values[i+sequence_length]
-            
-            # 生成提示词
-            prompt = self.format_time_series_prompt(input_sequence, task_type)
-            
-            # 格式化目标值
-            target_str = f"{target_value:.4f}".rstrip('0').rstrip('.')
-            target_formatted = ' '.join(list(target_str))
-            
-            # 构造完整的训练文本
-            full_text = prompt + target_formatted
-            
-            training_data.append({
-                'input_text': prompt,
-                'target_text': target_formatted,
-                'full_text': full_text
-            })
+        stop = max(0, len(values) - sequence_length)
+        if stop == 0:
+            return []
+        
+        layout = self._training_layout(values, sequence_length, 0, stop, task_type, chunk_size)
+        training_data = list(_training_examples(**layout))
         
         logger.info(f"创建了 {len(training_data)} 个训练样本")
         return training_data
     
-    def train(self, training_data: List[Dict], output_dir: str, 
+    def build_training_dataset(self, windows: SlidingWindowView, task_type: str = "weather",
+                               cache_dir: Optional[str] = None, chunk_size: int = 10000):
+        """由滑动窗口直接构造磁盘上的训练数据集（Arrow格式）
+        
+        按块向量化编码窗口，由生成器逐块写入 cache_dir 下的Arrow文件，不在内存中保留
+        全部提示词；生成参数相同时 datasets 直接复用已有的缓存。内容与 create_training_data 相同。
+        """
+        from datasets import Dataset
+        
+        if len(windows) == 0:
+            raise ValueError("没有可用的训练窗口")
+        
+        series = np.asarray(windows.series, dtype=np.float64)
+        layout = self._training_layout(series, windows.sequence_length, windows.start, windows.stop,
+                                       task_type, chunk_size)
+        dataset = Dataset.from_generator(_training_examples, gen_kwargs=layout, cache_dir=cache_dir)
+        
+        logger.info(f"创建了 {len(dataset)} 个训练样本")
+        return dataset
+    
+    def train(self, training_data, output_dir: str, 
               num_epochs: int = 3, learning_rate: float = 5e-5,
-              batch_size: int = 4, gradient_accumulation_steps: int = 4):
-        """训练模型"""
+              batch_size: int = 4, gradient_accumulation_steps: int = 4,
+              save_steps: int = 500, resume: bool = True,
+              num_proc: Optional[int] = None):
+        """训练模型
+
+        training_data 为 create_training_data 返回的列表或 build_training_dataset 返回的数据集。
+        每 save_steps 步在 output_dir 下保存检查点（含优化器、调度器和随机数状态）；
+        resume 为 True 且 output_dir 中已有检查点时从最新检查点继续训练。
+        num_proc 为分词进程数，默认在样本较多时使用全部CPU核。
+        """
         
         if self.model is None:
             raise ValueError("请先加载模型")
         
-        # 准备数据集
-        def tokenize_function(examples):
-            model_inputs = self.tokenizer(
-                examples['full_text'],
-                truncation=True,
-                padding=True,
-                max_length=self.max_length,
-                return_tensors="pt"
-            )
-            model_inputs["labels"] = model_inputs["input_ids"].clone()
-            return model_inputs
-        
         # 转换为datasets格式
         from datasets import Dataset
-        train_texts = [item['full_text'] for item in training_data]
-        train_dataset = Dataset.from_dict({'full_text': train_texts})
-        train_dataset = train_dataset.map(tokenize_function, batched=True)
+        if isinstance(training_data, Dataset):
+            train_dataset = training_data
+        else:
+            train_dataset = Dataset.from_dict({'full_text': [item['full_text'] for item in training_data]})
+        
+        if num_proc is None and len(train_dataset) >= PARALLEL_TOKENIZE_MIN_EXAMPLES:
+            num_proc = os.cpu_count()
+        
+        # 分词时不填充，由数据整理器按批填充并生成labels
+        train_dataset = train_dataset.map(
+            _tokenize_texts,
+            batched=True,
+            num_proc=num_proc if num_proc and num_proc > 1 else None,
+            remove_columns=train_dataset.column_names,
+            fn_kwargs={'tokenizer': self.tokenizer, 'max_length': self.max_length},
+            desc="分词"
+        )
         
         # 训练参数
         training_args = TrainingArguments(
@@ -199,7 +351,7 @@ class QwenTimeSeriesModel:
             learning_rate=learning_rate,
             warmup_steps=100,
             logging_steps=10,
-            save_steps=500,
+            save_steps=save_steps,
             save_total_limit=2,
             remove_unused_columns=False,
             dataloader_pin_memory=False,
@@ -221,57 +373,186 @@ class QwenTimeSeriesModel:
             data_collator=data_collator,
         )
         
-        logger.info("开始训练...")
-        trainer.train()
+        last_checkpoint = None
+        if resume and os.path.isdir(output_dir):
+            last_checkpoint = get_last_checkpoint(output_dir)
+        
+        if last_checkpoint:
+            logger.info(f"从检查点继续训练: {last_checkpoint}")
+        else:
+            logger.info("开始训练...")
+        trainer.train(resume_from_checkpoint=last_checkpoint)
+        self._prefix_cache.clear()
         
         # 保存模型
         trainer.save_model()
         self.tokenizer.save_pretrained(output_dir)
         
         self.is_trained = True
+        self._save_config(output_dir)
         logger.info(f"训练完成，模型保存至: {output_dir}")
     
     def predict_single(self, input_sequence: List[float], task_type: str = "weather") -> float:
         """单次预测"""
-        if self.model is None:
-            raise ValueError("请先加载模型")
+        return self.predict_batch([input_sequence], task_type)[0]
+    
+    def _prefix_entry(self, prefix: str) -> Optional[Tuple[List[int], "DynamicCache"]]:
+        """返回前缀的 (token列表, KV缓存)；每个前缀只在首次使用时做一次前向计算"""
+        if not self.use_prefix_cache or not PREFIX_CACHE_SUPPORTED:
+            return None
         
-        # 生成提示词
-        prompt = self.format_time_series_prompt(input_sequence, task_type)
+        entry = self._prefix_cache.get(prefix)
+        if entry is None:
+            prefix_ids = self.tokenizer(prefix)['input_ids']
+            cache = DynamicCache()
+            with torch.no_grad():
+                self.model(input_ids=torch.tensor([prefix_ids], device=self.device),
+                           past_key_values=cache, use_cache=True)
+            entry = (prefix_ids, cache)
+            self._prefix_cache[prefix] = entry
+            logger.info(f"已缓存提示词前缀KV: {len(prefix_ids)} 个token")
+        return entry
+    
+    def _generation_constraints(self, prompt_length: int) -> Dict:
+        """约束解码的 generate 参数：数值 LogitsProcessor、结束符和按数值格式计算的生成长度上限"""
+        if not self.constrained_decoding:
+            return {'max_new_tokens': self.max_new_tokens}
         
-        # 编码输入
-        inputs = self.tokenizer(
-            prompt,
-            return_tensors="pt",
-            truncation=True,
-            max_length=self.max_length
-        ).to(self.device)
+        if self._numeric_vocabulary is None:
+            self._numeric_vocabulary = NumericVocabulary(self.tokenizer)
+        
+        eos_token_id = self.tokenizer.eos_token_id
+        return {
+            'max_new_tokens': min(self.max_new_tokens, self.number_grammar.max_new_tokens()),
+            'eos_token_id': eos_token_id,
+            'logits_processor': LogitsProcessorList([NumericLogitsProcessor(
+                self._numeric_vocabulary, self.number_grammar, prompt_length, eos_token_id
+            )])
+        }
+    
+    def _generate_micro_batch(self, token_ids: List[List[int]], prefix_entry=None) -> List[str]:
+        """对一个微批做一次 generate，只解码新生成的token
+        
+        没有前缀缓存时左填充；有前缀缓存时填充放在前缀和后缀之间（注意力掩码为0），
+        前缀直接使用复制并按批次扩展的KV缓存，只对后缀做预填充。
+        """
+        prefix_ids, prefix_cache = prefix_entry if prefix_entry else ([], None)
+        suffixes = [ids[len(prefix_ids):] for ids in token_ids]
+        longest = max(len(suffix) for suffix in suffixes)
+        pad_id = self.tokenizer.pad_token_id
+        
+        input_ids = [prefix_ids + [pad_id] * (longest - len(suffix)) + suffix for suffix in suffixes]
+        attention_mask = [[1] * len(prefix_ids) + [0] * (longest - len(suffix)) + [1] * len(suffix)
+                          for suffix in suffixes]
+        
+        kwargs = self._generation_constraints(len(prefix_ids) + longest)
+        if prefix_cache is not None:
+            # generate 会向缓存追加内容，每个微批使用一份副本
+            cache = copy.deepcopy(prefix_cache)
+            cache.batch_repeat_interleave(len(token_ids))
+            kwargs['past_key_values'] = cache
         
-        # 生成预测
         with torch.no_grad():
             outputs = self.model.generate(
-                **inputs,
-                max_new_tokens=50,
+                input_ids=torch.tensor(input_ids, device=self.device),
+                attention_mask=torch.tensor(attention_mask, device=self.device),
                 temperature=0.1,
                 do_sample=False,
-                pad_token_id=self.tokenizer.eos_token_id
+                pad_token_id=pad_id,
+                **kwargs
             )
         
-        # 解码输出
-        generated_text = self.tokenizer.decode(outputs[0], skip_special_tokens=True)
+        # 所有提示词的结尾对齐，新token从同一位置开始
+        return self.tokenizer.batch_decode(outputs[:, len(prefix_ids) + longest:],
+                                           skip_special_tokens=True)
+    
+    def _generate_in_micro_batches(self, token_ids: List[List[int]], prefix_entry=None) -> List[str]:
+        """按长度排序后切成微批生成；显存不足时把微批大小减半重试，直到为1仍失败才抛出异常"""
+        order = sorted(range(len(token_ids)), key=lambda i: len(token_ids[i]))
+        texts = [None] * len(token_ids)
+        
+        start = 0
+        while start < len(order):
+            batch = order[start:start + self.generation_batch_size]
+            try:
+                generated = self._generate_micro_batch([token_ids[i] for i in batch], prefix_entry)
+            except torch.cuda.OutOfMemoryError:
+                if self.generation_batch_size == 1:
+                    raise
+                self.generation_batch_size = max(1, self.generation_batch_size // 2)
+                torch.cuda.empty_cache()
+                logger.warning(f"生成时显存不足，微批大小减为 {self.generation_batch_size}")
+                continue
+            
+            for i, text in zip(batch, generated):
+                texts[i] = text
+            start += len(batch)
+        
+        return texts
+    
+    def generate_texts(self, prompts: List[str], prefix: Optional[str] = None) -> List[str]:
+        """批量生成
+        
+        prefix 为这些提示词共同的开头时复用它的KV缓存，只对其余部分做预填充；
+        分词后不以前缀token开头的提示词（分词边界与单独分词的前缀不一致）不使用缓存。
+        """
+        if self.model is None:
+            raise ValueError("请先加载模型")
+        
+        token_ids = self.tokenizer(prompts, truncation=True, max_length=self.max_length)['input_ids']
+        prefix_entry = self._prefix_entry(prefix) if prefix else None
+        
+        prefix_ids = prefix_entry[0] if prefix_entry else None
+        cached, uncached = [], []
+        for i, ids in enumerate(token_ids):
+            if prefix_ids and len(ids) > len(prefix_ids) and ids[:len(prefix_ids)] == prefix_ids:
+                cached.append(i)
+            else:
+                uncached.append(i)
         
-        # 解析预测结果
-        prediction = self.parse_prediction(generated_text)
+        texts = [None] * len(prompts)
+        for indices, entry in ((cached, prefix_entry), (uncached, None)):
+            if indices:
+                generated = self._generate_in_micro_batches([token_ids[i] for i in indices], entry)
+                for i, text in zip(indices, generated):
+                    texts[i] = text
         
-        return prediction
+        return texts
     
     def predict_batch(self, sequences: List[List[float]], task_type: str = "weather") -> List[float]:
-        """批量预测"""
-        predictions = []
-        for seq in sequences:
-            pred = self.predict_single(seq, task_type)
-            predictions.append(pred)
-        return predictions
+        """批量预测：按序列长度分组构造提示词（同组共享前缀）并批量生成，再按序列编码解码
+        
+        约束解码时生成内容一定是一个数值，按格式严格解析，不再有解析失败时返回0.0的情况。
+        """
+        groups = {}
+        for i, seq in enumerate(sequences):
+            groups.setdefault(len(seq), []).append(i)
+        
+        texts = [None] * len(sequences)
+        for indices in groups.values():
+            prompts, prefix = self.build_prompts([sequences[i] for i in indices], task_type)
+            for i, text in zip(indices, self.generate_texts(prompts, prefix)):
+                texts[i] = text
+        
+        if self.constrained_decoding:
+            return [self.encoding.decode(text, window) for text, window in zip(texts, sequences)]
+        return [self.parse_prediction(text, window) for text, window in zip(texts, sequences)]
+    
+    def predict_horizon(self, sequences: List[List[float]], horizon: int = 1,
+                        task_type: str = "weather") -> List[List[float]]:
+        """多步递推预测：每步对所有序列批量预测一次，把预测值追加到窗口末尾并丢弃最早的值"""
+        if horizon < 1:
+            raise ValueError("horizon 必须为正整数")
+        
+        windows = [list(seq) for seq in sequences]
+        forecasts = [[] for _ in sequences]
+        for _ in range(horizon):
+            preds = self.predict_batch(windows, task_type)
+            for window, forecast, pred in zip(windows, forecasts, preds):
+                forecast.append(pred)
+                window.append(pred)
+                del window[0]
+        return forecasts
     
     def save_model(self, save_path: str):
         """保存模型"""
@@ -284,28 +565,38 @@ class QwenTimeSeriesModel:
         self.model.save_pretrained(save_path)
         self.tokenizer.save_pretrained(save_path)
         
-        # 保存配置信息
+        self._save_config(save_path)
+        
+        logger.info(f"模型已保存至: {save_path}")
+    
+    def _save_config(self, save_path: str):
+        """保存配置信息，包括训练时使用的提示词格式版本"""
         config = {
             'model_name': self.model_name,
             'max_length': self.max_length,
-            'is_trained': self.is_trained
+            'is_trained': self.is_trained,
+            'prompt_version': self.prompt_version,
+            'encoding': self.encoding.config()
         }
         
         with open(os.path.join(save_path, 'model_config.json'), 'w') as f:
             json.dump(config, f, indent=2)
-        
-        logger.info(f"模型已保存至: {save_path}")
     
     def load_trained_model(self, model_path: str):
         """加载已训练的模型"""
         try:
-            # 加载配置
+            # 加载配置；没有记录提示词版本的模型按训练时的旧格式（版本1）构造提示词
             config_path = os.path.join(model_path, 'model_config.json')
             if os.path.exists(config_path):
                 with open(config_path, 'r') as f:
                     config = json.load(f)
                 self.max_length = config.get('max_length', self.max_length)
                 self.is_trained = config.get('is_trained', False)
+                self.prompt_version = config.get('prompt_version', 1)
+                self.set_encoding(config.get('encoding', DEFAULT_ENCODING))
+            else:
+                self.prompt_version = 1
+                self.set_encoding(DEFAULT_ENCODING)
             
             # 加载模型
             self.load_model(model_path)
@@ -0,0 +1,257 @@
+import numpy as np
+from abc import ABC, abstractmethod
+from numpy.lib.stride_tricks import sliding_window_view
+from typing import Callable, Dict, List, Optional, Union
+
+from models.numeric_decoding import NumberGrammar
+
+class SeriesEncoding(ABC):
+    """时间序列数值与提示词文本之间的编码方式
+
+    encode_contexts 把一批输入窗口编码为提示词中的数值部分，encode_targets 编码训练目标，
+    decode 把生成的文本解码回原始数值；三者都以原始输入窗口为上下文
+    （例如按窗口范围缩放的编码需要用它反缩放）。编码按整批窗口向量化计算。
+    训练和推理使用同一个编码，编码配置保存在模型配置中。
+    """
+
+    name = None
+    separator = ', '
+    # 逐点编码（数值变换与窗口无关、缩减上下文时保留最近的点）可以对整条序列只格式化一次
+    pointwise = True
+
+    def params(self) -> Dict:
+        return {}
+
+    def config(self) -> Dict:
+        return dict(self.params(), name=self.name)
+
+    @abstractmethod
+    def grammar(self) -> NumberGrammar:
+        """约束解码和严格解析使用的数值格式"""
+
+    @abstractmethod
+    def format_array(self, values: np.ndarray) -> np.ndarray:
+        """向量化格式化，返回与 values 同形状的字符串数组"""
+
+    def format_value(self, value: float) -> str:
+        return str(self.format_array(np.array([value], dtype=np.float64))[0])
+
+    def transform_windows(self, values: np.ndarray, windows: np.ndarray) -> np.ndarray:
+        """编码前按窗口变换数值，values 形状 (窗口数, k)，windows 形状 (窗口数, 窗口长度)；默认不变换"""
+        return values
+
+    def inverse(self, value: float, window: np.ndarray) -> float:
+        return value
+
+    def context_points(self, length: int) -> int:
+        """长度为 length 的窗口编码后的点数"""
+        return length
+
+    def reduce_windows(self, values: np.ndarray, points: int) -> np.ndarray:
+        """把每个窗口的上下文缩减到 points 个点，默认保留最近的值"""
+        return values[:, values.shape[1] - points:]
+
+    def _points(self, length: int, points: Optional[int]) -> int:
+        default = self.context_points(length)
+        return default if points is None else min(points, default)
+
+    def encode_contexts(self, windows, points: Optional[int] = None) -> List[str]:
+        """编码一批等长窗口，windows 形状 (窗口数, 窗口长度)"""
+        windows = np.asarray(windows, dtype=np.float64)
+        if windows.ndim == 1:
+            windows = windows[None, :]
+
+        points = self._points(windows.shape[1], points)
+        values = self.transform_windows(windows, windows)
+        if points < values.shape[1]:
+            values = self.reduce_windows(values, points)
+        return [self.separator.join(row) for row in self.format_array(values).tolist()]
+
+    def encode_series_windows(self, series: np.ndarray, length: int, start: int, stop: int,
+                              points: Optional[int] = None) -> List[str]:
+        """编码同一序列上的滑动窗口 series[i:i+length]（start <= i < stop）"""
+        if stop <= start:
+            return []
+
+        points = self._points(length, points)
+        if not self.pointwise:
+            return self.encode_contexts(sliding_window_view(series[start:stop + length - 1], length), points)
+
+        # 每个值只格式化一次，拼成一个字符串后按字符偏移切出每个窗口最近的 points 个值
+        strings = self.format_array(np.asarray(series[start + length - points:stop + length - 1],
+                                               dtype=np.float64)).tolist()
+        step = np.fromiter((len(text) for text in strings), dtype=np.int64, count=len(strings)) + len(self.separator)
+        offsets = np.concatenate([[0], np.cumsum(step)]).tolist()
+        joined = self.separator.join(strings)
+        width = len(self.separator)
+        return [joined[offsets[i]:offsets[i + points] - width] for i in range(stop - start)]
+
+    def encode_context(self, window, points: Optional[int] = None) -> str:
+        return self.encode_contexts(np.asarray(window, dtype=np.float64)[None, :], points)[0]
+
+    def encode_targets(self, targets, windows) -> List[str]:
+        """编码一批训练目标，windows 为对应的输入窗口"""
+        values = np.asarray(targets, dtype=np.float64).reshape(-1, 1)
+        values = self.transform_windows(values, np.asarray(windows, dtype=np.float64))
+        return self.format_array(values[:, 0]).tolist()
+
+    def encode_target(self, value: float, window) -> str:
+        return self.encode_targets([value], np.asarray(window, dtype=np.float64)[None, :])[0]
+
+    def decode(self, text: str, window) -> float:
+        """严格解码生成的文本，格式不合法时抛出 ValueError"""
+        return self.decode_number(self.grammar().parse(text), window)
+
+    def decode_number(self, number: float, window) -> float:
+        return float(self.inverse(number, np.asarray(window, dtype=np.float64)))
+
+def _decimal_strings(values: np.ndarray, precision: int) -> np.ndarray:
+    """与 f"{v:.{precision}f}".rstrip('0').rstrip('.') 相同的向量化格式化"""
+    if precision <= 0:
+        return np.char.mod('%.0f', values)
+    return np.char.rstrip(np.char.rstrip(np.char.mod(f'%.{precision}f', values), '0'), '.')
+
+class SpacedDigitsEncoding(SeriesEncoding):
+    """按位分解，字符之间加空格：12.34 -> 1 2 . 3 4（原有格式）"""
+
+    name = 'spaced_digits'
+
+    def __init__(self, precision: int = 4):
+        self.precision = precision
+
+    def params(self) -> Dict:
+        return {'precision': self.precision}
+
+    def grammar(self) -> NumberGrammar:
+        return NumberGrammar(max_decimals=self.precision, allow_spaces=True)
+
+    def format_array(self, values: np.ndarray) -> np.ndarray:
+        return np.char.join(' ', _decimal_strings(values, self.precision))
+
+class DigitsEncoding(SeriesEncoding):
+    """不加空格的十进制数：12.34 -> 12.34（数字仍逐位分词，token数约为按位分解的一半）"""
+
+    name = 'digits'
+
+    def __init__(self, precision: int = 4):
+        self.precision = precision
+
+    def params(self) -> Dict:
+        return {'precision': self.precision}
+
+    def grammar(self) -> NumberGrammar:
+        return NumberGrammar(max_decimals=self.precision, allow_spaces=False)
+
+    def format_array(self, values: np.ndarray) -> np.ndarray:
+        return _decimal_strings(values, self.precision)
+
+class ScaledIntEncoding(SeriesEncoding):
+    """固定精度的缩放整数
+
+    按窗口的最小值和范围把数值映射到 0..10^digits，每个值只有不超过 digits+1 位数字、
+    没有小数点；预测值用同一窗口的参数反缩放（可以超出窗口范围）。
+    """
+
+    name = 'scaled_int'
+    pointwise = False
+
+    def __init__(self, digits: int = 3):
+        self.digits = digits
+
+    def params(self) -> Dict:
+        return {'digits': self.digits}
+
+    def grammar(self) -> NumberGrammar:
+        return NumberGrammar(max_integer_digits=self.digits + 2, max_decimals=0, allow_spaces=False)
+
+    def _scale(self, windows: np.ndarray):
+        """每个窗口的 (最小值, 缩放系数)，形状 (窗口数, 1)"""
+        low = windows.min(axis=1, keepdims=True)
+        span = windows.max(axis=1, keepdims=True) - low
+        return low, np.where(span > 0, span / 10 ** self.digits, 1.0)
+
+    def transform_windows(self, values: np.ndarray, windows: np.ndarray) -> np.ndarray:
+        low, scale = self._scale(windows)
+        return np.round((values - low) / scale)
+
+    def inverse(self, value: float, window: np.ndarray) -> float:
+        low, scale = self._scale(window.reshape(1, -1))
+        return value * scale[0, 0] + low[0, 0]
+
+    def format_array(self, values: np.ndarray) -> np.ndarray:
+        return np.char.mod('%d', values.astype(np.int64))
+
+class PAAEncoding(DigitsEncoding):
+    """分段聚合近似（PAA）：把窗口分成 segments 段取均值作为上下文，预测目标仍是下一个原始值"""
+
+    name = 'paa'
+    pointwise = False
+
+    def __init__(self, segments: int = 16, precision: int = 4):
+        super().__init__(precision)
+        self.segments = segments
+
+    def params(self) -> Dict:
+        return {'segments': self.segments, 'precision': self.precision}
+
+    def context_points(self, length: int) -> int:
+        return min(self.segments, length)
+
+    def reduce_windows(self, values: np.ndarray, points: int) -> np.ndarray:
+        # 与 np.array_split 相同的分段：前 length % points 段多一个点
+        length = values.shape[1]
+        sizes = np.full(points, length // points)
+        sizes[:length % points] += 1
+        starts = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+        return np.add.reduceat(values, starts, axis=1) / sizes
+
+ENCODINGS = {
+    encoding.name: encoding
+    for encoding in (SpacedDigitsEncoding, DigitsEncoding, ScaledIntEncoding, PAAEncoding)
+}
+DEFAULT_ENCODING = SpacedDigitsEncoding.name
+
+def get_encoding(config: Union[str, Dict, None] = None) -> SeriesEncoding:
+    """由编码名称或 {'name': ..., 参数...} 构造编码"""
+    if config is None:
+        config = DEFAULT_ENCODING
+    if isinstance(config, str):
+        config = {'name': config}
+
+    params = dict(config)
+    name = params.pop('name', DEFAULT_ENCODING)
+    if name not in ENCODINGS:
+        raise ValueError(f"不支持的序列编码: {name}，可选: {', '.join(ENCODINGS)}")
+    return ENCODINGS[name](**params)
+
+class TokenBudgetPlanner:
+    """token预算规划：在 max_length 内为提示词安排尽量多的上下文点数
+
+    预留生成（或训练目标）所需的token，对一组窗口中编码后最长的窗口二分查找可容纳的点数，
+    避免分词器截断把最近的数值和提示词结尾截掉。
+    """
+
+    def __init__(self, tokenizer, max_length: int):
+        self.tokenizer = tokenizer
+        self.max_length = max_length
+
+    def count(self, text: str) -> int:
+        return len(self.tokenizer(text)['input_ids'])
+
+    def fit(self, build_prompt: Callable[[int], str], points: int, reserve: int = 0) -> int:
+        """返回使 build_prompt(点数) 的token数加上 reserve 不超过 max_length 的最大点数"""
+        budget = self.max_length - reserve
+        if self.count(build_prompt(points)) <= budget:
+            return points
+
+        best, low, high = 0, 1, points - 1
+        while low <= high:
+            middle = (low + high) // 2
+            if self.count(build_prompt(middle)) <= budget:
+                best, low = middle, middle + 1
+            else:
+                high = middle - 1
+
+        if best == 0:
+            raise ValueError(f"max_length={self.max_length} 不足以容纳提示词和预测输出")
+        return best
@@ -0,0 +1,331 @@
+import os
+import json
+import shutil
+import numpy as np
+import pandas as pd
+from typing import Dict, List, Optional
+from loguru import logger
+
+CACHE_SUFFIX = '.cache'
+META_FILE = 'meta.json'
+PROFILE_FILE = 'profile.json'
+CACHE_VERSION = 1
+
+# 列的存储类型: 数值列统一存为float64，时间列存为int64纳秒，其余按UTF-8字符串存储
+KIND_FLOAT = 'float64'
+KIND_DATETIME = 'datetime'
+KIND_STRING = 'string'
+
+NAT_VALUE = np.iinfo(np.int64).min
+
+class ColumnarCache:
+    """按列存储的数据集缓存
+
+    每列保存为一个原始二进制文件，数值列和时间列可以直接内存映射读取，
+    字符串列保存为 UTF-8 数据块 + 结束偏移量数组。列信息记录在 meta.json 中。
+    """
+
+    def __init__(self, cache_dir: str):
+        self.cache_dir = cache_dir
+
+        with open(os.path.join(cache_dir, META_FILE), 'r', encoding='utf-8') as f:
+            self.meta = json.load(f)
+
+        self._column_meta = {col['name']: col for col in self.meta['columns']}
+
+    @staticmethod
+    def cache_dir_for(file_path: str) -> str:
+        """源文件对应的缓存目录"""
+        return file_path + CACHE_SUFFIX
+
+    @staticmethod
+    def source_signature(file_path: str) -> Dict:
+        """源文件签名，用于判断缓存是否过期"""
+        stat = os.stat(file_path)
+        return {'size': stat.st_size, 'mtime': stat.st_mtime}
+
+    @classmethod
+    def is_valid(cls, cache_dir: str, file_path: Optional[str] = None) -> bool:
+        """检查缓存是否存在且与源文件一致"""
+        meta_path = os.path.join(cache_dir, META_FILE)
+        if not os.path.exists(meta_path):
+            return False
+
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return False
+
+        if meta.get('version') != CACHE_VERSION:
+            return False
+
+        # 源文件不存在时以缓存为准
+        if file_path and os.path.exists(file_path) and meta.get('source'):
+            return meta['source'] == cls.source_signature(file_path)
+
+        return True
+
+    @property
+    def columns(self) -> List[str]:
+        return [col['name'] for col in self.meta['columns']]
+
+    @property
+    def num_rows(self) -> int:
+        return self.meta['num_rows']
+
+    @property
+    def shape(self) -> tuple:
+        return (self.num_rows, len(self.meta['columns']))
+
+    def column_kind(self, name: str) -> str:
+        return self._column_meta[name]['kind']
+
+    def column_file(self, name: str) -> str:
+        """列在缓存目录中的文件名前缀"""
+        return self._column_meta[name]['file']
+
+    def save_meta(self):
+        """写回 meta.json（用于记录派生数据的信息）"""
+        with open(os.path.join(self.cache_dir, META_FILE), 'w', encoding='utf-8') as f:
+            json.dump(self.meta, f, ensure_ascii=False, indent=2)
+
+    def _path(self, name: str, ext: str) -> str:
+        return os.path.join(self.cache_dir, f"{self._column_meta[name]['file']}.{ext}")
+
+    def column(self, name: str, offset: int = 0, limit: Optional[int] = None) -> np.ndarray:
+        """读取单列，数值列和时间列返回内存映射视图（不复制数据）"""
+        if name not in self._column_meta:
+            raise KeyError(f"缓存中不存在列: {name}")
+
+        start = max(0, min(offset, self.num_rows))
+        stop = self.num_rows if limit is None else min(self.num_rows, start + max(0, limit))
+        kind = self.column_kind(name)
+
+        if kind == KIND_FLOAT:
+            return self._memmap(self._path(name, 'f64'), np.float64)[start:stop]
+
+        if kind == KIND_DATETIME:
+            return self._memmap(self._path(name, 'dt'), np.int64)[start:stop].view('datetime64[ns]')
+
+        return self._read_strings(name, start, stop)
+
+    def _memmap(self, path: str, dtype) -> np.ndarray:
+        if self.num_rows == 0:
+            return np.empty(0, dtype=dtype)
+        return np.memmap(path, dtype=dtype, mode='r', shape=(self.num_rows,))
+
+    def _read_strings(self, name: str, start: int, stop: int) -> np.ndarray:
+        values = np.empty(stop - start, dtype=object)
+        if stop <= start:
+            return values
+
+        offsets = self._memmap(self._path(name, 'off'), np.int64)
+        nulls = self._memmap(self._path(name, 'nul'), np.uint8)
+
+        begin = int(offsets[start - 1]) if start > 0 else 0
+        end = int(offsets[stop - 1])
+
+        with open(self._path(name, 'str'), 'rb') as f:
+            f.seek(begin)
+            blob = f.read(end - begin)
+
+        bounds = np.concatenate([[begin], offsets[start:stop]]) - begin
+        for i in range(stop - start):
+            if nulls[start + i]:
+                values[i] = None
+            else:
+                values[i] = blob[bounds[i]:bounds[i + 1]].decode('utf-8')
+
+        return values
+
+    def read(self, columns: Optional[List[str]] = None, offset: int = 0,
+             limit: Optional[int] = None) -> pd.DataFrame:
+        """读取为DataFrame，支持列投影和行范围"""
+        columns = columns or self.columns
+        data = {name: self.column(name, offset, limit) for name in columns}
+
+        df = pd.DataFrame(data, columns=columns)
+        if offset:
+            df.index = pd.RangeIndex(offset, offset + len(df))
+
+        return df
+
+    def iter_chunks(self, chunksize: int = 100000):
+        """按块遍历所有列，生成 列名 -> 数组 的映射"""
+        for start in range(0, self.num_rows, chunksize):
+            yield {name: self.column(name, start, chunksize) for name in self.columns}
+
+    @property
+    def kinds(self) -> Dict[str, str]:
+        return {col['name']: col['kind'] for col in self.meta['columns']}
+
+    def save_profile(self, profile: Dict):
+        """保存数据集画像"""
+        with open(os.path.join(self.cache_dir, PROFILE_FILE), 'w', encoding='utf-8') as f:
+            json.dump(profile, f, ensure_ascii=False, indent=2, default=str)
+
+    def load_profile(self) -> Optional[Dict]:
+        """读取数据集画像，不存在时返回None"""
+        path = os.path.join(self.cache_dir, PROFILE_FILE)
+        if not os.path.exists(path):
+            return None
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def read_records(self, columns: Optional[List[str]] = None, offset: int = 0,
+                     limit: Optional[int] = None) -> List[Dict]:
+        """读取指定行范围为可JSON序列化的记录列表（时间转ISO字符串，缺失值转None）"""
+        columns = columns or self.columns
+        values = {}
+        for name in columns:
+            column = self.column(name, offset, limit)
+            kind = self.column_kind(name)
+            if kind == KIND_FLOAT:
+                values[name] = [None if np.isnan(v) else float(v) for v in column]
+            elif kind == KIND_DATETIME:
+                values[name] = [None if np.isnat(v) else pd.Timestamp(v).isoformat() for v in column]
+            else:
+                values[name] = list(column)
+
+        num = len(values[columns[0]]) if columns else 0
+        return [{name: values[name][i] for name in columns} for i in range(num)]
+
+class ColumnarCacheWriter:
+    """按块追加写入列式缓存
+
+    列的存储类型由第一个数据块推断，后续数据块按该类型强制转换，
+    因此写入过程中内存占用只与块大小相关。
+    """
+
+    def __init__(self, cache_dir: str):
+        self.cache_dir = cache_dir
+        self.tmp_dir = cache_dir + '.tmp'
+        self.columns = None
+        self.num_rows = 0
+        self._files = {}
+        self._string_offsets = {}
+
+        if os.path.exists(self.tmp_dir):
+            shutil.rmtree(self.tmp_dir)
+        os.makedirs(self.tmp_dir)
+
+    @staticmethod
+    def infer_kind(series: pd.Series) -> str:
+        """推断列的存储类型"""
+        if pd.api.types.is_bool_dtype(series) or pd.api.types.is_numeric_dtype(series):
+            return KIND_FLOAT
+
+        if pd.api.types.is_datetime64_any_dtype(series):
+            return KIND_DATETIME
+
+        # pandas 3 默认把文本列读成 StringDtype，不再是 object
+        if pd.api.types.is_object_dtype(series) or pd.api.types.is_string_dtype(series):
+            non_null = series.dropna()
+            if len(non_null) > 0:
+                try:
+                    pd.to_datetime(non_null)
+                    return KIND_DATETIME
+                except (ValueError, TypeError, OverflowError):
+                    pass
+
+        return KIND_STRING
+
+    def _init_columns(self, df: pd.DataFrame):
+        self.columns = []
+        for i, name in enumerate(df.columns):
+            kind = self.infer_kind(df[name])
+            col = {'name': str(name), 'kind': kind, 'file': f"col_{i}"}
+            self.columns.append(col)
+
+            if kind == KIND_FLOAT:
+                self._files[col['name']] = [open(self._tmp_path(col, 'f64'), 'wb')]
+            elif kind == KIND_DATETIME:
+                self._files[col['name']] = [open(self._tmp_path(col, 'dt'), 'wb')]
+            else:
+                self._files[col['name']] = [
+                    open(self._tmp_path(col, 'str'), 'wb'),
+                    open(self._tmp_path(col, 'off'), 'wb'),
+                    open(self._tmp_path(col, 'nul'), 'wb')
+                ]
+                self._string_offsets[col['name']] = 0
+
+    def _tmp_path(self, col: Dict, ext: str) -> str:
+        return os.path.join(self.tmp_dir, f"{col['file']}.{ext}")
+
+    @property
+    def kinds(self) -> Dict[str, str]:
+        return {col['name']: col['kind'] for col in (self.columns or [])}
+
+    def append(self, df: pd.DataFrame) -> Dict[str, np.ndarray]:
+        """追加一个数据块，返回转换后的各列数组供调用方复用（如流式统计）"""
+        if self.columns is None:
+            self._init_columns(df)
+
+        if len(df.columns) != len(self.columns):
+            raise ValueError(f"数据块列数不一致: {len(df.columns)} != {len(self.columns)}")
+
+        arrays = {}
+        for col, (_, series) in zip(self.columns, df.items()):
+            files = self._files[col['name']]
+
+            if col['kind'] == KIND_FLOAT:
+                values = pd.to_numeric(series, errors='coerce').to_numpy(dtype=np.float64, na_value=np.nan)
+                files[0].write(np.ascontiguousarray(values).tobytes())
+                arrays[col['name']] = values
+
+            elif col['kind'] == KIND_DATETIME:
+                values = pd.to_datetime(series, errors='coerce')
+                raw = values.to_numpy(dtype='datetime64[ns]').view(np.int64)
+                files[0].write(np.ascontiguousarray(raw).tobytes())
+                arrays[col['name']] = raw
+
+            else:
+                arrays[col['name']] = series.to_numpy(dtype=object)
+                nulls = series.isna().to_numpy()
+                encoded = [b'' if is_null else str(val).encode('utf-8')
+                           for val, is_null in zip(series.tolist(), nulls)]
+                lengths = np.fromiter((len(b) for b in encoded), dtype=np.int64, count=len(encoded))
+                offsets = self._string_offsets[col['name']] + np.cumsum(lengths)
+
+                files[0].write(b''.join(encoded))
+                files[1].write(offsets.astype(np.int64).tobytes())
+                files[2].write(nulls.astype(np.uint8).tobytes())
+
+                if len(offsets):
+                    self._string_offsets[col['name']] = int(offsets[-1])
+
+        self.num_rows += len(df)
+
+        return arrays
+
+    def close(self, source_path: Optional[str] = None) -> ColumnarCache:
+        """完成写入，原子替换旧缓存"""
+        for files in self._files.values():
+            for f in files:
+                f.close()
+
+        meta = {
+            'version': CACHE_VERSION,
+            'num_rows': self.num_rows,
+            'columns': self.columns or [],
+            'source': ColumnarCache.source_signature(source_path) if source_path else None
+        }
+
+        with open(os.path.join(self.tmp_dir, META_FILE), 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False, indent=2)
+
+        if os.path.exists(self.cache_dir):
+            shutil.rmtree(self.cache_dir)
+        os.replace(self.tmp_dir, self.cache_dir)
+
+        logger.info(f"列式缓存写入完成: {self.cache_dir}, {self.num_rows} 行")
+
+        return ColumnarCache(self.cache_dir)
+
+    def abort(self):
+        """放弃写入"""
+        for files in self._files.values():
+            for f in files:
+                f.close()
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
@@ -1,7 +1,6 @@
 import pandas as pd
 import numpy as np
 from sklearn.preprocessing import MinMaxScaler, StandardScaler
-from sklearn.model_selection import train_test_split
 import matplotlib.pyplot as plt
 import seaborn as sns
 from typing import Tuple, Dict, List, Optional, Union
@@ -10,6 +9,11 @@ import json
 from datetime import datetime, timedelta
 from loguru import logger
 
+from utils.columnar_cache import ColumnarCache, ColumnarCacheWriter
+from utils.streaming_stats import DatasetStatsAccumulator
+from utils.sliding_window import SlidingWindowView
+from utils.series_pyramid import SeriesPyramid
+
 class TimeSeriesProcessor:
     """时间序列数据处理工具"""
     
@@ -17,15 +21,24 @@ class TimeSeriesProcessor:
         self.scaler = None
         self.data_info = {}
         
-    def load_data(self, file_path: str) -> pd.DataFrame:
-        """加载数据文件"""
+    def load_data(self, file_path: str, columns: Optional[List[str]] = None,
+                  use_cache: bool = True) -> pd.DataFrame:
+        """加载数据文件，存在有效的列式缓存时直接从缓存读取"""
         try:
+            cache_dir = ColumnarCache.cache_dir_for(file_path)
+            if use_cache and ColumnarCache.is_valid(cache_dir, file_path):
+                df = ColumnarCache(cache_dir).read(columns)
+                logger.info(f"从列式缓存加载数据: {df.shape}")
+                return df
+            
             if file_path.endswith('.csv'):
-                df = pd.read_csv(file_path)
+                df = pd.read_csv(file_path, usecols=columns)
             elif file_path.endswith(('.xlsx', '.xls')):
-                df = pd.read_excel(file_path)
+                df = pd.read_excel(file_path, usecols=columns)
             elif file_path.endswith('.json'):
                 df = pd.read_json(file_path)
+                if columns:
+                    df = df[columns]
             else:
                 raise ValueError(f"不支持的文件格式: {file_path}")
             
@@ -36,6 +49,113 @@ class TimeSeriesProcessor:
             logger.error(f"数据加载失败: {e}")
             raise
     
+    def iter_chunks(self, file_path: str, chunksize: int = 100000):
+        """按块读取原始数据文件，CSV按块流式读取，其余格式整体读取"""
+        if file_path.endswith('.csv'):
+            yield from pd.read_csv(file_path, chunksize=chunksize)
+        else:
+            yield self.load_data(file_path, use_cache=False)
+    
+    def open_cache(self, file_path: str, chunksize: int = 100000) -> ColumnarCache:
+        """打开数据文件的列式缓存，缓存不存在或已过期时重新构建"""
+        cache_dir = ColumnarCache.cache_dir_for(file_path)
+        if not ColumnarCache.is_valid(cache_dir, file_path):
+            self.build_cache(file_path, chunksize)
+        return ColumnarCache(cache_dir)
+    
+    def ingest(self, file_path: str, chunksize: int = 100000) -> Dict:
+        """单遍流式导入数据文件
+        
+        按块读取原始文件，同时写入列式缓存并累积统计信息（形状、列类型、
+        缺失值、最值、均值、标准差、近似分位数），峰值内存只与块大小相关。
+        """
+        cache_dir = ColumnarCache.cache_dir_for(file_path)
+        writer = ColumnarCacheWriter(cache_dir)
+        stats = DatasetStatsAccumulator()
+        
+        try:
+            for chunk in self.iter_chunks(file_path, chunksize):
+                arrays = writer.append(chunk)
+                stats.update(arrays, writer.kinds)
+            cache = writer.close(source_path=file_path)
+        except Exception:
+            writer.abort()
+            raise
+        
+        analysis = stats.to_analysis()
+        analysis['memory_usage'] = sum(
+            os.path.getsize(os.path.join(cache_dir, name)) for name in os.listdir(cache_dir)
+        )
+        
+        profile = self._build_profile(cache, stats, chunksize)
+        
+        # 为数值列预计算图表用的降采样金字塔
+        SeriesPyramid.build_all(cache, stats.numeric_columns, chunksize=chunksize)
+        
+        self.data_info = analysis
+        logger.info(f"数据导入完成: {cache.num_rows} 行, {len(cache.columns)} 列")
+        
+        return {
+            'cache_path': cache_dir,
+            'analysis': analysis,
+            'stats': stats,
+            'profile': profile
+        }
+    
+    def _build_profile(self, cache: ColumnarCache, stats: DatasetStatsAccumulator,
+                       chunksize: int = 100000) -> Dict:
+        """生成并保存数据集画像，异常值数量在内存映射的缓存列上按块精确统计"""
+        outlier_counts = {}
+        for name in stats.numeric_columns:
+            if stats.numeric[name].count == 0:
+                continue
+            lower, upper = stats.iqr_bounds(name)
+            column = cache.column(name)
+            count = 0
+            for start in range(0, len(column), chunksize):
+                segment = column[start:start + chunksize]
+                count += int(((segment < lower) | (segment > upper)).sum())
+            outlier_counts[name] = count
+        
+        profile = stats.to_profile(outlier_counts)
+        cache.save_profile(profile)
+        return profile
+    
+    def profile_dataset(self, file_path: str, chunksize: int = 100000) -> Dict:
+        """读取数据集画像；没有画像时在列式缓存上流式计算一次并保存"""
+        cache = self.open_cache(file_path, chunksize)
+        profile = cache.load_profile()
+        if profile is not None:
+            return profile
+        
+        stats = DatasetStatsAccumulator()
+        for arrays in cache.iter_chunks(chunksize):
+            stats.update(arrays, cache.kinds)
+        
+        return self._build_profile(cache, stats, chunksize)
+    
+    def build_cache(self, file_path: str, chunksize: int = 100000) -> str:
+        """将原始数据文件转换为列式缓存，返回缓存目录"""
+        return self.ingest(file_path, chunksize)['cache_path']
+    
+    @staticmethod
+    def analysis_from_profile(profile: Dict) -> Dict:
+        """由数据集画像还原 analyze_data 结构的分析结果"""
+        columns = profile['columns']
+        stat_keys = ['count', 'mean', 'std', 'min', '25%', '50%', '75%', 'max']
+        return {
+            'shape': [profile['num_rows'], profile['num_columns']],
+            'columns': list(columns.keys()),
+            'dtypes': {name: info['kind'] for name, info in columns.items()},
+            'missing_values': {name: info['missing'] for name, info in columns.items()},
+            'statistics': {
+                name: {key: columns[name].get(key) for key in stat_keys}
+                for name in profile['numeric_columns']
+            },
+            'datetime_columns': profile['datetime_columns'],
+            'numeric_columns': profile['numeric_columns']
+        }
+    
     def analyze_data(self, df: pd.DataFrame) -> Dict:
         """分析数据基本信息"""
         analysis = {
@@ -50,7 +170,9 @@ class TimeSeriesProcessor:
         # 检测时间列
         datetime_columns = []
         for col in df.columns:
-            if df[col].dtype == 'object':
+            if pd.api.types.is_datetime64_any_dtype(df[col]):
+                datetime_columns.append(col)
+            elif df[col].dtype == 'object':
                 try:
                     pd.to_datetime(df[col])
                     datetime_columns.append(col)
@@ -88,9 +210,9 @@ class TimeSeriesProcessor:
         
         # 处理缺失值
         if fill_missing == 'forward':
-            df_cleaned = df_cleaned.fillna(method='ffill')
+            df_cleaned = df_cleaned.ffill()
         elif fill_missing == 'backward':
-            df_cleaned = df_cleaned.fillna(method='bfill')
+            df_cleaned = df_cleaned.bfill()
         elif fill_missing == 'mean':
             for col in df_cleaned.select_dtypes(include=[np.number]).columns:
                 df_cleaned[col] = df_cleaned[col].fillna(df_cleaned[col].mean())
@@ -149,53 +271,58 @@ class TimeSeriesProcessor:
         
         return df_normalized, scaler
     
+    def create_windows(self, data: pd.DataFrame,
+                       target_column: str,
+                       sequence_length: int = 10,
+                       prediction_horizon: int = 1) -> SlidingWindowView:
+        """创建零拷贝的滑动窗口视图"""
+        
+        if target_column not in data.columns:
+            raise ValueError(f"目标列 '{target_column}' 不存在于数据中")
+        
+        values = data[target_column].to_numpy()
+        return SlidingWindowView(values, sequence_length, horizon=prediction_horizon)
+    
     def create_sequences(self, data: pd.DataFrame, 
                         target_column: str,
                         sequence_length: int = 10,
                         prediction_horizon: int = 1) -> Tuple[np.ndarray, np.ndarray]:
-        """创建时间序列序列"""
+        """创建时间序列序列，返回的X和y是原序列上的只读视图"""
         
-        if target_column not in data.columns:
-            raise ValueError(f"目标列 '{target_column}' 不存在于数据中")
+        windows = self.create_windows(data, target_column, sequence_length, prediction_horizon)
+        X, y = windows.X, windows.y
         
-        values = data[target_column].values
-        
-        X, y = [], []
+        logger.info(f"创建序列完成: X形状 {X.shape}, y形状 {y.shape}")
         
-        for i in range(len(values) - sequence_length - prediction_horizon + 1):
-            # 输入序列
-            X.append(values[i:i + sequence_length])
-            # 目标值
-            if prediction_horizon == 1:
-                y.append(values[i + sequence_length])
-            else:
-                y.append(values[i + sequence_length:i + sequence_length + prediction_horizon])
+        return X, y
+    
+    @staticmethod
+    def split_sizes(n_samples: int, train_ratio: float = 0.7, val_ratio: float = 0.15,
+                    test_ratio: float = 0.15) -> Tuple[int, int, int]:
+        """按时间顺序分割时各部分的样本数"""
         
-        X = np.array(X)
-        y = np.array(y)
+        if abs(train_ratio + val_ratio + test_ratio - 1.0) > 1e-6:
+            raise ValueError("训练、验证和测试比例之和必须等于1")
         
-        logger.info(f"创建序列完成: X形状 {X.shape}, y形状 {y.shape}")
+        # 与 train_test_split(shuffle=False) 的取整方式保持一致
+        n_temp = int(np.ceil((val_ratio + test_ratio) * n_samples))
+        n_train = n_samples - n_temp
+        val_size = val_ratio / (val_ratio + test_ratio)
+        n_test = int(np.ceil((1 - val_size) * n_temp))
+        n_val = n_temp - n_test
         
-        return X, y
+        return n_train, n_val, n_test
     
     def split_data(self, X: np.ndarray, y: np.ndarray, 
                    train_ratio: float = 0.7, val_ratio: float = 0.15,
                    test_ratio: float = 0.15, random_state: int = 42) -> Tuple:
-        """分割数据集"""
-        
-        if abs(train_ratio + val_ratio + test_ratio - 1.0) > 1e-6:
-            raise ValueError("训练、验证和测试比例之和必须等于1")
+        """按时间顺序分割数据集，结果为输入数组的切片视图"""
         
-        # 首先分割出训练集和临时集（验证+测试）
-        X_train, X_temp, y_train, y_temp = train_test_split(
-            X, y, test_size=(val_ratio + test_ratio), random_state=random_state, shuffle=False
-        )
+        n_train, n_val, n_test = self.split_sizes(len(X), train_ratio, val_ratio, test_ratio)
         
-        # 然后分割临时集为验证集和测试集
-        val_size = val_ratio / (val_ratio + test_ratio)
-        X_val, X_test, y_val, y_test = train_test_split(
-            X_temp, y_temp, test_size=(1 - val_size), random_state=random_state, shuffle=False
-        )
+        X_train, y_train = X[:n_train], y[:n_train]
+        X_val, y_val = X[n_train:n_train + n_val], y[n_train:n_train + n_val]
+        X_test, y_test = X[n_train + n_val:], y[n_train + n_val:]
         
         logger.info(f"数据分割完成 - 训练: {X_train.shape[0]}, 验证: {X_val.shape[0]}, 测试: {X_test.shape[0]}")
         
@@ -362,6 +489,25 @@ class DataValidator:
         
         return results
     
+    @staticmethod
+    def validate_from_profile(profile: Dict, target_column: str) -> Dict[str, bool]:
+        """基于已保存的数据集画像验证时间序列数据，规则与 validate_time_series 相同"""
+        results = {}
+        
+        column = profile['columns'].get(target_column)
+        results['target_column_exists'] = column is not None
+        results['has_numeric_data'] = target_column in profile['numeric_columns']
+        results['low_missing_ratio'] = column is not None and column['missing_ratio'] < 0.1
+        results['sufficient_length'] = profile['num_rows'] >= 100
+        
+        outliers = column.get('outliers') if column else None
+        if results['has_numeric_data'] and outliers and outliers.get('ratio') is not None:
+            results['reasonable_outliers'] = outliers['ratio'] < 0.05
+        else:
+            results['reasonable_outliers'] = False
+        
+        return results
+    
     @staticmethod
     def check_data_quality(df: pd.DataFrame) -> Dict:
         """检查数据质量"""
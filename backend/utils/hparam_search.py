@@ -0,0 +1,243 @@
+import os
+import math
+import json
+import itertools
+import multiprocessing
+import numpy as np
+import torch
+import torch.nn as nn
+import torch.optim as optim
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import resource_tracker, shared_memory
+from typing import Callable, Dict, List, Optional
+from loguru import logger
+
+try:
+    # Celery 自带的 multiprocessing 分支，允许守护进程（prefork worker 的子进程）创建进程池
+    import billiard
+except ImportError:
+    billiard = None
+
+from models.lstm_model import LSTMPredictor, TimeSeriesBatchLoader
+
+def sample_configs(search_space: Dict[str, List], n_trials: Optional[int] = None,
+                   seed: int = 42) -> List[Dict]:
+    """由取值网格生成试验配置，网格超过 n_trials 时无放回随机抽样"""
+    keys = sorted(search_space)
+    grid = [dict(zip(keys, values)) for values in itertools.product(*(search_space[k] for k in keys))]
+
+    if n_trials is None or n_trials >= len(grid):
+        return grid
+
+    rng = np.random.default_rng(seed)
+    picked = rng.choice(len(grid), size=n_trials, replace=False)
+    return [grid[i] for i in sorted(picked)]
+
+def rung_budgets(min_epochs: int, max_epochs: int, reduction_factor: int) -> List[int]:
+    """逐次减半各轮的累计训练轮数: min_epochs * eta^k，最后一轮为 max_epochs"""
+    budgets = []
+    budget = min_epochs
+    while budget < max_epochs:
+        budgets.append(budget)
+        budget *= reduction_factor
+    budgets.append(max_epochs)
+    return budgets
+
+# 当前进程创建的共享内存段；挂载其他进程创建的段时不应由本进程的 resource_tracker 跟踪
+_OWNED_SEGMENTS = set()
+
+def _attach_series(shm_name: str, length: int):
+    """在子进程中挂载共享内存中的归一化序列（只读视图，不复制）"""
+    try:
+        shm = shared_memory.SharedMemory(name=shm_name, track=False)
+    except TypeError:
+        # Python 3.13 之前没有 track 参数：挂载时会登记到子进程的 resource_tracker，
+        # 子进程退出时共享内存段会被提前删除，因此取消登记
+        shm = shared_memory.SharedMemory(name=shm_name)
+        if shm_name not in _OWNED_SEGMENTS:
+            resource_tracker.unregister(shm._name, 'shared_memory')
+    series = np.ndarray((length,), dtype=np.float64, buffer=shm.buf)
+    return shm, series
+
+def _run_trial(shm_name: str, length: int, train_size: int, trial: Dict,
+               target_epochs: int, batch_size: int, checkpoint_path: str,
+               num_threads: int = 1) -> Dict:
+    """进程池任务：把一个试验从检查点继续训练到 target_epochs 轮，返回验证损失
+
+    模块级函数以便序列化；模型和优化器状态保存在 checkpoint_path，
+    下一轮逐次减半时从该检查点继续训练。
+    """
+    if num_threads:
+        torch.set_num_threads(num_threads)
+
+    shm, series = _attach_series(shm_name, length)
+    try:
+        config = trial['config']
+        predictor = LSTMPredictor(
+            sequence_length=config['sequence_length'],
+            hidden_size=config['hidden_size'],
+            num_layers=config['num_layers'],
+            dropout=config.get('dropout', 0.2)
+        )
+        predictor.build_model()
+
+        train_loader = TimeSeriesBatchLoader(series[:train_size], predictor.sequence_length,
+                                             batch_size=batch_size, shuffle=True,
+                                             device=predictor.device, seed=trial['seed'])
+        val_loader = TimeSeriesBatchLoader(series[train_size:], predictor.sequence_length,
+                                           batch_size=batch_size, device=predictor.device)
+        if len(train_loader) == 0 or len(val_loader) == 0:
+            raise ValueError(f"数据长度不足以构造序列长度为 {predictor.sequence_length} 的窗口")
+
+        criterion = nn.MSELoss()
+        optimizer = optim.Adam(predictor.model.parameters(), lr=config['learning_rate'])
+
+        epochs_done = 0
+        val_losses = []
+        if os.path.exists(checkpoint_path):
+            state = torch.load(checkpoint_path, map_location=predictor.device)
+            predictor.model.load_state_dict(state['model'])
+            optimizer.load_state_dict(state['optimizer'])
+            epochs_done = state['epochs']
+            val_losses = state['val_losses']
+
+        for _ in range(epochs_done, target_epochs):
+            predictor.train_epoch(train_loader, optimizer, criterion)
+            val_losses.append(predictor.validation_loss(val_loader, criterion))
+
+        torch.save({
+            'model': predictor.model.state_dict(),
+            'optimizer': optimizer.state_dict(),
+            'epochs': target_epochs,
+            'val_losses': val_losses
+        }, checkpoint_path)
+
+        return {
+            'trial_id': trial['trial_id'],
+            'epochs': target_epochs,
+            'val_loss': min(val_losses) if val_losses else float('inf'),
+            'val_losses': val_losses
+        }
+    finally:
+        del series
+        shm.close()
+
+class SuccessiveHalvingSearch:
+    """LSTM超参数的并行逐次减半搜索
+
+    归一化后的序列只准备一次并放入共享内存，各试验在进程池中按配置构造窗口训练。
+    每一轮把存活试验继续训练到该轮的累计轮数，按验证损失保留前 1/reduction_factor，
+    直到最后一轮训练满 max_epochs。
+
+    进程池优先使用 billiard：Celery 默认的 prefork worker 是守护进程，标准库的
+    ProcessPoolExecutor 不能在其中创建子进程，billiard 可以，因此调优任务在默认
+    worker 中也能并行。未安装 billiard 时使用 ProcessPoolExecutor，此时调优任务需要
+    运行在非守护进程的 worker 中（如 --pool=solo 或 --pool=threads）。
+    进程池不可用时以警告记录并在当前进程中串行执行；max_workers <= 1 时直接串行执行。
+    """
+
+    def __init__(self, series: np.ndarray, train_ratio: float = 0.8,
+                 working_dir: str = './workspace/tuning', max_workers: Optional[int] = None,
+                 batch_size: int = 32, reduction_factor: int = 3, seed: int = 42,
+                 threads_per_worker: int = 1):
+        self.series = np.ascontiguousarray(series, dtype=np.float64).ravel()
+        self.train_size = int(len(self.series) * train_ratio)
+        self.working_dir = working_dir
+        self.max_workers = max_workers if max_workers is not None else max(1, (os.cpu_count() or 2) - 1)
+        self.batch_size = batch_size
+        self.reduction_factor = max(2, reduction_factor)
+        self.seed = seed
+        self.threads_per_worker = threads_per_worker
+
+        os.makedirs(os.path.join(working_dir, 'trials'), exist_ok=True)
+
+    def _checkpoint_path(self, trial_id: int) -> str:
+        return os.path.join(self.working_dir, 'trials', f"trial_{trial_id}.pt")
+
+    def _run_rung(self, shm_name: str, trials: List[Dict], budget: int) -> List[Dict]:
+        jobs = [(shm_name, len(self.series), self.train_size, trial, budget, self.batch_size,
+                 self._checkpoint_path(trial['trial_id']), self.threads_per_worker) for trial in trials]
+
+        if self.max_workers > 1 and len(jobs) > 1:
+            workers = min(self.max_workers, len(jobs))
+            try:
+                if billiard is not None:
+                    with billiard.get_context('spawn').Pool(processes=workers) as pool:
+                        return pool.starmap(_run_trial, jobs)
+                
+                context = multiprocessing.get_context('spawn')
+                with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+                    return list(executor.map(_run_trial, *zip(*jobs)))
+            except (OSError, AssertionError, RuntimeError) as e:
+                # 例如未安装 billiard 时，Celery prefork 的守护进程不能创建子进程
+                logger.warning(f"进程池不可用，{len(jobs)} 个试验改为在当前进程中串行执行"
+                               f"（需要安装 billiard，或把调优任务放在非守护进程的 worker 中）: {e}")
+
+        return [_run_trial(*job) for job in jobs]
+
+    def run(self, configs: List[Dict], min_epochs: int = 2, max_epochs: int = 30,
+            progress_callback: Optional[Callable[[int, int], None]] = None) -> Dict:
+        """执行搜索，返回最佳试验、各轮记录和所有试验结果"""
+        if not configs:
+            raise ValueError("没有可搜索的配置")
+
+        trials = [{'trial_id': i, 'config': config, 'seed': self.seed + i}
+                  for i, config in enumerate(configs)]
+        budgets = rung_budgets(min_epochs, max_epochs, self.reduction_factor)
+        results = {trial['trial_id']: {'config': trial['config'], 'epochs': 0, 'val_loss': None,
+                                       'pruned_at': None} for trial in trials}
+        rungs = []
+
+        shm = shared_memory.SharedMemory(create=True, size=max(1, self.series.nbytes))
+        _OWNED_SEGMENTS.add(shm.name)
+        try:
+            np.ndarray(self.series.shape, dtype=np.float64, buffer=shm.buf)[:] = self.series
+
+            survivors = trials
+            for rung, budget in enumerate(budgets):
+                outcomes = self._run_rung(shm.name, survivors, budget)
+                for outcome in outcomes:
+                    results[outcome['trial_id']].update(
+                        epochs=outcome['epochs'], val_loss=outcome['val_loss'],
+                        val_losses=outcome['val_losses']
+                    )
+
+                # NaN 损失排在最后，避免排序结果不确定
+                ranked = sorted(outcomes, key=lambda o: o['val_loss'] if math.isfinite(o['val_loss'])
+                                else float('inf'))
+                keep = max(1, math.ceil(len(ranked) / self.reduction_factor))
+                if rung == len(budgets) - 1:
+                    keep = 1
+
+                kept_ids = {o['trial_id'] for o in ranked[:keep]}
+                for outcome in ranked[keep:]:
+                    results[outcome['trial_id']]['pruned_at'] = budget
+
+                rungs.append({'epochs': budget, 'trials': len(outcomes), 'kept': sorted(kept_ids)})
+                logger.info(f"逐次减半第 {rung + 1}/{len(budgets)} 轮: {len(outcomes)} 个试验训练到 "
+                            f"{budget} 轮，最佳验证损失 {ranked[0]['val_loss']:.6f}")
+
+                if progress_callback:
+                    progress_callback(rung + 1, len(budgets))
+
+                survivors = [trial for trial in survivors if trial['trial_id'] in kept_ids]
+        finally:
+            _OWNED_SEGMENTS.discard(shm.name)
+            shm.close()
+            shm.unlink()
+
+        best = survivors[0]
+        return {
+            'best_trial_id': best['trial_id'],
+            'best_config': best['config'],
+            'best_val_loss': results[best['trial_id']]['val_loss'],
+            'best_checkpoint': self._checkpoint_path(best['trial_id']),
+            'rungs': rungs,
+            'trials': [dict(trial_id=tid, **info) for tid, info in results.items()]
+        }
+
+    def save_summary(self, summary: Dict) -> str:
+        path = os.path.join(self.working_dir, 'search_results.json')
+        with open(path, 'w') as f:
+            json.dump(summary, f, indent=2, default=str)
+        return path
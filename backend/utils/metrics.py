@@ -0,0 +1,130 @@
+import math
+import numpy as np
+from typing import Dict, Optional
+
+# compute() 返回的指标名（不含样本数）
+METRIC_KEYS = ('mse', 'mae', 'rmse', 'mape', 'smape', 'r2', 'bias')
+
+class StreamingMetrics:
+    """流式回归指标：MSE、MAE、RMSE、MAPE、sMAPE、R² 和偏差
+
+    每个批次只累加少量标量（误差和、平方误差和、实际值的均值和二阶矩等），
+    内存占用与样本数无关。批次可以是numpy数组、列表或torch张量；张量在所在设备上
+    做归约，每个批次只把一个小向量拷回CPU。实际值的方差用Chan合并公式累计，
+    避免大样本下 sum(y²) - n·mean² 的数值抵消。
+    """
+
+    # |实际值| 不超过该阈值的样本不计入MAPE
+    MAPE_EPSILON = 1e-8
+
+    def __init__(self):
+        self.count = 0
+        self.sum_error = 0.0
+        self.sum_squared_error = 0.0
+        self.sum_absolute_error = 0.0
+        self.sum_percentage_error = 0.0
+        self.percentage_count = 0
+        self.sum_symmetric_error = 0.0
+        self.actual_mean = 0.0
+        self.actual_m2 = 0.0
+
+    @classmethod
+    def _batch_sums_numpy(cls, predictions, actuals):
+        predictions = np.asarray(predictions, dtype=np.float64).reshape(-1)
+        actuals = np.asarray(actuals, dtype=np.float64).reshape(-1)
+        if predictions.shape != actuals.shape:
+            raise ValueError("预测值与实际值数量不一致")
+
+        errors = predictions - actuals
+        absolute_errors = np.abs(errors)
+        absolute_actuals = np.abs(actuals)
+        mask = absolute_actuals > cls.MAPE_EPSILON
+        denominators = np.abs(predictions) + absolute_actuals
+        symmetric = np.divide(2.0 * absolute_errors, denominators,
+                              out=np.zeros_like(errors), where=denominators > 0)
+        mean = actuals.mean() if len(actuals) else 0.0
+        m2 = ((actuals - mean) ** 2).sum()
+
+        return (len(actuals), float(errors.sum()), float((errors * errors).sum()),
+                float(absolute_errors.sum()), float((absolute_errors[mask] / absolute_actuals[mask]).sum()),
+                int(mask.sum()), float(symmetric.sum()), float(mean), float(m2))
+
+    @classmethod
+    def _batch_sums_tensor(cls, predictions, actuals):
+        import torch
+
+        predictions = predictions.detach().reshape(-1).double()
+        actuals = actuals.detach().reshape(-1).to(predictions.device).double()
+        if predictions.shape != actuals.shape:
+            raise ValueError("预测值与实际值数量不一致")
+        if len(actuals) == 0:
+            return (0, 0.0, 0.0, 0.0, 0.0, 0, 0.0, 0.0, 0.0)
+
+        errors = predictions - actuals
+        absolute_errors = errors.abs()
+        absolute_actuals = actuals.abs()
+        mask = absolute_actuals > cls.MAPE_EPSILON
+        denominators = predictions.abs() + absolute_actuals
+        symmetric = torch.where(denominators > 0, 2.0 * absolute_errors / denominators.clamp_min(1e-300),
+                                torch.zeros_like(errors))
+        mean = actuals.mean()
+
+        sums = torch.stack([
+            errors.sum(), (errors * errors).sum(), absolute_errors.sum(),
+            (absolute_errors[mask] / absolute_actuals[mask]).sum(), mask.sum().double(),
+            symmetric.sum(), mean, ((actuals - mean) ** 2).sum()
+        ]).cpu().tolist()
+
+        return (len(actuals), sums[0], sums[1], sums[2], sums[3], int(sums[4]), sums[5], sums[6], sums[7])
+
+    @classmethod
+    def _from_sums(cls, sums) -> 'StreamingMetrics':
+        batch = cls()
+        (batch.count, batch.sum_error, batch.sum_squared_error, batch.sum_absolute_error,
+         batch.sum_percentage_error, batch.percentage_count, batch.sum_symmetric_error,
+         batch.actual_mean, batch.actual_m2) = sums
+        return batch
+
+    def update(self, predictions, actuals) -> 'StreamingMetrics':
+        """累加一个批次的预测值和实际值（形状任意，按元素一一对应）"""
+        if hasattr(predictions, 'detach'):
+            sums = self._batch_sums_tensor(predictions, actuals)
+        else:
+            sums = self._batch_sums_numpy(predictions, actuals)
+        return self.merge(self._from_sums(sums))
+
+    def merge(self, other: 'StreamingMetrics') -> 'StreamingMetrics':
+        """合并另一个累加器（例如并行评估的分片）"""
+        if other.count == 0:
+            return self
+
+        total = self.count + other.count
+        delta = other.actual_mean - self.actual_mean
+        self.actual_mean += delta * other.count / total
+        self.actual_m2 += other.actual_m2 + delta * delta * self.count * other.count / total
+        self.count = total
+
+        self.sum_error += other.sum_error
+        self.sum_squared_error += other.sum_squared_error
+        self.sum_absolute_error += other.sum_absolute_error
+        self.sum_percentage_error += other.sum_percentage_error
+        self.percentage_count += other.percentage_count
+        self.sum_symmetric_error += other.sum_symmetric_error
+        return self
+
+    def compute(self) -> Dict[str, Optional[float]]:
+        """返回指标字典；MAPE、sMAPE 为百分比，无法定义的指标为 None"""
+        if self.count == 0:
+            return dict({key: None for key in METRIC_KEYS}, count=0)
+
+        mse = self.sum_squared_error / self.count
+        return {
+            'mse': mse,
+            'mae': self.sum_absolute_error / self.count,
+            'rmse': math.sqrt(mse),
+            'mape': 100.0 * self.sum_percentage_error / self.percentage_count if self.percentage_count else None,
+            'smape': 100.0 * self.sum_symmetric_error / self.count,
+            'r2': 1.0 - self.sum_squared_error / self.actual_m2 if self.actual_m2 > 0 else None,
+            'bias': self.sum_error / self.count,
+            'count': self.count
+        }
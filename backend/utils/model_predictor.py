@@ -0,0 +1,116 @@
+from typing import List, Optional
+from loguru import logger
+
+from models.model_bundle import model_dir
+from models.lstm_runtime import resolve_backend, load_graph_predictor
+
+# 本模块不在导入时加载 torch、transformers：只使用 ONNX 后端的预测进程不需要它们，
+# Qwen 和 torch 即时执行的 LSTM 在加载对应模型时才导入
+
+class ModelPredictor:
+    """模型预测器"""
+    
+    def __init__(self, lstm_backend: str = 'torch', quantized_tolerance: Optional[float] = None,
+                 qwen_batch_size: int = 16):
+        self.qwen_model = None
+        self.qwen_batch_size = qwen_batch_size
+        self.lstm_model = None
+        self.lstm_backend = lstm_backend
+        self.quantized_tolerance = quantized_tolerance
+    
+    def load_qwen_model(self, model_path: str):
+        """加载Qwen模型"""
+        from models.qwen_model import QwenTimeSeriesModel
+        
+        self.qwen_model = QwenTimeSeriesModel(generation_batch_size=self.qwen_batch_size)
+        self.qwen_model.load_trained_model(model_path)
+        logger.info(f"Qwen模型加载成功: {model_path}")
+    
+    def load_lstm_model(self, model_path: str, backend: Optional[str] = None):
+        """加载LSTM模型
+
+        backend 可选 torch（即时执行）、quantized（int8量化）、torchscript、onnx 或 auto，
+        未指定时使用预测器的默认后端；所选格式不可用时回退到 torch。auto 时量化副本在
+        验证集上的MSE相对增幅不超过 quantized_tolerance 则使用量化模型，否则依次尝试
+        onnx、torchscript 导出的计算图，都不可用时使用 torch。torch、quantized 和
+        torchscript 后端会导入 torch，只有 onnx 后端不需要 torch。
+        """
+        # model_path 也可以直接指向单文件模型包，导出的计算图和量化副本在同一目录
+        directory = model_dir(model_path)
+        backend = resolve_backend(directory, backend or self.lstm_backend, self.quantized_tolerance)
+        
+        if backend in ('torch', 'quantized'):
+            from models.lstm_model import LSTMPredictor
+            
+            # 目录中有模型包时 LSTMPredictor 自动使用内存映射加载
+            self.lstm_model = LSTMPredictor()
+            self.lstm_model.load_model(model_path, quantized=backend == 'quantized')
+        else:
+            self.lstm_model = load_graph_predictor(directory, backend)
+        
+        logger.info(f"LSTM模型加载成功: {model_path}, 推理后端: {backend}")
+    
+    def predict(self, model_type: str, input_sequence: List[float], 
+               data_type: str = "weather", horizon: int = 1, series_id=None):
+        """进行预测
+
+        horizon 为1时返回下一个值；大于1时在一次调用内递推预测，返回长度为 horizon 的列表。
+        series_id 用于全局多序列LSTM模型选择序列的归一化参数。
+        """
+        
+        if horizon > 1:
+            series_ids = None if series_id is None else [series_id]
+            return self.predict_horizon(model_type, [input_sequence], horizon, data_type,
+                                        series_ids=series_ids)[0]
+        
+        if model_type == 'qwen':
+            if self.qwen_model is None:
+                raise ValueError("Qwen模型未加载")
+            return self.qwen_model.predict_single(input_sequence, data_type)
+        
+        elif model_type == 'lstm':
+            if self.lstm_model is None:
+                raise ValueError("LSTM模型未加载")
+            return self.lstm_model.predict_single(input_sequence, series_id=series_id)
+        
+        else:
+            raise ValueError(f"不支持的模型类型: {model_type}")
+    
+    def predict_horizon(self, model_type: str, input_sequences: List[List[float]],
+                        horizon: int, data_type: str = "weather",
+                        batch_size: int = 1024, series_ids=None) -> List[List[float]]:
+        """多个序列的多步预测，返回每个序列长度为 horizon 的预测列表"""
+        
+        if model_type == 'qwen':
+            if self.qwen_model is None:
+                raise ValueError("Qwen模型未加载")
+            return self.qwen_model.predict_horizon(input_sequences, horizon, data_type)
+        
+        elif model_type == 'lstm':
+            if self.lstm_model is None:
+                raise ValueError("LSTM模型未加载")
+            return self.lstm_model.predict_horizon(input_sequences, horizon, batch_size=batch_size,
+                                                   series_ids=series_ids).tolist()
+        
+        else:
+            raise ValueError(f"不支持的模型类型: {model_type}")
+    
+    def batch_predict(self, model_type: str, input_sequences: List[List[float]], 
+                     data_type: str = "weather", batch_size: int = 1024,
+                     series_ids=None) -> List[float]:
+        """批量预测，LSTM模型按 batch_size 分块做向量化前向传播；
+        Qwen模型按加载时设置的微批大小批量生成"""
+        
+        if model_type == 'qwen':
+            if self.qwen_model is None:
+                raise ValueError("Qwen模型未加载")
+            return self.qwen_model.predict_batch(input_sequences, data_type)
+        
+        elif model_type == 'lstm':
+            if self.lstm_model is None:
+                raise ValueError("LSTM模型未加载")
+            return self.lstm_model.predict_batch(input_sequences, batch_size=batch_size,
+                                                 series_ids=series_ids)
+        
+        else:
+            raise ValueError(f"不支持的模型类型: {model_type}")
@@ -2,16 +2,20 @@ import os
 import json
 import pandas as pd
 import numpy as np
+import torch
 from datetime import datetime
 from typing import Dict, List, Optional, Tuple
-from sklearn.metrics import mean_squared_error, mean_absolute_error
 import matplotlib.pyplot as plt
 import seaborn as sns
 from loguru import logger
 
 from models.qwen_model import QwenTimeSeriesModel
-from models.lstm_model import LSTMPredictor
+from models.lstm_model import LSTMPredictor, TimeSeriesBatchLoader
 from utils.data_processor import TimeSeriesProcessor, DataValidator
+from utils.sliding_window import SlidingWindowView
+from utils.metrics import StreamingMetrics, METRIC_KEYS
+from utils.hparam_search import SuccessiveHalvingSearch, sample_configs
+from config.config import Config
 
 class ModelTrainer:
     """模型训练器"""
@@ -27,49 +31,65 @@ class ModelTrainer:
         os.makedirs(os.path.join(working_dir, "data"), exist_ok=True)
         os.makedirs(os.path.join(working_dir, "results"), exist_ok=True)
         
-    def prepare_data(self, data_path: str, data_type: str, 
-                    target_column: str, sequence_length: int = 10) -> Dict:
-        """准备训练数据"""
-        
-        logger.info(f"开始准备数据: {data_path}")
-        
-        # 加载数据
-        df = self.data_processor.load_data(data_path)
-        
-        # 数据验证
-        validation_results = self.validator.validate_time_series(df, target_column)
+    def _validate_and_clean(self, df: pd.DataFrame, target_column: str,
+                            profile: Optional[Dict] = None) -> Tuple[pd.DataFrame, Dict]:
+        """验证目标列并清洗数据（去重、前向填充缺失值），训练和超参数搜索共用"""
+        if profile is not None:
+            validation_results = self.validator.validate_from_profile(profile, target_column)
+        else:
+            validation_results = self.validator.validate_time_series(df, target_column)
         if not all(validation_results.values()):
             logger.warning(f"数据验证发现问题: {validation_results}")
         
-        # 数据分析
-        analysis = self.data_processor.analyze_data(df)
-        
-        # 数据清洗
         df_cleaned = self.data_processor.clean_data(
             df, 
             remove_duplicates=True,
             fill_missing='forward',
             remove_outliers=False
         )
+        return df_cleaned, validation_results
+    
+    def prepare_data(self, data_path: str, data_type: str, 
+                    target_column: str, sequence_length: int = 10,
+                    df: Optional[pd.DataFrame] = None,
+                    profile: Optional[Dict] = None) -> Dict:
+        """准备训练数据
+        
+        调用方已加载数据时可通过df传入以避免重复读取；传入数据集画像时
+        直接复用其中的统计和验证信息，不再重新分析。
+        """
+        
+        logger.info(f"开始准备数据: {data_path}")
+        
+        # 加载数据
+        if df is None:
+            df = self.data_processor.load_data(data_path)
+        
+        # 数据分析
+        analysis = profile if profile is not None else self.data_processor.analyze_data(df)
+        
+        # 数据验证和清洗
+        df_cleaned, validation_results = self._validate_and_clean(df, target_column, profile)
         
-        # 创建序列
-        X, y = self.data_processor.create_sequences(
+        # 创建滑动窗口（零拷贝视图）
+        windows = self.data_processor.create_windows(
             df_cleaned, 
             target_column=target_column,
             sequence_length=sequence_length
         )
         
         # 分割数据
-        X_train, X_val, X_test, y_train, y_val, y_test = self.data_processor.split_data(
-            X, y, train_ratio=0.7, val_ratio=0.15, test_ratio=0.15
+        n_train, n_val, n_test = self.data_processor.split_sizes(
+            len(windows), train_ratio=0.7, val_ratio=0.15, test_ratio=0.15
         )
         
-        # 保存处理后的数据
+        # 保存处理后的数据：只保存原始序列和分割点，窗口在读取时重建
         processed_data_path = os.path.join(self.working_dir, "data", f"{data_type}_processed.npz")
         np.savez(
             processed_data_path,
-            X_train=X_train, X_val=X_val, X_test=X_test,
-            y_train=y_train, y_val=y_val, y_test=y_test
+            series=windows.series.astype(np.float64),
+            sequence_length=sequence_length,
+            splits=np.array([n_train, n_val, n_test])
         )
         
         return {
@@ -77,16 +97,29 @@ class ModelTrainer:
             'data_analysis': analysis,
             'validation_results': validation_results,
             'shapes': {
-                'X_train': X_train.shape,
-                'X_val': X_val.shape, 
-                'X_test': X_test.shape,
-                'y_train': y_train.shape,
-                'y_val': y_val.shape,
-                'y_test': y_test.shape
+                'X_train': (n_train, sequence_length),
+                'X_val': (n_val, sequence_length), 
+                'X_test': (n_test, sequence_length),
+                'y_train': (n_train,),
+                'y_val': (n_val,),
+                'y_test': (n_test,)
             },
             'original_data': df_cleaned
         }
     
+    @staticmethod
+    def load_processed_data(processed_data_path: str) -> Dict[str, SlidingWindowView]:
+        """读取处理后的数据，返回训练/验证/测试三部分的窗口视图"""
+        data = np.load(processed_data_path)
+        windows = SlidingWindowView(data['series'], int(data['sequence_length']))
+        n_train, n_val, n_test = (int(n) for n in data['splits'])
+        
+        return {
+            'train': windows.subset(0, n_train),
+            'val': windows.subset(n_train, n_train + n_val),
+            'test': windows.subset(n_train + n_val, n_train + n_val + n_test)
+        }
+    
     def train_qwen_model(self, data_info: Dict, model_config: Dict, 
                         data_type: str, task_id: str) -> Dict:
         """训练Qwen模型"""
@@ -95,15 +128,15 @@ class ModelTrainer:
         
         try:
             # 加载数据
-            data = np.load(data_info['processed_data_path'])
-            X_train, y_train = data['X_train'], data['y_train']
-            X_val, y_val = data['X_val'], data['y_val']
-            X_test, y_test = data['X_test'], data['y_test']
+            splits = self.load_processed_data(data_info['processed_data_path'])
+            X_test, y_test = splits['test'].X, splits['test'].y
             
             # 初始化模型
             qwen_model = QwenTimeSeriesModel(
                 model_name=model_config.get('model_name', "Qwen/Qwen2.5-7B-Instruct"),
-                max_length=model_config.get('max_length', 512)
+                max_length=model_config.get('max_length', 512),
+                generation_batch_size=model_config.get('generation_batch_size', 16),
+                encoding=model_config.get('encoding', 'spaced_digits')
             )
             
             # 加载预训练模型
@@ -116,14 +149,12 @@ class ModelTrainer:
                 dropout=model_config.get('lora_dropout', 0.1)
             )
             
-            # 准备训练数据
-            training_data = []
-            for i in range(len(X_train)):
-                training_data.extend(qwen_model.create_training_data(
-                    pd.DataFrame({'value': np.concatenate([X_train[i], [y_train[i]]])}),
-                    sequence_length=len(X_train[i]),
-                    task_type=data_type
-                ))
+            # 准备训练数据：直接由训练窗口构造磁盘上的数据集
+            training_data = qwen_model.build_training_dataset(
+                splits['train'],
+                task_type=data_type,
+                cache_dir=os.path.join(self.working_dir, "data", f"qwen_{data_type}_{task_id}")
+            )
             
             # 模型保存路径
             model_save_path = os.path.join(self.working_dir, "models", f"qwen_{data_type}_{task_id}")
@@ -135,23 +166,19 @@ class ModelTrainer:
                 num_epochs=model_config.get('num_epochs', 3),
                 learning_rate=model_config.get('learning_rate', 5e-5),
                 batch_size=model_config.get('batch_size', 4),
-                gradient_accumulation_steps=model_config.get('gradient_accumulation_steps', 4)
+                gradient_accumulation_steps=model_config.get('gradient_accumulation_steps', 4),
+                save_steps=model_config.get('checkpoint_steps', 500),
+                num_proc=model_config.get('tokenize_workers')
             )
             
             # 评估模型
             logger.info("开始模型评估...")
-            predictions = []
-            actuals = []
-            
-            for i in range(len(X_test)):
-                pred = qwen_model.predict_single(X_test[i].tolist(), data_type)
-                predictions.append(pred)
-                actuals.append(y_test[i])
+            predictions = qwen_model.predict_batch(X_test, data_type)
+            actuals = y_test.tolist()
+            metrics = StreamingMetrics().update(predictions, actuals)
             
             # 计算指标
-            mse = mean_squared_error(actuals, predictions)
-            mae = mean_absolute_error(actuals, predictions)
-            rmse = np.sqrt(mse)
+            evaluation_metrics = metrics.compute()
             
             # 保存结果
             results = {
@@ -159,11 +186,7 @@ class ModelTrainer:
                 'data_type': data_type,
                 'task_id': task_id,
                 'model_path': model_save_path,
-                'metrics': {
-                    'mse': float(mse),
-                    'mae': float(mae),
-                    'rmse': float(rmse)
-                },
+                'metrics': {key: evaluation_metrics[key] for key in METRIC_KEYS},
                 'predictions': predictions,
                 'actuals': actuals,
                 'training_config': model_config,
@@ -178,7 +201,7 @@ class ModelTrainer:
             # 生成可视化
             self._generate_prediction_plots(results, results_path.replace('.json', '_plot.png'))
             
-            logger.info(f"Qwen模型训练完成 - MSE: {mse:.6f}, MAE: {mae:.6f}, RMSE: {rmse:.6f}")
+            logger.info(f"Qwen模型训练完成 - MSE: {evaluation_metrics['mse']:.6f}, MAE: {evaluation_metrics['mae']:.6f}, RMSE: {evaluation_metrics['rmse']:.6f}")
             
             return results
             
@@ -194,10 +217,10 @@ class ModelTrainer:
         
         try:
             # 加载数据
-            data = np.load(data_info['processed_data_path'])
-            X_train, y_train = data['X_train'], data['y_train']
-            X_val, y_val = data['X_val'], data['y_val']
-            X_test, y_test = data['X_test'], data['y_test']
+            splits = self.load_processed_data(data_info['processed_data_path'])
+            X_train, y_train = splits['train'].X, splits['train'].y
+            X_val, y_val = splits['val'].X, splits['val'].y
+            X_test, y_test = splits['test'].X, splits['test'].y
             
             # 初始化模型
             lstm_model = LSTMPredictor(
@@ -211,8 +234,18 @@ class ModelTrainer:
             original_df = data_info['original_data']
             target_column = original_df.columns[0]  # 假设第一列是目标列
             
+            # 全局多序列模式：一个模型在多列上训练
+            series_columns = model_config.get('series_columns')
+            if series_columns == 'all':
+                series_columns = original_df.select_dtypes(include=['number']).columns.tolist()
+            elif series_columns:
+                missing = [col for col in series_columns if col not in original_df.columns]
+                if missing:
+                    raise ValueError(f"数据中不存在列: {missing}")
+            
             train_loader, val_loader, scaled_data = lstm_model.prepare_data(
-                original_df, train_ratio=0.8
+                original_df, train_ratio=0.8, batch_size=model_config.get('batch_size', 32),
+                columns=series_columns or None
             )
             
             # 训练模型
@@ -221,7 +254,9 @@ class ModelTrainer:
                 val_loader=val_loader,
                 num_epochs=model_config.get('num_epochs', 100),
                 learning_rate=model_config.get('learning_rate', 0.001),
-                patience=model_config.get('patience', 10)
+                patience=model_config.get('patience', 10),
+                checkpoint_dir=os.path.join(self.working_dir, "checkpoints", "lstm"),
+                checkpoint_interval=model_config.get('checkpoint_interval', 1)
             )
             
             # 评估模型
@@ -229,7 +264,12 @@ class ModelTrainer:
             
             # 模型保存路径
             model_save_path = os.path.join(self.working_dir, "models", f"lstm_{data_type}_{task_id}")
-            lstm_model.save_model(model_save_path)
+            saved_config = lstm_model.save_model(
+                model_save_path,
+                quantize=model_config.get('quantize', True),
+                validation_loader=val_loader
+            )
+            quantized_info = saved_config.get('quantized')
             
             # 保存结果
             results = {
@@ -237,11 +277,9 @@ class ModelTrainer:
                 'data_type': data_type,
                 'task_id': task_id,
                 'model_path': model_save_path,
-                'metrics': {
-                    'mse': evaluation_results['mse'],
-                    'mae': evaluation_results['mae'],
-                    'rmse': evaluation_results['rmse']
-                },
+                'metrics': {key: evaluation_results[key] for key in METRIC_KEYS},
+                'quantized': quantized_info,
+                'series_names': lstm_model.series_names,
                 'predictions': evaluation_results['predictions'],
                 'actuals': evaluation_results['actuals'],
                 'training_history': training_history,
@@ -266,6 +304,103 @@ class ModelTrainer:
             logger.error(f"LSTM模型训练失败: {e}")
             raise
     
+    def tune_lstm_model(self, df: pd.DataFrame, target_column: str, tune_config: Dict,
+                        data_type: str, task_id: str, progress_callback=None,
+                        profile: Optional[Dict] = None) -> Dict:
+        """并行逐次减半搜索LSTM超参数，用最佳配置的检查点保存模型
+        
+        数据经过与训练相同的验证和清洗；清洗后仍含缺失值或非有限值时拒绝搜索，
+        否则试验损失为NaN，按损失排序选出的配置没有意义。
+        """
+        
+        try:
+            logger.info("开始LSTM超参数搜索...")
+            
+            df_cleaned, _ = self._validate_and_clean(df, target_column, profile)
+            values = df_cleaned[target_column].to_numpy(dtype=np.float64).reshape(-1, 1)
+            if not np.isfinite(values).all():
+                raise ValueError(f"目标列 {target_column} 清洗后仍包含缺失值或无穷值，无法进行超参数搜索")
+            
+            # 归一化只做一次，序列通过共享内存提供给所有试验
+            final_model = LSTMPredictor()
+            scaled = final_model.fit_scaler(values).ravel()
+            
+            configs = sample_configs(
+                tune_config.get('search_space') or Config.TUNING_SEARCH_SPACE,
+                n_trials=tune_config.get('n_trials'),
+                seed=tune_config.get('seed', 42)
+            )
+            defaults = {key: choices[0] for key, choices in Config.TUNING_SEARCH_SPACE.items()}
+            configs = [{**defaults, 'dropout': tune_config.get('dropout', 0.2), **config} for config in configs]
+            
+            search = SuccessiveHalvingSearch(
+                scaled,
+                train_ratio=tune_config.get('train_ratio', 0.8),
+                working_dir=os.path.join(self.working_dir, "tuning"),
+                max_workers=tune_config.get('max_workers'),
+                batch_size=tune_config.get('batch_size', 32),
+                reduction_factor=tune_config.get('reduction_factor', 3),
+                seed=tune_config.get('seed', 42)
+            )
+            summary = search.run(
+                configs,
+                min_epochs=tune_config.get('min_epochs', 2),
+                max_epochs=tune_config.get('max_epochs', 30),
+                progress_callback=progress_callback
+            )
+            search.save_summary(summary)
+            
+            # 用最佳试验的检查点构建最终模型
+            best_config = summary['best_config']
+            final_model.sequence_length = best_config['sequence_length']
+            final_model.hidden_size = best_config['hidden_size']
+            final_model.num_layers = best_config['num_layers']
+            final_model.dropout = best_config['dropout']
+            final_model.build_model()
+            
+            checkpoint = torch.load(summary['best_checkpoint'], map_location=final_model.device)
+            final_model.model.load_state_dict(checkpoint['model'])
+            final_model.is_trained = True
+            
+            val_loader = TimeSeriesBatchLoader(
+                scaled[search.train_size:], final_model.sequence_length,
+                batch_size=tune_config.get('batch_size', 32), device=final_model.device
+            )
+            evaluation_results = final_model.evaluate(val_loader, keep_predictions=False)
+            
+            model_save_path = os.path.join(self.working_dir, "models", f"lstm_{data_type}_{task_id}")
+            saved_config = final_model.save_model(
+                model_save_path,
+                quantize=tune_config.get('quantize', True),
+                validation_loader=val_loader
+            )
+            quantized_info = saved_config.get('quantized')
+            
+            results = {
+                'model_type': 'lstm',
+                'data_type': data_type,
+                'task_id': task_id,
+                'model_path': model_save_path,
+                'metrics': {key: evaluation_results[key] for key in METRIC_KEYS},
+                'quantized': quantized_info,
+                'best_config': best_config,
+                'search': summary,
+                'tuning_config': tune_config,
+                'training_time': datetime.now().isoformat()
+            }
+            
+            results_path = os.path.join(self.working_dir, "results", f"lstm_tuning_{data_type}_{task_id}_results.json")
+            with open(results_path, 'w') as f:
+                json.dump(results, f, indent=2, default=str)
+            
+            logger.info(f"LSTM超参数搜索完成 - 最佳配置: {best_config}, MSE: {evaluation_results['mse']:.6f}")
+            
+            return results
+            
+        except Exception as e:
+            logger.error(f"LSTM超参数搜索失败: {e}")
+            raise
+    
     def compare_models(self, qwen_results: Dict, lstm_results: Dict, 
                       save_path: Optional[str] = None) -> Dict:
         """比较两个模型的性能"""
@@ -461,56 +596,3 @@ class ModelTrainer:
         plt.close()
         
         logger.info(f"模型对比图已保存: {save_path}")
-
-class ModelPredictor:
-    """模型预测器"""
-    
-    def __init__(self):
-        self.qwen_model = None
-        self.lstm_model = None
-    
-    def load_qwen_model(self, model_path: str):
-        """加载Qwen模型"""
-        self.qwen_model = QwenTimeSeriesModel()
-        self.qwen_model.load_trained_model(model_path)
-        logger.info(f"Qwen模型加载成功: {model_path}")
-    
-    def load_lstm_model(self, model_path: str):
-        """加载LSTM模型"""
-        self.lstm_model = LSTMPredictor()
-        self.lstm_model.load_model(model_path)
-        logger.info(f"LSTM模型加载成功: {model_path}")
-    
-    def predict(self, model_type: str, input_sequence: List[float], 
-               data_type: str = "weather") -> float:
-        """进行预测"""
-        
-        if model_type == 'qwen':
-            if self.qwen_model is None:
-                raise ValueError("Qwen模型未加载")
-            return self.qwen_model.predict_single(input_sequence, data_type)
-        
-        elif model_type == 'lstm':
-            if self.lstm_model is None:
-                raise ValueError("LSTM模型未加载")
-            return self.lstm_model.predict_single(input_sequence)
-        
-        else:
-            raise ValueError(f"不支持的模型类型: {model_type}")
-    
-    def batch_predict(self, model_type: str, input_sequences: List[List[float]], 
-                     data_type: str = "weather") -> List[float]:
-        """批量预测"""
-        
-        if model_type == 'qwen':
-            if self.qwen_model is None:
-                raise ValueError("Qwen模型未加载")
-            return self.qwen_model.predict_batch(input_sequences, data_type)
-        
-        elif model_type == 'lstm':
-            if self.lstm_model is None:
-                raise ValueError("LSTM模型未加载")
-            return self.lstm_model.predict_batch(input_sequences)
-        
-        else:
-            raise ValueError(f"不支持的模型类型: {model_type}")
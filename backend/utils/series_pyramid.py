@@ -0,0 +1,200 @@
+import os
+import numpy as np
+from typing import Dict, List, Optional, Tuple
+from loguru import logger
+
+from utils.columnar_cache import ColumnarCache
+
+PYRAMID_DIR = 'pyramid'
+
+class SeriesPyramid:
+    """单列数值序列的多分辨率 min/max 金字塔
+
+    第k层把序列按 base_bucket * 2^k 行分桶，每个桶保存最小值、最大值及其行号，
+    保存为 (桶数, 4) 的 .npy 文件并以内存映射读取。查询任意行范围时选取
+    能满足点数上限的最细一层，每个桶输出最小值和最大值两个点，保留峰谷形状。
+    """
+
+    def __init__(self, cache: ColumnarCache, column: str):
+        self.cache = cache
+        self.column = column
+        self.directory = os.path.join(cache.cache_dir, PYRAMID_DIR)
+        self.prefix = cache.column_file(column)
+        self.levels = self._discover_levels()
+
+    def _level_path(self, level: int) -> str:
+        return os.path.join(self.directory, f"{self.prefix}_L{level}.npy")
+
+    def _discover_levels(self) -> List[int]:
+        levels = []
+        while os.path.exists(self._level_path(len(levels))):
+            levels.append(len(levels))
+        return levels
+
+    @property
+    def base_bucket(self) -> int:
+        meta = self.cache.meta.get('pyramid', {})
+        return meta.get('base_bucket', 16)
+
+    def bucket_size(self, level: int) -> int:
+        return self.base_bucket * (2 ** level)
+
+    def load_level(self, level: int) -> np.ndarray:
+        return np.load(self._level_path(level), mmap_mode='r')
+
+    @staticmethod
+    def _reduce_base(values: np.ndarray, offset: int, bucket: int) -> np.ndarray:
+        """把一段原始数据归约为 (桶数, 4): min, max, argmin, argmax"""
+        n_buckets = int(np.ceil(len(values) / bucket))
+        padded = np.full(n_buckets * bucket, np.nan)
+        padded[:len(values)] = values
+        blocks = padded.reshape(n_buckets, bucket)
+
+        all_nan = np.isnan(blocks).all(axis=1)
+        filled_min = np.where(np.isnan(blocks), np.inf, blocks)
+        filled_max = np.where(np.isnan(blocks), -np.inf, blocks)
+        argmin = filled_min.argmin(axis=1)
+        argmax = filled_max.argmax(axis=1)
+        rows = np.arange(n_buckets)
+
+        result = np.empty((n_buckets, 4))
+        result[:, 0] = filled_min[rows, argmin]
+        result[:, 1] = filled_max[rows, argmax]
+        result[:, 2] = offset + rows * bucket + argmin
+        result[:, 3] = offset + rows * bucket + argmax
+        result[all_nan] = np.nan
+        return result
+
+    @staticmethod
+    def _reduce_pairs(level: np.ndarray) -> np.ndarray:
+        """相邻两个桶合并为上一层的一个桶"""
+        if len(level) % 2:
+            level = np.vstack([level, np.full((1, 4), np.nan)])
+        left, right = level[0::2], level[1::2]
+
+        take_right_min = np.isnan(left[:, 0]) | (right[:, 0] < left[:, 0])
+        take_right_max = np.isnan(left[:, 1]) | (right[:, 1] > left[:, 1])
+
+        result = left.copy()
+        result[take_right_min, 0] = right[take_right_min, 0]
+        result[take_right_min, 2] = right[take_right_min, 2]
+        result[take_right_max, 1] = right[take_right_max, 1]
+        result[take_right_max, 3] = right[take_right_max, 3]
+        return result
+
+    @classmethod
+    def build(cls, cache: ColumnarCache, column: str, base_bucket: int = 16,
+              min_buckets: int = 64, chunksize: int = 100000) -> 'SeriesPyramid':
+        """为一个数值列构建金字塔，按块读取内存映射列，内存占用与块大小相关"""
+        directory = os.path.join(cache.cache_dir, PYRAMID_DIR)
+        os.makedirs(directory, exist_ok=True)
+        prefix = cache.column_file(column)
+
+        values = cache.column(column)
+        chunk = max(base_bucket, (chunksize // base_bucket) * base_bucket)
+        parts = [cls._reduce_base(np.asarray(values[start:start + chunk]), start, base_bucket)
+                 for start in range(0, len(values), chunk)]
+        level = np.vstack(parts) if parts else np.empty((0, 4))
+
+        index = 0
+        while True:
+            np.save(os.path.join(directory, f"{prefix}_L{index}.npy"), level)
+            if len(level) <= min_buckets:
+                break
+            level = cls._reduce_pairs(level)
+            index += 1
+
+        return cls(cache, column)
+
+    @classmethod
+    def build_all(cls, cache: ColumnarCache, columns: List[str], base_bucket: int = 16,
+                  chunksize: int = 100000):
+        """为多个数值列构建金字塔"""
+        cache.meta['pyramid'] = {'base_bucket': base_bucket}
+        cache.save_meta()
+
+        for column in columns:
+            cls.build(cache, column, base_bucket=base_bucket, chunksize=chunksize)
+
+        logger.info(f"降采样金字塔构建完成: {len(columns)} 列")
+
+    def query(self, start: int, stop: int, max_points: int) -> Dict:
+        """返回行范围 [start, stop) 内最多 max_points 个点的 (行号, 数值)"""
+        start = max(0, start)
+        stop = min(self.cache.num_rows, stop)
+        if stop <= start:
+            return {'rows': np.empty(0, dtype=np.int64), 'values': np.empty(0), 'level': None}
+
+        # 范围足够小，直接返回原始数据
+        if stop - start <= max_points or not self.levels:
+            values = np.asarray(self.cache.column(self.column, start, stop - start))
+            rows = np.arange(start, stop)
+            valid = ~np.isnan(values)
+            return {'rows': rows[valid], 'values': values[valid], 'level': None}
+
+        # 每个桶输出两个点，选择桶数不超过 max_points/2 的最细一层
+        level = self.levels[-1]
+        for candidate in self.levels:
+            size = self.bucket_size(candidate)
+            if (stop // size - start // size + 1) * 2 <= max_points:
+                level = candidate
+                break
+
+        size = self.bucket_size(level)
+        buckets = np.asarray(self.load_level(level)[start // size:(stop - 1) // size + 1])
+        # 最粗一层仍超过点数上限时（数据量小、层数少），临时合并相邻桶
+        while len(buckets) * 2 > max_points and len(buckets) > 1:
+            buckets = self._reduce_pairs(buckets)
+        buckets = buckets[~np.isnan(buckets[:, 0])]
+
+        rows = buckets[:, 2:4].astype(np.int64)
+        values = buckets[:, 0:2]
+        order = np.argsort(rows, axis=1, kind='stable')
+        rows = np.take_along_axis(rows, order, axis=1).ravel()
+        values = np.take_along_axis(values, order, axis=1).ravel()
+
+        # 去掉桶内最小值与最大值为同一行的重复点，并裁剪到查询范围
+        keep = np.ones(len(rows), dtype=bool)
+        keep[1:] = rows[1:] != rows[:-1]
+        keep &= (rows >= start) & (rows < stop)
+
+        return {'rows': rows[keep], 'values': values[keep], 'level': level}
+
+def parse_time_bound(value) -> int:
+    """把时间范围参数解析为纳秒时间戳
+
+    数值按毫秒时间戳处理（与序列接口返回的x值一致，图表缩放范围可以直接回传），
+    其他按ISO时间字符串解析；无法解析时抛出 ValueError。
+    """
+    if isinstance(value, (int, np.integer)):
+        return int(value) * 1_000_000
+    if isinstance(value, str):
+        try:
+            return int(value) * 1_000_000
+        except ValueError:
+            pass
+
+    try:
+        milliseconds = float(value)
+    except (TypeError, ValueError):
+        milliseconds = None
+    if milliseconds is not None:
+        if not np.isfinite(milliseconds):
+            raise ValueError(f"无效的时间: {value}")
+        return int(round(milliseconds * 1_000_000))
+
+    try:
+        parsed = np.datetime64(value, 'ns')
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"无效的时间: {value}") from e
+    if np.isnat(parsed):
+        raise ValueError(f"无效的时间: {value}")
+    return int(parsed.astype(np.int64))
+
+def rows_for_time_range(cache: ColumnarCache, time_column: str,
+                        start=None, end=None) -> Tuple[int, int]:
+    """在有序时间列上二分查找时间范围对应的行范围，start/end 为毫秒时间戳或ISO时间"""
+    times = cache.column(time_column).view(np.int64)
+    lo = int(np.searchsorted(times, parse_time_bound(start), side='left')) if start is not None else 0
+    hi = int(np.searchsorted(times, parse_time_bound(end), side='right')) if end is not None else len(times)
+    return lo, hi
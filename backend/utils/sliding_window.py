@@ -0,0 +1,81 @@
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from typing import Iterator, Optional, Tuple
+
+class SlidingWindowView:
+    """零拷贝滑动窗口视图
+
+    所有窗口都是同一个基础数组上的跨步视图，不复制数据，内存占用与序列长度
+    而不是 窗口数 x 窗口长度 成正比。只有按批读取时才会复制当前批次。
+
+    X[i] = series[i : i + sequence_length]
+    y[i] = series[i + sequence_length]                           (horizon == 1)
+    y[i] = series[i + sequence_length : i + sequence_length + horizon]  (horizon > 1)
+    """
+
+    def __init__(self, series: np.ndarray, sequence_length: int, horizon: int = 1,
+                 start: int = 0, stop: Optional[int] = None):
+        self.series = np.asarray(series)
+        self.sequence_length = sequence_length
+        self.horizon = horizon
+
+        if self.series.ndim != 1:
+            raise ValueError("滑动窗口只支持一维序列")
+        if sequence_length < 1 or horizon < 1:
+            raise ValueError("sequence_length 和 horizon 必须为正整数")
+
+        total = max(0, len(self.series) - sequence_length - horizon + 1)
+        stop = total if stop is None else min(stop, total)
+        self.start = min(max(0, start), stop)
+        self.stop = stop
+
+    @property
+    def num_windows(self) -> int:
+        return self.stop - self.start
+
+    def __len__(self) -> int:
+        return self.num_windows
+
+    @property
+    def X(self) -> np.ndarray:
+        """输入窗口，形状 (num_windows, sequence_length)，只读视图"""
+        if self.num_windows == 0:
+            return np.empty((0, self.sequence_length), dtype=self.series.dtype)
+        end = self.stop + self.sequence_length - 1
+        return sliding_window_view(self.series[self.start:end], self.sequence_length)
+
+    @property
+    def y(self) -> np.ndarray:
+        """目标值，horizon为1时形状 (num_windows,)，否则 (num_windows, horizon)"""
+        offset = self.start + self.sequence_length
+        if self.horizon == 1:
+            return self.series[offset:offset + self.num_windows]
+        if self.num_windows == 0:
+            return np.empty((0, self.horizon), dtype=self.series.dtype)
+        end = offset + self.num_windows + self.horizon - 1
+        return sliding_window_view(self.series[offset:end], self.horizon)
+
+    def __getitem__(self, idx) -> Tuple[np.ndarray, np.ndarray]:
+        return self.X[idx], self.y[idx]
+
+    def subset(self, start: int, stop: int) -> 'SlidingWindowView':
+        """按窗口下标截取子集，仍共享同一个基础数组"""
+        return SlidingWindowView(self.series, self.sequence_length, self.horizon,
+                                 start=self.start + start, stop=self.start + stop)
+
+    def iter_batches(self, batch_size: int = 32, shuffle: bool = False,
+                     seed: Optional[int] = None, dtype=None) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+        """惰性生成批次，每次只复制当前批次的窗口"""
+        X, y = self.X, self.y
+        order = np.arange(self.num_windows)
+        if shuffle:
+            np.random.default_rng(seed).shuffle(order)
+
+        for begin in range(0, self.num_windows, batch_size):
+            idx = order[begin:begin + batch_size]
+            if not shuffle:
+                idx = slice(begin, begin + len(idx))
+            batch_x, batch_y = X[idx], y[idx]
+            if dtype is not None:
+                batch_x, batch_y = batch_x.astype(dtype), batch_y.astype(dtype)
+            yield batch_x, batch_y
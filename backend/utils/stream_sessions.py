@@ -0,0 +1,170 @@
+import time
+import threading
+import numpy as np
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Dict, List, Optional
+from loguru import logger
+
+if TYPE_CHECKING:
+    from models.lstm_model import LSTMPredictor
+
+class StreamSession:
+    """单个序列的流式推理会话，保存LSTM隐藏状态和最近一个窗口的观测值"""
+
+    def __init__(self, series_id: str, model_id: int, window: np.ndarray, model_series=None):
+        self.series_id = series_id
+        self.model_id = model_id
+        self.model_series = model_series
+        self.window = window
+        self.hidden = None
+        self.prediction = None
+        self.steps = 0
+        self.steps_since_warm = 0
+        self.created_at = time.time()
+        self.last_access = self.created_at
+        self.lock = threading.Lock()
+
+    def to_dict(self) -> Dict:
+        return {
+            'series_id': self.series_id,
+            'model_id': self.model_id,
+            'model_series': self.model_series,
+            'prediction': self.prediction,
+            'steps': self.steps,
+            'idle_seconds': round(time.time() - self.last_access, 3)
+        }
+
+class LoadedModelCache:
+    """按模型ID缓存已加载的LSTM预测器（LRU淘汰），避免每次请求重新加载模型"""
+
+    def __init__(self, max_models: int = 4):
+        self.max_models = max_models
+        self._models = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, model_id: int, model_path: str) -> 'LSTMPredictor':
+        with self._lock:
+            if model_id in self._models:
+                self._models.move_to_end(model_id)
+                return self._models[model_id]
+
+            # 流式推理需要 torch 的LSTM隐藏状态，在首次加载模型时才导入
+            from models.lstm_model import LSTMPredictor
+
+            predictor = LSTMPredictor()
+            predictor.load_model(model_path)
+            self._models[model_id] = predictor
+
+            while len(self._models) > self.max_models:
+                evicted, _ = self._models.popitem(last=False)
+                logger.info(f"流式推理模型缓存淘汰: {evicted}")
+
+            return predictor
+
+    def discard(self, model_id: int):
+        with self._lock:
+            self._models.pop(model_id, None)
+
+class StreamSessionManager:
+    """流式推理会话管理
+
+    会话按 series_id 保存在内存中，超过 ttl_seconds 未访问即淘汰，会话数超过
+    max_sessions 时淘汰最久未访问的会话。追加一个观测值只做一次LSTM单步计算；
+    每追加 rewarm_steps 个观测值用最近的窗口重新预热一次，使隐藏状态与训练时
+    的固定窗口保持一致（0 表示不重新预热，None 表示使用模型的序列长度）。
+    """
+
+    def __init__(self, ttl_seconds: float = 3600, max_sessions: int = 10000,
+                 max_models: int = 4, rewarm_steps: Optional[int] = None):
+        self.ttl_seconds = ttl_seconds
+        self.max_sessions = max_sessions
+        self.rewarm_steps = rewarm_steps
+        self.models = LoadedModelCache(max_models)
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _expired(self, session: StreamSession, now: float) -> bool:
+        return now - session.last_access > self.ttl_seconds
+
+    def evict_expired(self) -> int:
+        """淘汰过期会话，返回淘汰数量"""
+        now = time.time()
+        with self._lock:
+            expired = [key for key, session in self._sessions.items() if self._expired(session, now)]
+            for key in expired:
+                del self._sessions[key]
+        return len(expired)
+
+    def get(self, series_id: str) -> Optional[StreamSession]:
+        now = time.time()
+        with self._lock:
+            session = self._sessions.get(series_id)
+            if session is None:
+                return None
+            if self._expired(session, now):
+                del self._sessions[series_id]
+                return None
+            session.last_access = now
+            self._sessions.move_to_end(series_id)
+            return session
+
+    def _put(self, session: StreamSession):
+        with self._lock:
+            self._sessions[session.series_id] = session
+            self._sessions.move_to_end(session.series_id)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+
+    def close(self, series_id: str) -> bool:
+        with self._lock:
+            return self._sessions.pop(series_id, None) is not None
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def open(self, series_id: str, model_id: int, model_path: str,
+             input_sequence: List[float], model_series=None) -> Dict:
+        """用一个完整窗口创建（或重置）会话，返回下一步预测
+
+        model_series 为全局多序列模型中该数据流对应的序列（名称或下标）。
+        """
+        predictor = self.models.get(model_id, model_path)
+        if len(input_sequence) < predictor.sequence_length:
+            raise ValueError(f"初始序列长度不能小于模型的序列长度 {predictor.sequence_length}")
+
+        window = np.asarray(input_sequence, dtype=np.float64)[-predictor.sequence_length:]
+        session = StreamSession(series_id, model_id, window.copy(), model_series)
+        session.prediction, session.hidden = predictor.start_stream(window, series_id=model_series)
+
+        self.evict_expired()
+        self._put(session)
+
+        return session.to_dict()
+
+    def observe(self, series_id: str, values: List[float], model_path: str) -> Dict:
+        """向会话追加一个或多个观测值，返回追加后的下一步预测"""
+        session = self.get(series_id)
+        if session is None:
+            raise KeyError(f"会话 {series_id} 不存在或已过期")
+
+        predictor = self.models.get(session.model_id, model_path)
+        rewarm_steps = predictor.sequence_length if self.rewarm_steps is None else self.rewarm_steps
+
+        with session.lock:
+            for value in values:
+                value = float(value)
+                session.window = np.append(session.window[1:], value)
+                session.steps += 1
+                session.steps_since_warm += 1
+
+                if rewarm_steps and session.steps_since_warm >= rewarm_steps:
+                    session.prediction, session.hidden = predictor.start_stream(
+                        session.window, series_id=session.model_series
+                    )
+                    session.steps_since_warm = 0
+                else:
+                    session.prediction, session.hidden = predictor.stream_step(
+                        value, session.hidden, series_id=session.model_series
+                    )
+
+            return session.to_dict()
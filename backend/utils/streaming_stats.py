@@ -0,0 +1,332 @@
+import numpy as np
+import pandas as pd
+from typing import Dict, List, Optional
+
+from utils.columnar_cache import KIND_FLOAT, KIND_DATETIME, NAT_VALUE
+
+class ReservoirQuantiles:
+    """基于蓄水池采样的近似分位数
+
+    无论输入多长，只保留固定大小的均匀样本，内存占用恒定。
+    样本容量为k时分位数误差约为 1/sqrt(k)。
+    """
+
+    def __init__(self, capacity: int = 10000, seed: int = 42):
+        self.capacity = capacity
+        self.count = 0
+        self.sample = np.empty(capacity, dtype=np.float64)
+        self.rng = np.random.default_rng(seed)
+
+    def update(self, values: np.ndarray):
+        """加入一批数值（不应包含NaN）"""
+        values = np.asarray(values, dtype=np.float64)
+        if len(values) == 0:
+            return
+
+        # 先填满蓄水池
+        filled = min(self.count, self.capacity)
+        take = min(self.capacity - filled, len(values))
+        if take > 0:
+            self.sample[filled:filled + take] = values[:take]
+
+        rest = values[take:]
+        if len(rest) > 0:
+            # 第t个元素以 k/t 的概率替换随机位置（向量化的Algorithm R）
+            positions = np.arange(self.count + take + 1, self.count + len(values) + 1)
+            accepted = self.rng.random(len(rest)) < self.capacity / positions
+            slots = self.rng.integers(0, self.capacity, size=int(accepted.sum()))
+            self.sample[slots] = rest[accepted]
+
+        self.count += len(values)
+
+    @property
+    def values(self) -> np.ndarray:
+        return self.sample[:min(self.count, self.capacity)]
+
+    def quantile(self, q):
+        """估计分位数，q可以是标量或数组"""
+        if self.count == 0:
+            return np.nan if np.isscalar(q) else np.full(len(q), np.nan)
+        return np.quantile(self.values, q)
+
+class StreamingColumnStats:
+    """单列的流式统计: 计数、缺失、最值、均值、方差和近似分位数"""
+
+    def __init__(self, reservoir_size: int = 10000):
+        self.count = 0
+        self.missing = 0
+        self.min = np.inf
+        self.max = -np.inf
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.quantiles = ReservoirQuantiles(reservoir_size)
+
+    def update(self, values: np.ndarray):
+        """加入一批数值，NaN计为缺失"""
+        values = np.asarray(values, dtype=np.float64)
+        mask = np.isnan(values)
+        self.missing += int(mask.sum())
+
+        valid = values[~mask]
+        n_b = len(valid)
+        if n_b == 0:
+            return
+
+        # Chan等人的并行方差合并公式
+        mean_b = float(valid.mean())
+        m2_b = float(((valid - mean_b) ** 2).sum())
+        n_a = self.count
+        n = n_a + n_b
+        delta = mean_b - self.mean
+
+        self.mean += delta * n_b / n
+        self.m2 += m2_b + delta * delta * n_a * n_b / n
+        self.count = n
+
+        self.min = min(self.min, float(valid.min()))
+        self.max = max(self.max, float(valid.max()))
+        self.quantiles.update(valid)
+
+    @property
+    def std(self) -> float:
+        """样本标准差（ddof=1，与pandas.describe一致）"""
+        if self.count < 2:
+            return float('nan')
+        return float(np.sqrt(self.m2 / (self.count - 1)))
+
+    def describe(self) -> Dict:
+        """与 DataFrame.describe() 相同字段的统计结果"""
+        if self.count == 0:
+            q25 = q50 = q75 = None
+        else:
+            q25, q50, q75 = (float(v) for v in self.quantiles.quantile([0.25, 0.5, 0.75]))
+
+        return {
+            'count': self.count,
+            'mean': self.mean if self.count else None,
+            'std': self.std if self.count > 1 else None,
+            'min': self.min if self.count else None,
+            '25%': q25,
+            '50%': q50,
+            '75%': q75,
+            'max': self.max if self.count else None
+        }
+
+class StreamingFrameStats:
+    """多列数值数据的向量化流式统计
+
+    所有列的计数、均值、方差、最值在一次数组运算中同时更新；
+    近似分位数使用按行的蓄水池样本，一次 nanquantile 调用得到所有列的结果。
+    """
+
+    def __init__(self, columns: List[str], reservoir_size: int = 10000, seed: int = 42):
+        self.columns = list(columns)
+        width = len(self.columns)
+        self.count = np.zeros(width, dtype=np.int64)
+        self.missing = np.zeros(width, dtype=np.int64)
+        self.min = np.full(width, np.inf)
+        self.max = np.full(width, -np.inf)
+        self.mean = np.zeros(width)
+        self.m2 = np.zeros(width)
+        self.rows_seen = 0
+        self.capacity = reservoir_size
+        self.sample = np.empty((reservoir_size, width))
+        self.rng = np.random.default_rng(seed)
+
+    def update(self, values: np.ndarray):
+        """加入一批形状为 (行数, 列数) 的数值，NaN计为缺失"""
+        values = np.asarray(values, dtype=np.float64)
+        if len(values) == 0:
+            return
+
+        mask = np.isnan(values)
+        n_b = (~mask).sum(axis=0)
+        self.missing += mask.sum(axis=0)
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            sums = np.where(mask, 0.0, values).sum(axis=0)
+            mean_b = np.where(n_b > 0, sums / np.maximum(n_b, 1), 0.0)
+            m2_b = np.where(mask, 0.0, (values - mean_b) ** 2).sum(axis=0)
+
+        # Chan等人的并行方差合并公式（逐列向量化）
+        n = self.count + n_b
+        safe_n = np.maximum(n, 1)
+        delta = mean_b - self.mean
+        self.mean = self.mean + delta * n_b / safe_n
+        self.m2 = self.m2 + m2_b + delta * delta * self.count * n_b / safe_n
+        self.count = n
+
+        self.min = np.minimum(self.min, np.where(mask, np.inf, values).min(axis=0))
+        self.max = np.maximum(self.max, np.where(mask, -np.inf, values).max(axis=0))
+
+        self._update_reservoir(values)
+
+    def _update_reservoir(self, values: np.ndarray):
+        filled = min(self.rows_seen, self.capacity)
+        take = min(self.capacity - filled, len(values))
+        if take > 0:
+            self.sample[filled:filled + take] = values[:take]
+
+        rest = values[take:]
+        if len(rest) > 0:
+            positions = np.arange(self.rows_seen + take + 1, self.rows_seen + len(values) + 1)
+            accepted = self.rng.random(len(rest)) < self.capacity / positions
+            slots = self.rng.integers(0, self.capacity, size=int(accepted.sum()))
+            self.sample[slots] = rest[accepted]
+
+        self.rows_seen += len(values)
+
+    def quantile(self, q) -> np.ndarray:
+        """所有列的近似分位数，形状 (len(q), 列数)"""
+        sample = self.sample[:min(self.rows_seen, self.capacity)]
+        with np.errstate(invalid='ignore'):
+            return np.nanquantile(sample, q, axis=0)
+
+    @property
+    def std(self) -> np.ndarray:
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(self.count > 1, np.sqrt(self.m2 / np.maximum(self.count - 1, 1)), np.nan)
+
+    def describe(self) -> pd.DataFrame:
+        """与 DataFrame.describe() 相同布局的统计表"""
+        q25, q50, q75 = self.quantile([0.25, 0.5, 0.75])
+        has_data = self.count > 0
+        return pd.DataFrame(
+            [self.count, np.where(has_data, self.mean, np.nan), self.std,
+             np.where(has_data, self.min, np.nan), q25, q50, q75,
+             np.where(has_data, self.max, np.nan)],
+            index=['count', 'mean', 'std', 'min', '25%', '50%', '75%', 'max'],
+            columns=self.columns
+        )
+
+class DatasetStatsAccumulator:
+    """整个数据集的单遍流式统计
+
+    按块接收列式缓存写入器转换后的数组，数值列计算完整统计，
+    时间列记录时间范围，所有列记录缺失数量。
+    """
+
+    def __init__(self, reservoir_size: int = 10000):
+        self.reservoir_size = reservoir_size
+        self.num_rows = 0
+        self.kinds = {}
+        self.missing = {}
+        self.numeric = {}
+        self.time_ranges = {}
+
+    def update(self, arrays: Dict[str, np.ndarray], kinds: Dict[str, str]):
+        """加入一个数据块，arrays为列名到转换后数组的映射"""
+        if not self.kinds:
+            self.kinds = dict(kinds)
+            for name, kind in kinds.items():
+                self.missing[name] = 0
+                if kind == KIND_FLOAT:
+                    self.numeric[name] = StreamingColumnStats(self.reservoir_size)
+
+        rows = 0
+        for name, values in arrays.items():
+            rows = len(values)
+            kind = self.kinds[name]
+
+            if kind == KIND_FLOAT:
+                stats = self.numeric[name]
+                before = stats.missing
+                stats.update(values)
+                self.missing[name] += stats.missing - before
+
+            elif kind == KIND_DATETIME:
+                raw = values.view(np.int64) if values.dtype != np.int64 else values
+                valid = raw[raw != NAT_VALUE]
+                self.missing[name] += len(raw) - len(valid)
+                if len(valid):
+                    lo, hi = int(valid.min()), int(valid.max())
+                    cur = self.time_ranges.get(name)
+                    self.time_ranges[name] = (min(lo, cur[0]), max(hi, cur[1])) if cur else (lo, hi)
+
+            else:
+                self.missing[name] += int(pd.isna(values).sum())
+
+        self.num_rows += rows
+
+    @property
+    def numeric_columns(self) -> List[str]:
+        return list(self.numeric.keys())
+
+    @property
+    def datetime_columns(self) -> List[str]:
+        return [name for name, kind in self.kinds.items() if kind == KIND_DATETIME]
+
+    def time_range(self, column: Optional[str] = None) -> Optional[tuple]:
+        """返回时间列的 (起始, 结束) 时间戳"""
+        column = column or next(iter(self.time_ranges), None)
+        if column not in self.time_ranges:
+            return None
+        lo, hi = self.time_ranges[column]
+        return pd.Timestamp(lo), pd.Timestamp(hi)
+
+    def to_profile(self, outlier_counts: Optional[Dict[str, int]] = None,
+                   quantile_levels=(0.01, 0.05, 0.25, 0.5, 0.75, 0.95, 0.99)) -> Dict:
+        """生成数据集画像：逐列统计、分位数、缺失比例、时间列、时间范围和异常值数量"""
+        outlier_counts = outlier_counts or {}
+        columns = {}
+
+        for name, kind in self.kinds.items():
+            missing = self.missing[name]
+            info = {
+                'kind': kind,
+                'missing': missing,
+                'missing_ratio': missing / self.num_rows if self.num_rows else 0.0
+            }
+
+            if name in self.numeric:
+                stats = self.numeric[name]
+                info.update(stats.describe())
+                if stats.count:
+                    values = stats.quantiles.quantile(list(quantile_levels))
+                    info['quantiles'] = {str(q): float(v) for q, v in zip(quantile_levels, values)}
+                    lower, upper = self.iqr_bounds(name)
+                    count = outlier_counts.get(name)
+                    info['outliers'] = {
+                        'lower_bound': lower,
+                        'upper_bound': upper,
+                        'count': count,
+                        'ratio': count / self.num_rows if count is not None and self.num_rows else None
+                    }
+
+            elif name in self.time_ranges:
+                start, end = self.time_range(name)
+                info['time_range'] = {'start': start.isoformat(), 'end': end.isoformat()}
+
+            columns[name] = info
+
+        time_range = self.time_range()
+        return {
+            'num_rows': self.num_rows,
+            'num_columns': len(self.kinds),
+            'columns': columns,
+            'numeric_columns': self.numeric_columns,
+            'datetime_columns': self.datetime_columns,
+            'datetime_column': next(iter(self.time_ranges), None),
+            'time_range': {
+                'start': time_range[0].isoformat(),
+                'end': time_range[1].isoformat()
+            } if time_range else None
+        }
+
+    def iqr_bounds(self, column: str) -> tuple:
+        """基于近似分位数的IQR异常值边界"""
+        q1, q3 = self.numeric[column].quantiles.quantile([0.25, 0.75])
+        iqr = q3 - q1
+        return float(q1 - 1.5 * iqr), float(q3 + 1.5 * iqr)
+
+    def to_analysis(self) -> Dict:
+        """生成与 TimeSeriesProcessor.analyze_data 相同结构的分析结果"""
+        return {
+            'shape': [self.num_rows, len(self.kinds)],
+            'columns': list(self.kinds.keys()),
+            'dtypes': dict(self.kinds),
+            'missing_values': dict(self.missing),
+            'statistics': {name: stats.describe() for name, stats in self.numeric.items()},
+            'datetime_columns': self.datetime_columns,
+            'numeric_columns': self.numeric_columns
+        }
@@ -9,9 +9,16 @@ import matplotlib.pyplot as plt
 import seaborn as sns
 from datetime import datetime
 import os
+import sys
 import warnings
+from concurrent.futures import ProcessPoolExecutor
 warnings.filterwarnings('ignore')
 
+# 添加后端路径，复用流式统计工具
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backend'))
+
+from utils.streaming_stats import StreamingFrameStats
+
 class TimeSeriesDataProcessor:
     def __init__(self, data_dir='data'):
         self.data_dir = data_dir
@@ -71,61 +78,111 @@ class TimeSeriesDataProcessor:
         
         return processed_df, demo_df
     
-    def analyze_electricity_data(self, sample_size=100000):
-        """分析用电量数据（采样处理大文件）"""
+    def analyze_electricity_data(self, chunksize=100000, sample_size=None):
+        """分析用电量数据（分块处理完整文件，内存占用与块大小相关）
+        
+        第一遍扫描计算各列统计量、近似分位数和首个有效值，
+        第二遍按块填充缺失值、裁剪异常值并增量写出结果。
+        sample_size 可限制读取的行数，默认处理整个文件。
+        """
         print("=" * 60)
         print("开始分析用电量数据...")
         print("=" * 60)
         
-        # 由于文件较大，先读取前几行了解结构
-        sample_df = pd.read_csv(os.path.join(self.data_dir, 'electricity.csv'), nrows=10)
+        file_path = os.path.join(self.data_dir, 'electricity.csv')
+        
+        # 先读取前几行了解结构
+        sample_df = pd.read_csv(file_path, nrows=10)
         print(f"数据列: {sample_df.columns.tolist()}")
         print(f"样本数据:\n{sample_df.head()}")
         
-        # 读取采样数据进行分析
-        print(f"\n读取前 {sample_size} 行数据进行分析...")
-        df = pd.read_csv(os.path.join(self.data_dir, 'electricity.csv'), nrows=sample_size)
-        print(f"采样数据形状: {df.shape}")
-        
         # 检查是否有时间列
-        date_columns = [col for col in df.columns if any(keyword in col.lower() for keyword in ['date', 'time', 'timestamp'])]
+        date_columns = [col for col in sample_df.columns if any(keyword in col.lower() for keyword in ['date', 'time', 'timestamp'])]
+        date_column = None
         if date_columns:
             print(f"发现时间列: {date_columns}")
-            # 尝试转换第一个时间列
             try:
-                df[date_columns[0]] = pd.to_datetime(df[date_columns[0]])
-                df = df.set_index(date_columns[0])
-                print(f"成功设置时间索引: {date_columns[0]}")
+                pd.to_datetime(sample_df[date_columns[0]])
+                date_column = date_columns[0]
+                print(f"成功设置时间索引: {date_column}")
             except:
                 print(f"无法解析时间列 {date_columns[0]}，将使用数值索引")
         
-        # 数值列分析
-        numeric_columns = df.select_dtypes(include=[np.number]).columns
-        print(f"\n数值列: {numeric_columns.tolist()}")
+        # 第一遍：流式统计
+        print(f"\n分块扫描完整文件（每块 {chunksize} 行）...")
+        scan = self._scan_electricity_data(file_path, date_column, chunksize, sample_size)
+        numeric_columns = scan['numeric_columns']
+        print(f"数据形状: ({scan['num_rows']}, {len(numeric_columns)})")
+        print(f"\n数值列: {numeric_columns}")
         
         if len(numeric_columns) > 0:
             print(f"\n数值特征统计:")
-            print(df[numeric_columns].describe())
-            
-            # 处理数据
-            processed_df = self._process_electricity_data(df)
+            print(scan['stats'].describe())
             
-            # 保存处理后的数据
+            # 第二遍：处理数据并增量写出
             output_path = os.path.join(self.processed_dir, 'electricity_processed.csv')
-            processed_df.to_csv(output_path)
-            print(f"\n处理后的用电量数据已保存到: {output_path}")
-            
-            # 生成小样本用于演示
-            demo_df = processed_df.head(10000)  # 取前10000行
             demo_path = os.path.join(self.processed_dir, 'electricity_demo.csv')
-            demo_df.to_csv(demo_path)
+            processed_info, demo_df = self._process_electricity_data(
+                file_path, scan, output_path, demo_path, chunksize, sample_size
+            )
+            print(f"\n处理后的用电量数据已保存到: {output_path}")
             print(f"演示用用电量数据已保存到: {demo_path}")
             
-            return processed_df, demo_df
+            return processed_info, demo_df
         else:
             print("未发现数值列，请检查数据格式")
             return None, None
     
+    def _read_electricity_chunks(self, file_path, date_column, chunksize, nrows=None):
+        """按块读取用电量数据，设置时间索引"""
+        for chunk in pd.read_csv(file_path, chunksize=chunksize, nrows=nrows):
+            if date_column:
+                chunk[date_column] = pd.to_datetime(chunk[date_column], errors='coerce')
+                chunk = chunk.set_index(date_column)
+            yield chunk
+    
+    def _scan_electricity_data(self, file_path, date_column, chunksize, nrows=None):
+        """第一遍扫描：所有列一起向量化流式统计、近似分位数和首个有效值"""
+        numeric_cols = None
+        stats = None
+        first_valid = None
+        num_rows = 0
+        
+        for chunk in self._read_electricity_chunks(file_path, date_column, chunksize, nrows):
+            if numeric_cols is None:
+                # 选择数值特征，列太多时保留前20个
+                numeric_cols = chunk.select_dtypes(include=[np.number]).columns.tolist()[:20]
+                stats = StreamingFrameStats(numeric_cols)
+                first_valid = pd.Series(np.nan, index=numeric_cols)
+            
+            values = chunk[numeric_cols].apply(pd.to_numeric, errors='coerce')
+            stats.update(values.to_numpy(dtype=np.float64))
+            
+            # 记录尚未出现有效值的列的首个有效值
+            if first_valid.isna().any():
+                first_valid = first_valid.fillna(values.bfill().iloc[0])
+            
+            num_rows += len(chunk)
+        
+        numeric_cols = numeric_cols or []
+        
+        # 基于近似分位数的IQR边界，一次计算所有列
+        if numeric_cols:
+            Q1, Q3 = stats.quantile([0.25, 0.75])
+            IQR = Q3 - Q1
+            bounds = pd.DataFrame({'lower': Q1 - 1.5 * IQR, 'upper': Q3 + 1.5 * IQR}, index=numeric_cols)
+        else:
+            bounds = pd.DataFrame(columns=['lower', 'upper'])
+        
+        return {
+            'numeric_columns': numeric_cols,
+            'stats': stats,
+            'first_valid': first_valid,
+            'bounds': bounds,
+            'num_rows': num_rows,
+            'date_column': date_column
+        }
+    
     def _process_weather_data(self, df):
         """处理天气数据"""
         print("\n处理天气数据...")
@@ -146,60 +203,113 @@ class TimeSeriesDataProcessor:
         df_processed = df[numeric_cols].copy()
         
         # 处理缺失值
-        df_processed = df_processed.fillna(method='forward').fillna(method='backward')
+        df_processed = df_processed.ffill().bfill()
         
-        # 异常值处理（使用IQR方法）
-        for col in numeric_cols:
-            Q1 = df_processed[col].quantile(0.25)
-            Q3 = df_processed[col].quantile(0.75)
-            IQR = Q3 - Q1
-            lower_bound = Q1 - 1.5 * IQR
-            upper_bound = Q3 + 1.5 * IQR
-            
-            # 将异常值替换为边界值
-            df_processed[col] = df_processed[col].clip(lower_bound, upper_bound)
+        # 异常值处理（使用IQR方法）：一次计算所有列的分位数
+        quartiles = df_processed.quantile([0.25, 0.75])
+        Q1, Q3 = quartiles.loc[0.25], quartiles.loc[0.75]
+        IQR = Q3 - Q1
+        
+        # 将异常值替换为边界值，按列广播
+        df_processed = df_processed.clip(Q1 - 1.5 * IQR, Q3 + 1.5 * IQR, axis=1)
         
         print(f"处理完成，保留 {len(numeric_cols)} 个特征: {numeric_cols}")
         return df_processed
     
-    def _process_electricity_data(self, df):
-        """处理用电量数据"""
-        print("\n处理用电量数据...")
+    def _process_electricity_data(self, file_path, scan, output_path, demo_path,
+                                  chunksize=100000, nrows=None, demo_rows=10000):
+        """处理用电量数据（第二遍，按块处理并增量写出）
         
-        # 选择数值特征
-        numeric_cols = df.select_dtypes(include=[np.number]).columns.tolist()
-        
-        # 如果列太多，选择前20个
-        if len(numeric_cols) > 20:
-            numeric_cols = numeric_cols[:20]
+        前向填充通过上一块的最后一行跨块延续；前向填充后剩余的缺失只可能
+        出现在文件开头，用各列首个有效值填充即等价于后向填充。
+        """
+        print("\n处理用电量数据...")
         
-        df_processed = df[numeric_cols].copy()
+        numeric_cols = scan['numeric_columns']
+        first_valid = scan['first_valid']
+        lower, upper = scan['bounds']['lower'], scan['bounds']['upper']
         
-        # 处理缺失值
-        df_processed = df_processed.fillna(method='forward').fillna(method='backward')
+        carry = None
+        demo_parts = []
+        demo_count = 0
+        num_rows = 0
         
-        # 异常值处理
-        for col in numeric_cols:
-            Q1 = df_processed[col].quantile(0.25)
-            Q3 = df_processed[col].quantile(0.75)
-            IQR = Q3 - Q1
-            lower_bound = Q1 - 1.5 * IQR
-            upper_bound = Q3 + 1.5 * IQR
+        for i, chunk in enumerate(self._read_electricity_chunks(file_path, scan['date_column'], chunksize, nrows)):
+            df_processed = chunk[numeric_cols].apply(pd.to_numeric, errors='coerce')
             
-            df_processed[col] = df_processed[col].clip(lower_bound, upper_bound)
+            # 处理缺失值：带上上一块的最后一行进行前向填充
+            if carry is not None:
+                df_processed = pd.concat([carry, df_processed]).ffill().iloc[1:]
+            else:
+                df_processed = df_processed.ffill()
+            df_processed = df_processed.fillna(first_valid)
+            carry = df_processed.iloc[[-1]]
+            
+            # 异常值处理
+            df_processed = df_processed.clip(lower, upper, axis=1)
+            
+            df_processed.to_csv(output_path, mode='w' if i == 0 else 'a', header=(i == 0))
+            num_rows += len(df_processed)
+            
+            # 取前 demo_rows 行作为演示数据
+            if demo_count < demo_rows:
+                part = df_processed.head(demo_rows - demo_count)
+                demo_parts.append(part)
+                demo_count += len(part)
+        
+        demo_df = pd.concat(demo_parts) if demo_parts else pd.DataFrame(columns=numeric_cols)
+        demo_df.to_csv(demo_path)
         
         print(f"处理完成，保留 {len(numeric_cols)} 个特征: {numeric_cols}")
-        return df_processed
+        
+        processed_info = {
+            'output_path': output_path,
+            'columns': numeric_cols,
+            'num_rows': num_rows,
+            'index_column': scan['date_column']
+        }
+        return processed_info, demo_df
     
-    def create_training_datasets(self):
-        """创建训练数据集"""
+    def create_training_datasets(self, max_workers=None):
+        """创建训练数据集
+
+        天气数据和用电量数据的处理互不依赖，放到进程池中并行执行；
+        max_workers 为1时在当前进程中依次执行。
+        """
         print("=" * 60)
         print("创建训练数据集...")
         print("=" * 60)
         
-        datasets_info = []
+        jobs = ['weather', 'electricity']
+        
+        if max_workers == 1:
+            results = [_run_dataset_job(self.data_dir, name) for name in jobs]
+        else:
+            with ProcessPoolExecutor(max_workers=max_workers or len(jobs)) as executor:
+                futures = [executor.submit(_run_dataset_job, self.data_dir, name) for name in jobs]
+                results = [future.result() for future in futures]
+        
+        # 按固定顺序汇总结果，保持输出稳定
+        datasets_info = [info for info in results if info is not None]
+        
+        # 保存数据集信息
+        import json
+        info_path = os.path.join(self.processed_dir, 'datasets_info.json')
+        with open(info_path, 'w', encoding='utf-8') as f:
+            json.dump(datasets_info, f, ensure_ascii=False, indent=2)
+        
+        print(f"\n数据集信息已保存到: {info_path}")
+        print("\n可用的训练数据集:")
+        for info in datasets_info:
+            print(f"  - {info['name']}: {info['description']}")
+            print(f"    目标列: {info['target_column']}")
+            print(f"    样本数: {info['samples']}")
+            print(f"    特征数: {info['features']}")
         
-        # 处理天气数据
+        return datasets_info
+    
+    def _create_weather_dataset(self):
+        """处理天气数据并创建温度预测数据集"""
         try:
             weather_df, weather_demo = self.analyze_weather_data()
             
@@ -216,53 +326,44 @@ class TimeSeriesDataProcessor:
             
             # 创建训练数据集
             weather_train = self._create_univariate_dataset(weather_df, temp_col, 'weather_temperature')
-            datasets_info.append({
+            return {
                 'name': 'weather_temperature',
                 'description': f'天气数据-{temp_col}预测',
                 'target_column': temp_col,
                 'samples': len(weather_train),
                 'features': weather_df.shape[1]
-            })
+            }
             
         except Exception as e:
             print(f"处理天气数据时出错: {e}")
-        
-        # 处理用电量数据
+            return None
+    
+    def _create_electricity_dataset(self):
+        """处理用电量数据并创建用电量预测数据集"""
         try:
-            elec_df, elec_demo = self.analyze_electricity_data()
+            elec_info, elec_demo = self.analyze_electricity_data()
+            
+            if elec_info is None:
+                return None
+            
+            # 选择第一个数值列作为预测目标
+            target_col = elec_info['columns'][0]
+            
+            # 从处理后的文件分块创建训练数据集
+            elec_samples = self._create_univariate_dataset_from_csv(
+                elec_info['output_path'], target_col, 'electricity_consumption'
+            )
+            return {
+                'name': 'electricity_consumption',
+                'description': f'用电量数据-{target_col}预测',
+                'target_column': target_col,
+                'samples': elec_samples,
+                'features': len(elec_info['columns'])
+            }
             
-            if elec_df is not None:
-                # 选择第一个数值列作为预测目标
-                target_col = elec_df.columns[0]
-                
-                # 创建训练数据集
-                elec_train = self._create_univariate_dataset(elec_df, target_col, 'electricity_consumption')
-                datasets_info.append({
-                    'name': 'electricity_consumption',
-                    'description': f'用电量数据-{target_col}预测',
-                    'target_column': target_col,
-                    'samples': len(elec_train),
-                    'features': elec_df.shape[1]
-                })
-                
         except Exception as e:
             print(f"处理用电量数据时出错: {e}")
-        
-        # 保存数据集信息
-        import json
-        info_path = os.path.join(self.processed_dir, 'datasets_info.json')
-        with open(info_path, 'w', encoding='utf-8') as f:
-            json.dump(datasets_info, f, ensure_ascii=False, indent=2)
-        
-        print(f"\n数据集信息已保存到: {info_path}")
-        print("\n可用的训练数据集:")
-        for info in datasets_info:
-            print(f"  - {info['name']}: {info['description']}")
-            print(f"    目标列: {info['target_column']}")
-            print(f"    样本数: {info['samples']}")
-            print(f"    特征数: {info['features']}")
-        
-        return datasets_info
+            return None
     
     def _create_univariate_dataset(self, df, target_col, dataset_name):
         """创建单变量时间序列数据集"""
@@ -286,6 +387,23 @@ class TimeSeriesDataProcessor:
         
         return dataset
     
+    def _create_univariate_dataset_from_csv(self, csv_path, target_col, dataset_name, chunksize=100000):
+        """从处理后的CSV分块创建单变量时间序列数据集，返回样本数"""
+        output_path = os.path.join(self.processed_dir, f'{dataset_name}.csv')
+        num_rows = 0
+        
+        for i, chunk in enumerate(pd.read_csv(csv_path, index_col=0, chunksize=chunksize)):
+            dataset = pd.DataFrame({
+                'timestamp': chunk.index,
+                'value': chunk[target_col].values
+            })
+            dataset.to_csv(output_path, mode='w' if i == 0 else 'a', header=(i == 0), index=False)
+            num_rows += len(dataset)
+        
+        print(f"训练数据集已保存: {output_path}")
+        
+        return num_rows
+    
     def generate_visualization_report(self):
         """生成数据可视化报告"""
         print("=" * 60)
@@ -350,6 +468,13 @@ class TimeSeriesDataProcessor:
         
         print(f"数据分析报告已保存: {report_path}")
 
+def _run_dataset_job(data_dir, name):
+    """进程池任务：在子进程中处理单个数据集（模块级函数以便序列化）"""
+    processor = TimeSeriesDataProcessor(data_dir)
+    if name == 'weather':
+        return processor._create_weather_dataset()
+    return processor._create_electricity_dataset()
+
 def main():
     """主函数"""
     print("TimeVis 数据处理工具")
@@ -11,12 +11,17 @@ import torch
 import torch.nn as nn
 from sklearn.preprocessing import MinMaxScaler
 from sklearn.model_selection import train_test_split
-from sklearn.metrics import mean_squared_error, mean_absolute_error, r2_score
 import matplotlib.pyplot as plt
 from datetime import datetime
+import sys
 import warnings
 warnings.filterwarnings('ignore')
 
+# 添加后端路径，复用流式评估指标
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backend'))
+
+from utils.metrics import StreamingMetrics
+
 class ModelFineTuner:
     def __init__(self, data_dir='data/processed'):
         self.data_dir = data_dir
@@ -230,12 +235,10 @@ class ModelFineTuner:
         y_test_actual = scaler.inverse_transform(y_test.cpu().numpy().reshape(-1, 1))
         
         # 计算指标
-        train_mse = mean_squared_error(y_train_actual, train_pred)
-        test_mse = mean_squared_error(y_test_actual, test_pred)
-        train_mae = mean_absolute_error(y_train_actual, train_pred)
-        test_mae = mean_absolute_error(y_test_actual, test_pred)
-        train_r2 = r2_score(y_train_actual, train_pred)
-        test_r2 = r2_score(y_test_actual, test_pred)
+        train_metrics = StreamingMetrics().update(train_pred, y_train_actual).compute()
+        test_metrics = StreamingMetrics().update(test_pred, y_test_actual).compute()
+        train_mse, train_mae, train_r2 = train_metrics['mse'], train_metrics['mae'], train_metrics['r2']
+        test_mse, test_mae, test_r2 = test_metrics['mse'], test_metrics['mae'], test_metrics['r2']
         
         # 打印结果
         print(f"\\n训练结果:")
@@ -482,12 +485,10 @@ class ModelFineTuner:
         y_test_actual = scaler.inverse_transform(y_test.cpu().numpy().reshape(-1, 1))
         
         # 计算指标
-        train_mse = mean_squared_error(y_train_actual, train_pred)
-        test_mse = mean_squared_error(y_test_actual, test_pred)
-        train_mae = mean_absolute_error(y_train_actual, train_pred)
-        test_mae = mean_absolute_error(y_test_actual, test_pred)
-        train_r2 = r2_score(y_train_actual, train_pred)
-        test_r2 = r2_score(y_test_actual, test_pred)
+        train_metrics = StreamingMetrics().update(train_pred, y_train_actual).compute()
+        test_metrics = StreamingMetrics().update(test_pred, y_test_actual).compute()
+        train_mse, train_mae, train_r2 = train_metrics['mse'], train_metrics['mae'], train_metrics['r2']
+        test_mse, test_mae, test_r2 = test_metrics['mse'], test_metrics['mae'], test_metrics['r2']
         
         print(f"\\n训练结果:")
         print(f"训练集 - MSE: {train_mse:.6f}, MAE: {train_mae:.6f}, R²: {train_r2:.4f}")
@@ -0,0 +1,450 @@
+"""
+数值工具测试
+与朴素的逐个循环实现逐项对比滑动窗口、流式指标、数值语法和序列编码的结果，
+不依赖Flask、Celery和模型权重；可以直接运行，也可以用 pytest 执行
+"""
+
+import os
+import sys
+import numpy as np
+
+# 添加后端路径
+sys.path.append(os.path.join(os.path.dirname(__file__), 'backend'))
+
+from utils.sliding_window import SlidingWindowView
+from utils.metrics import StreamingMetrics
+
+def test_sliding_window():
+    """测试滑动窗口的跨步和偏移与逐个切片一致"""
+    print("开始测试滑动窗口...")
+
+    series = np.arange(50, dtype=np.float64) * 1.5
+    for sequence_length, horizon in [(1, 1), (7, 1), (7, 3), (49, 1), (50, 1)]:
+        windows = SlidingWindowView(series, sequence_length, horizon)
+        expected = len(series) - sequence_length - horizon + 1
+        assert len(windows) == max(0, expected)
+
+        for i in range(len(windows)):
+            np.testing.assert_array_equal(windows.X[i], series[i:i + sequence_length])
+            target = series[i + sequence_length:i + sequence_length + horizon]
+            np.testing.assert_array_equal(windows.y[i], target[0] if horizon == 1 else target)
+        assert windows.X.shape == (len(windows), sequence_length)
+
+    # 子集仍按原序列的下标取窗口，超出序列的范围被截断
+    windows = SlidingWindowView(series, 5)
+    subset = windows.subset(10, 20)
+    assert len(subset) == 10
+    np.testing.assert_array_equal(subset.X[0], series[10:15])
+    np.testing.assert_array_equal(subset.y, series[15:25])
+    nested = subset.subset(3, 7)
+    assert (nested.start, nested.stop) == (13, 17)
+    np.testing.assert_array_equal(nested.X, windows.X[13:17])
+    assert len(windows.subset(30, 10)) == 0
+    assert windows.subset(40, 100).stop == len(series) - 5
+
+    # 批次拼接后与全部窗口相同；打乱时是同一组窗口的排列
+    batches = list(windows.iter_batches(batch_size=8))
+    np.testing.assert_array_equal(np.concatenate([x for x, _ in batches]), windows.X)
+    np.testing.assert_array_equal(np.concatenate([y for _, y in batches]), windows.y)
+    shuffled = np.concatenate([y for _, y in windows.iter_batches(batch_size=8, shuffle=True, seed=0)])
+    np.testing.assert_array_equal(np.sort(shuffled), windows.y)
+
+    print("✅ 滑动窗口测试通过")
+    return True
+
+def test_streaming_metrics():
+    """测试分批累加和合并的流式指标与 sklearn 一次性计算的结果一致"""
+    print("\n开始测试流式指标...")
+    from sklearn.metrics import mean_absolute_error, mean_squared_error, r2_score
+
+    rng = np.random.default_rng(0)
+    # 均值远大于方差，检验 Chan 合并公式没有数值抵消
+    actuals = 1e6 + rng.normal(size=1000)
+    actuals[::97] = 0.0
+    predictions = actuals + rng.normal(scale=0.5, size=1000)
+
+    # 不等长的批次，其中包含空批次
+    bounds = [0, 1, 1, 250, 251, 700, 1000]
+    metrics = StreamingMetrics()
+    for begin, end in zip(bounds[:-1], bounds[1:]):
+        metrics.update(predictions[begin:end], actuals[begin:end])
+
+    # 两个分片分别累加后合并
+    left = StreamingMetrics().update(predictions[:333], actuals[:333])
+    right = StreamingMetrics().update(predictions[333:], actuals[333:])
+    merged = left.merge(right)
+
+    nonzero = actuals != 0
+    expected = {
+        'mse': mean_squared_error(actuals, predictions),
+        'mae': mean_absolute_error(actuals, predictions),
+        'rmse': np.sqrt(mean_squared_error(actuals, predictions)),
+        'mape': 100 * np.mean(np.abs(predictions - actuals)[nonzero] / np.abs(actuals[nonzero])),
+        'smape': 100 * np.mean(2 * np.abs(predictions - actuals) / (np.abs(predictions) + np.abs(actuals))),
+        'r2': r2_score(actuals, predictions),
+        'bias': np.mean(predictions - actuals)
+    }
+    for result in (metrics.compute(), merged.compute()):
+        assert result['count'] == len(actuals)
+        for key, value in expected.items():
+            assert np.isclose(result[key], value, rtol=1e-9, atol=1e-12), (key, result[key], value)
+
+    # torch 张量批次与 numpy 批次的结果相同
+    import torch
+    tensors = StreamingMetrics()
+    for begin, end in zip(bounds[:-1], bounds[1:]):
+        tensors.update(torch.from_numpy(predictions[begin:end]), torch.from_numpy(actuals[begin:end]))
+    for key, value in metrics.compute().items():
+        assert np.isclose(tensors.compute()[key], value, rtol=1e-9), key
+
+    # 无法定义的指标为 None
+    empty = StreamingMetrics().compute()
+    assert empty['count'] == 0 and empty['mse'] is None
+    constant = StreamingMetrics().update([0.0, 0.0], [0.0, 0.0]).compute()
+    assert constant['mape'] is None and constant['r2'] is None and constant['smape'] == 0.0
+
+    print("✅ 流式指标测试通过")
+    return True
+
+def test_number_grammar():
+    """测试数值语法的前缀、完整和位数已满三种状态与逐个枚举的结果一致"""
+    print("\n开始测试数值语法...")
+    import itertools
+    import re
+    from models.numeric_decoding import NumberGrammar
+
+    grammar = NumberGrammar(max_integer_digits=3, max_decimals=2)
+    complete = re.compile(r'-?\d{1,3}(\.\d{1,2})?')
+    # 枚举短字符串，“是前缀”等价于补上若干字符后能成为合法数值
+    candidates = [''.join(chars) for length in range(6) for chars in itertools.product('01-.', repeat=length)]
+    candidates += ['123', '1234', '12.3', '12.34', '12.345', '-1.05', '007']
+    tails = [''.join(chars) for length in range(4) for chars in itertools.product('0.', repeat=length)]
+    for core in candidates:
+        expected_prefix = any(complete.fullmatch(core + tail) for tail in tails)
+        assert grammar.is_prefix(core) == expected_prefix, core
+        assert grammar.is_complete(core) == bool(complete.fullmatch(core)), core
+
+    assert grammar.is_exhausted('12.34') and grammar.is_exhausted('-1.05')
+    assert not grammar.is_exhausted('123') and not grammar.is_exhausted('12.3')
+    assert grammar.max_new_tokens() == 2 * (1 + 3 + 1 + 2) + 1
+
+    integers = NumberGrammar(max_integer_digits=3, max_decimals=0, allow_spaces=False)
+    assert integers.is_prefix('-12') and not integers.is_prefix('1.') and not integers.is_prefix('1234')
+    assert integers.is_exhausted('123') and not integers.is_exhausted('12')
+    assert integers.max_new_tokens() == 1 + 3 + 1
+
+    # 严格解析：按位分解的格式去掉空格，末尾多余的小数点可以接受，其他格式抛出 ValueError
+    assert grammar.parse('1 2 . 3 4') == 12.34 and grammar.parse('- 5') == -5.0 and grammar.parse('7.') == 7.0
+    assert integers.parse(' 42 ') == 42.0
+    for text in ['', '-', '1 2 , 3', 'abc', '1..2', '1234', '1.234']:
+        try:
+            grammar.parse(text)
+        except ValueError:
+            continue
+        raise AssertionError(f"应拒绝: {text!r}")
+
+    print("✅ 数值语法测试通过")
+    return True
+
+def test_series_encoding():
+    """测试向量化序列编码与逐个窗口、逐个数值的朴素实现一致"""
+    print("\n开始测试序列编码...")
+    from models.series_encoding import ENCODINGS, PAAEncoding, SeriesEncoding, get_encoding
+
+    # 基类只定义接口，不能直接实例化
+    try:
+        SeriesEncoding()
+    except TypeError:
+        pass
+    else:
+        raise AssertionError("SeriesEncoding 应为抽象类")
+
+    rng = np.random.default_rng(1)
+    series = np.round(rng.normal(scale=50, size=120), 3)
+    series[5] = 0.0
+    series[6] = -0.00004  # 格式化后为 "-0"
+
+    # 逐点格式化与 Python 字符串格式化一致
+    for precision in (0, 2, 4):
+        expected = [f"{v:.{precision}f}".rstrip('0').rstrip('.') if precision else f"{v:.0f}" for v in series]
+        assert get_encoding({'name': 'digits', 'precision': precision}).format_array(series).tolist() == expected
+    spaced = get_encoding('spaced_digits').format_array(series).tolist()
+    assert spaced == [' '.join(f"{v:.4f}".rstrip('0').rstrip('.')) for v in series]
+
+    # 整条序列切片编码与逐个窗口编码一致（含上下文点数被缩减的情况）
+    length = 17
+    for name in ENCODINGS:
+        encoding = get_encoding(name)
+        for points in (None, 5, 1):
+            for start, stop in [(0, 30), (40, 41), (60, len(series) - length + 1), (10, 10)]:
+                sliced = encoding.encode_series_windows(series, length, start, stop, points)
+                expected = [encoding.encode_context(series[i:i + length], points) for i in range(start, stop)]
+                assert sliced == expected, (name, points, start, stop)
+
+    # PAA 分段均值与 np.array_split 的分段一致
+    paa = PAAEncoding(segments=16, precision=4)
+    for window_length in (16, 17, 31, 50):
+        window = series[:window_length]
+        for points in (16, 5, 1):
+            expected = [segment.mean() for segment in np.array_split(window, points)]
+            np.testing.assert_allclose(paa.reduce_windows(window[None, :], points)[0], expected, rtol=1e-12)
+
+    # 缩放整数：目标与窗口一起编码，解码后误差不超过半个量化步长
+    scaled = get_encoding({'name': 'scaled_int', 'digits': 3})
+    windows = np.lib.stride_tricks.sliding_window_view(series[:-1], length)
+    targets = series[length:]
+    for window, target, text in zip(windows, targets, scaled.encode_targets(targets, windows)):
+        assert text == scaled.encode_target(target, window)
+        step = (window.max() - window.min()) / 1000
+        assert abs(scaled.decode(text, window) - target) <= step / 2 + 1e-9
+
+    print("✅ 序列编码测试通过")
+    return True
+
+def test_datetime_ingest():
+    """测试以 StringDtype 存储的日期文本列被识别为时间列"""
+    print("\n开始测试时间列识别...")
+    import tempfile
+    import pandas as pd
+    from utils.columnar_cache import ColumnarCacheWriter, KIND_DATETIME, KIND_STRING
+    from utils.data_processor import TimeSeriesProcessor
+
+    stamps = ['2024-01-01 00:00', '2024-01-01 01:00', None, '2024-01-01 03:00']
+    for dtype in ('object', 'string'):
+        assert ColumnarCacheWriter.infer_kind(pd.Series(stamps, dtype=dtype)) == KIND_DATETIME, dtype
+        assert ColumnarCacheWriter.infer_kind(pd.Series(['a', 'b'], dtype=dtype)) == KIND_STRING, dtype
+
+    # 整个导入流程：分块读取后画像中带有时间列和时间范围
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'series.csv')
+        frame = pd.DataFrame({
+            'timestamp': pd.date_range('2024-01-01', periods=48, freq='h').strftime('%Y-%m-%d %H:%M'),
+            'value': np.arange(48, dtype=np.float64)
+        })
+        frame.to_csv(path, index=False)
+        profile = TimeSeriesProcessor().ingest(path, chunksize=10)['profile']
+
+    assert profile['datetime_columns'] == ['timestamp']
+    assert profile['time_range'] == {'start': '2024-01-01T00:00:00', 'end': '2024-01-02T23:00:00'}
+
+    print("✅ 时间列识别测试通过")
+    return True
+
+def test_series_time_range():
+    """测试上传、导入到按时间范围查询序列的完整流程"""
+    print("\n开始测试序列时间范围查询...")
+    import io
+    import tempfile
+    import pandas as pd
+
+    frame = pd.DataFrame({
+        'timestamp': pd.date_range('2024-01-01', periods=500, freq='min').strftime('%Y-%m-%d %H:%M:%S'),
+        'value': np.sin(np.arange(500) / 10.0)
+    })
+    times_ms = pd.to_datetime(frame['timestamp']).astype('datetime64[ms]').astype('int64').to_numpy()
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        # 上传目录和日志都写在临时目录下
+        os.chdir(tmp)
+        try:
+            from app import create_app
+            client = create_app('testing').test_client()
+
+            response = client.post('/api/upload', data={
+                'file': (io.BytesIO(frame.to_csv(index=False).encode()), 'series.csv'),
+                'data_type': 'weather'
+            }, content_type='multipart/form-data')
+            assert response.status_code == 200, response.get_json()
+            dataset_id = response.get_json()['dataset_id']
+            url = f'/api/datasets/{dataset_id}/series'
+
+            # ISO 时间与毫秒时间戳两种写法得到相同的行范围
+            for start, end in [('2024-01-01T01:00:00', '2024-01-01T02:30:00'),
+                               (str(times_ms[60]), str(times_ms[150]))]:
+                body = client.get(url, query_string={'start': start, 'end': end}).get_json()
+                assert body['time_column'] == 'timestamp' and body['column'] == 'value'
+                assert body['row_range'] == [60, 151], body['row_range']
+                xs = [x for x, _ in body['points']]
+                assert xs[0] == times_ms[60] and xs[-1] == times_ms[150]
+                assert all(times_ms[60] <= x <= times_ms[150] for x in xs)
+                np.testing.assert_allclose([y for _, y in body['points']], frame['value'][60:151])
+
+            # 降采样后点数不超过上限且仍在时间范围内
+            body = client.get(url, query_string={'start': '2024-01-01T01:00:00', 'max_points': 50}).get_json()
+            assert body['row_range'] == [60, 500] and len(body['points']) <= 50
+            assert all(x >= times_ms[60] for x, _ in body['points'])
+
+            # 范围外为空，非法参数返回 400
+            body = client.get(url, query_string={'start': '2025-01-01'}).get_json()
+            assert body['row_range'] == [500, 500] and body['points'] == []
+            for query in [{'start': 'not-a-time'}, {'start': '2024-01-01T03:00', 'end': '2024-01-01T01:00'},
+                          {'column': 'timestamp'}]:
+                assert client.get(url, query_string=query).status_code == 400, query
+        finally:
+            os.chdir(cwd)
+
+    print("✅ 序列时间范围查询测试通过")
+    return True
+
+def test_lstm_backends():
+    """测试导出计算图的推理后端与 torch 即时执行的单步和多步预测一致"""
+    print("\n开始测试LSTM推理后端...")
+    import tempfile
+    import torch
+    from models.lstm_model import LSTMPredictor
+    from models.lstm_runtime import GraphLSTMPredictor
+    from utils.model_predictor import ModelPredictor
+
+    torch.manual_seed(0)
+    rng = np.random.default_rng(2)
+    series = np.sin(np.arange(400) / 7.0) * 20 + rng.normal(size=400)
+
+    trained = LSTMPredictor(sequence_length=16, hidden_size=8, num_layers=2)
+    trained.fit_scaler(series.reshape(-1, 1))
+    trained.build_model()
+    trained.is_trained = True
+
+    windows = np.lib.stride_tricks.sliding_window_view(series, 16)[::37]
+    with tempfile.TemporaryDirectory() as tmp:
+        config = trained.save_model(tmp)
+        assert set(config['exports']) == {'torchscript', 'onnx'}, config['exports']
+
+        forecasts = {}
+        for backend in ('torch', 'torchscript', 'onnx'):
+            predictor = ModelPredictor(lstm_backend=backend)
+            predictor.load_lstm_model(tmp)
+            model = predictor.lstm_model
+            assert (backend == 'torch') != isinstance(model, GraphLSTMPredictor), backend
+            # batch_size 小于序列数，检验分块递推
+            forecasts[backend] = model.predict_horizon(windows, horizon=12, batch_size=4)
+            np.testing.assert_allclose(model.predict_batch(windows), forecasts[backend][:, 0], rtol=1e-5, atol=1e-5)
+
+    assert forecasts['torch'].shape == (len(windows), 12)
+    for backend in ('torchscript', 'onnx'):
+        np.testing.assert_allclose(forecasts[backend], forecasts['torch'], rtol=1e-4, atol=1e-4, err_msg=backend)
+
+    # 抽象基类不能直接实例化
+    try:
+        GraphLSTMPredictor(tmp)
+    except TypeError:
+        pass
+    else:
+        raise AssertionError("GraphLSTMPredictor 应为抽象类")
+
+    print("✅ LSTM推理后端测试通过")
+    return True
+
+def test_backend_selection():
+    """测试 auto 按量化副本、onnx、torchscript、torch 的顺序选择推理后端"""
+    print("\n开始测试推理后端选择...")
+    import json
+    import tempfile
+    from models.lstm_runtime import ONNX_FILE, TORCHSCRIPT_FILE, QUANTIZED_FILE, resolve_backend
+
+    with tempfile.TemporaryDirectory() as tmp:
+        def write(config=None, files=()):
+            for name in os.listdir(tmp):
+                os.remove(os.path.join(tmp, name))
+            with open(os.path.join(tmp, 'model_config.json'), 'w') as f:
+                json.dump(config or {}, f)
+            for name in files:
+                open(os.path.join(tmp, name), 'wb').close()
+
+        quantized = {'quantized': {'file': QUANTIZED_FILE, 'relative_mse_delta': 0.01}}
+        everything = (QUANTIZED_FILE, ONNX_FILE, TORCHSCRIPT_FILE)
+        cases = [
+            # (配置, 存在的文件, 容差, auto 的选择)
+            (quantized, everything, 0.02, 'quantized'),
+            (quantized, everything, 0.005, 'onnx'),
+            (quantized, everything, None, 'onnx'),
+            (quantized, (ONNX_FILE, TORCHSCRIPT_FILE), 0.02, 'onnx'),
+            (quantized, (QUANTIZED_FILE, TORCHSCRIPT_FILE), 0.005, 'torchscript'),
+            (None, (), 0.02, 'torch'),
+        ]
+        for config, files, tolerance, expected in cases:
+            write(config, files)
+            assert resolve_backend(tmp, 'auto', tolerance) == expected, (files, tolerance)
+
+        # 明确指定的后端不检查容差，文件缺失时回退到 torch
+        write(quantized, (QUANTIZED_FILE, TORCHSCRIPT_FILE))
+        assert resolve_backend(tmp, 'quantized', 0.0) == 'quantized'
+        assert resolve_backend(tmp, 'torchscript', 0.02) == 'torchscript'
+        assert resolve_backend(tmp, 'onnx', 0.02) == 'torch'
+        assert resolve_backend(tmp, 'torch', 0.02) == 'torch'
+        write(None, (ONNX_FILE,))
+        assert resolve_backend(tmp, 'quantized', 0.02) == 'torch'
+        try:
+            resolve_backend(tmp, 'tensorrt')
+        except ValueError:
+            pass
+        else:
+            raise AssertionError("应拒绝不支持的后端")
+
+    print("✅ 推理后端选择测试通过")
+    return True
+
+def test_tuning_validation():
+    """测试超参数搜索接口拒绝不合法的请求，且校验时不导入 torch"""
+    print("\n开始测试超参数搜索参数校验...")
+    import subprocess
+    import tempfile
+
+    # 在新进程中运行：本进程的其他测试已经导入了 torch
+    script = """
+import sys
+from app import create_app
+client = create_app('testing').test_client()
+payloads = [
+    ['not', 'a', 'dict'],
+    {'dataset_id': 1, 'data_type': 'weather', 'tune_config': [1, 2]},
+    {'dataset_id': 1, 'data_type': 'weather', 'tune_config': {'search_space': [32, 64]}},
+    {'dataset_id': 1, 'data_type': 'weather', 'tune_config': {'search_space': {'dropout': [0.1]}}},
+    {'dataset_id': 1, 'data_type': 'weather', 'tune_config': {'search_space': {'hidden_size': []}}},
+    {'dataset_id': 1, 'data_type': 'weather', 'tune_config': {'n_trials': '8'}},
+    {'dataset_id': 1, 'data_type': 'weather', 'tune_config': {'max_workers': 0}},
+]
+for payload in payloads:
+    response = client.post('/api/tune', json=payload)
+    assert response.status_code == 400, (payload, response.status_code, response.get_json())
+response = client.post('/api/tune', json={'dataset_id': 1, 'data_type': 'weather', 'tune_config': {'n_trials': 8}})
+assert response.status_code == 404, response.get_json()
+assert 'torch' not in sys.modules
+"""
+    backend = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backend')
+    with tempfile.TemporaryDirectory() as tmp:
+        result = subprocess.run([sys.executable, '-c', script], cwd=tmp, capture_output=True, text=True,
+                                env={**os.environ, 'PYTHONPATH': backend})
+    assert result.returncode == 0, result.stderr
+
+    print("✅ 超参数搜索参数校验测试通过")
+    return True
+
+def main():
+    """主测试函数"""
+    print("=" * 60)
+    print("TimeVis 数值工具测试")
+    print("=" * 60)
+
+    try:
+        test_sliding_window()
+        test_streaming_metrics()
+        test_number_grammar()
+        test_series_encoding()
+        test_datetime_ingest()
+        test_series_time_range()
+        test_lstm_backends()
+        test_backend_selection()
+        test_tuning_validation()
+
+        print("\n" + "=" * 60)
+        print("✅ 所有测试完成！")
+        print("=" * 60)
+
+    except Exception as e:
+        print(f"\n❌ 测试失败: {e}")
+        import traceback
+        traceback.print_exc()
+
+if __name__ == "__main__":
+    main()